@@ -1,40 +1,21 @@
 """
 Counselor appointment booking API endpoints
 """
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.security import HTTPBearer
-from sqlalchemy.orm import Session
-from sqlalchemy import Column, Integer, String, DateTime, Boolean
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
 from pydantic import BaseModel
-from typing import List, Optional
-from datetime import datetime, timedelta
-from app.db.base import get_db, Base
-from app.core.security import verify_token
+from typing import Optional
+from datetime import date, datetime, time, timedelta
+from app.db.base import get_async_db
+from app.db.models.appointment import Appointment
+from app.core.security import get_current_subject
+from app.core.serialization import list_response
+from app.services.availability import COUNSELORS, availability_index, is_working_slot, local_time
+from app.services.slot_holds import HoldExpired, HoldNotFound, SlotHoldService, SlotUnavailable
 
 router = APIRouter()
-security = HTTPBearer()
-
-# Appointment model
-class Appointment(Base):
-    __tablename__ = "appointments"
-    
-    id = Column(Integer, primary_key=True, index=True)
-    session_id = Column(String, index=True)
-    counselor_id = Column(String, index=True)
-    appointment_time = Column(DateTime)
-    status = Column(String, default="scheduled")  # scheduled, confirmed, cancelled
-    notes = Column(String)
-    created_at = Column(DateTime, default=datetime.utcnow)
-
-class CounselorProfile(Base):
-    __tablename__ = "counselor_profiles"
-    
-    id = Column(Integer, primary_key=True, index=True)
-    counselor_id = Column(String, unique=True, index=True)
-    name = Column(String)
-    specialization = Column(String)
-    bio = Column(String)
-    available = Column(Boolean, default=True)
+slot_holds = SlotHoldService()
 
 # Pydantic models
 class AppointmentRequest(BaseModel):
@@ -42,6 +23,19 @@ class AppointmentRequest(BaseModel):
     preferred_time: datetime
     notes: Optional[str] = None
 
+class HoldRequest(BaseModel):
+    counselor_id: str
+    preferred_time: datetime
+
+class HoldResponse(BaseModel):
+    hold_token: str
+    counselor_id: str
+    appointment_time: datetime
+    expires_at: datetime
+
+class ConfirmRequest(BaseModel):
+    notes: Optional[str] = None
+
 class AppointmentResponse(BaseModel):
     id: int
     counselor_id: str
@@ -57,79 +51,63 @@ class CounselorInfo(BaseModel):
     available: bool
 
 @router.get("/counselors")
-async def get_available_counselors(db: Session = Depends(get_db)):
+async def get_available_counselors():
     """Get list of available counselors"""
-    # Demo data - in production, this would be from database
-    return [
-        {
-            "counselor_id": "counselor_1",
-            "name": "Dr. Sarah Johnson",
-            "specialization": "Anxiety & Depression",
-            "bio": "Licensed clinical psychologist with 10+ years experience",
-            "available": True
-        },
-        {
-            "counselor_id": "counselor_2", 
-            "name": "Dr. Michael Chen",
-            "specialization": "Trauma & PTSD",
-            "bio": "Trauma specialist with expertise in EMDR therapy",
-            "available": True
-        },
-        {
-            "counselor_id": "counselor_3",
-            "name": "Dr. Maria Rodriguez",
-            "specialization": "Family & Relationships",
-            "bio": "Marriage and family therapist specializing in relationship counseling",
-            "available": True
-        }
-    ]
+    return COUNSELORS
+
+@router.get("/availability")
+async def get_earliest_availability(
+    specialization: Optional[str] = None,
+    after: Optional[datetime] = None,
+    limit: int = Query(5, ge=1, le=50),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Earliest free slots across counselors, optionally by specialization
+    
+    ``specialization`` matches one part of a counselor's specialization,
+    e.g. ``anxiety`` for "Anxiety & Depression".
+    """
+    await availability_index.ensure_loaded(db)
+    slots = availability_index.earliest_slots(specialization, after, limit)
+    return {
+        "specialization": specialization,
+        "slots": [
+            {"counselor_id": counselor_id, "slot": slot.isoformat()}
+            for slot, counselor_id in slots
+        ]
+    }
 
 @router.get("/availability/{counselor_id}")
 async def get_counselor_availability(
     counselor_id: str,
-    days_ahead: int = 7
+    days_ahead: int = Query(7, ge=1, le=90),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get available time slots for a counselor"""
-    # Demo availability - in production, this would be from a scheduling system
-    available_slots = []
-    start_date = datetime.now() + timedelta(days=1)
+    if counselor_id not in availability_index.counselors:
+        raise HTTPException(status_code=404, detail="Counselor not found")
+    await availability_index.ensure_loaded(db)
     
-    for day in range(days_ahead):
-        date = start_date + timedelta(days=day)
-        if date.weekday() < 5:  # Monday to Friday
-            for hour in [9, 10, 11, 14, 15, 16]:
-                slot_time = date.replace(hour=hour, minute=0, second=0, microsecond=0)
-                available_slots.append(slot_time.isoformat())
+    # From tomorrow, skipping slots that are already booked
+    start = datetime.combine(date.today() + timedelta(days=1), time.min)
+    available_slots = availability_index.free_slots(counselor_id, start, start + timedelta(days=days_ahead))
     
     return {
         "counselor_id": counselor_id,
-        "available_slots": available_slots
+        "available_slots": [slot.isoformat() for slot in available_slots]
     }
 
-@router.post("/book", response_model=AppointmentResponse)
-async def book_appointment(
-    request: AppointmentRequest,
-    token: str = Depends(security),
-    db: Session = Depends(get_db)
-):
-    """Book an appointment with a counselor"""
-    subject = verify_token(token.credentials)
-    if not subject:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    
-    # In production, verify counselor availability before booking
-    appointment = Appointment(
-        session_id=subject,
-        counselor_id=request.counselor_id,
-        appointment_time=request.preferred_time,
-        notes=request.notes,
-        status="scheduled"
-    )
-    
-    db.add(appointment)
-    db.commit()
-    db.refresh(appointment)
-    
+def bookable_slot(counselor_id: str, preferred_time: datetime) -> datetime:
+    """Validate a requested slot and return it as a naive local time"""
+    if counselor_id not in availability_index.counselors:
+        raise HTTPException(status_code=404, detail="Counselor not found")
+    # Slots are naive local times, like the ones /availability returns
+    start = local_time(preferred_time)
+    if not is_working_slot(start) or start <= datetime.now():
+        raise HTTPException(status_code=400, detail="Not a bookable slot")
+    return start
+
+def appointment_response(appointment: Appointment) -> AppointmentResponse:
     return AppointmentResponse(
         id=appointment.id,
         counselor_id=appointment.counselor_id,
@@ -138,21 +116,109 @@ async def book_appointment(
         notes=appointment.notes
     )
 
+async def confirm_hold(
+    db: AsyncSession,
+    hold_token: str,
+    subject: str,
+    notes: Optional[str]
+) -> Appointment:
+    try:
+        appointment, created = await slot_holds.confirm(db, hold_token, subject, notes)
+    except HoldNotFound:
+        raise HTTPException(status_code=404, detail="Hold not found")
+    except HoldExpired:
+        raise HTTPException(status_code=410, detail="Hold has expired")
+    except SlotUnavailable:
+        availability_index.invalidate()
+        raise HTTPException(status_code=409, detail="Slot is already booked")
+    await db.commit()
+    if created:
+        # A retried confirm is already in the index
+        await availability_index.ensure_loaded(db)
+        availability_index.book(appointment.counselor_id, appointment.id, appointment.appointment_time)
+    return appointment
+
+@router.post("/appointments/hold", response_model=HoldResponse)
+async def hold_slot(
+    request: HoldRequest,
+    subject: str = Depends(get_current_subject),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Hold a slot for a few minutes while the booking is completed"""
+    start = bookable_slot(request.counselor_id, request.preferred_time)
+    try:
+        hold = await slot_holds.claim(db, request.counselor_id, start, subject)
+    except SlotUnavailable:
+        availability_index.invalidate()
+        raise HTTPException(status_code=409, detail="Slot is held or already booked")
+    await db.commit()
+    
+    return HoldResponse(
+        hold_token=hold.hold_token,
+        counselor_id=hold.counselor_id,
+        appointment_time=hold.appointment_time,
+        expires_at=hold.expires_at
+    )
+
+@router.post("/appointments/holds/{hold_token}/confirm", response_model=AppointmentResponse)
+async def confirm_slot_hold(
+    hold_token: str,
+    request: Optional[ConfirmRequest] = None,
+    subject: str = Depends(get_current_subject),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Turn a held slot into an appointment"""
+    notes = request.notes if request else None
+    return appointment_response(await confirm_hold(db, hold_token, subject, notes))
+
+@router.delete("/appointments/holds/{hold_token}")
+async def release_slot_hold(
+    hold_token: str,
+    subject: str = Depends(get_current_subject),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Release a held slot without booking it"""
+    if not await slot_holds.release(db, hold_token, subject):
+        raise HTTPException(status_code=404, detail="Hold not found")
+    await db.commit()
+    return {"status": "released", "hold_token": hold_token}
+
+@router.post("/book", response_model=AppointmentResponse)
+async def book_appointment(
+    request: AppointmentRequest,
+    subject: str = Depends(get_current_subject),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Book an appointment with a counselor"""
+    start = bookable_slot(request.counselor_id, request.preferred_time)
+    # Hold and confirm in one go; the database decides who gets the slot
+    try:
+        hold = await slot_holds.claim(db, request.counselor_id, start, subject)
+    except SlotUnavailable:
+        availability_index.invalidate()
+        raise HTTPException(status_code=409, detail="Slot is already booked")
+    return appointment_response(await confirm_hold(db, hold.hold_token, subject, request.notes))
+
 @router.get("/my-appointments")
 async def get_my_appointments(
-    token: str = Depends(security),
-    db: Session = Depends(get_db)
+    subject: str = Depends(get_current_subject),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get user's scheduled appointments"""
-    subject = verify_token(token.credentials)
-    if not subject:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    
-    appointments = db.query(Appointment).filter(
-        Appointment.session_id == subject
-    ).order_by(Appointment.appointment_time).all()
+    result = await db.execute(
+        select(
+            Appointment.id,
+            Appointment.counselor_id,
+            Appointment.appointment_time,
+            Appointment.status,
+            Appointment.notes
+        ).filter(
+            Appointment.session_id == subject
+        ).order_by(Appointment.appointment_time)
+    )
+    appointments = result.all()
     
-    return [
+    return list_response([
         {
             "id": apt.id,
             "counselor_id": apt.counselor_id,
@@ -161,28 +227,30 @@ async def get_my_appointments(
             "notes": apt.notes
         }
         for apt in appointments
-    ]
+    ])
 
 @router.patch("/appointments/{appointment_id}/cancel")
 async def cancel_appointment(
     appointment_id: int,
-    token: str = Depends(security),
-    db: Session = Depends(get_db)
+    subject: str = Depends(get_current_subject),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Cancel an appointment"""
-    subject = verify_token(token.credentials)
-    if not subject:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    
-    appointment = db.query(Appointment).filter(
-        Appointment.id == appointment_id,
-        Appointment.session_id == subject
-    ).first()
+    result = await db.execute(
+        select(Appointment).filter(
+            Appointment.id == appointment_id,
+            Appointment.session_id == subject
+        )
+    )
+    appointment = result.scalars().first()
     
     if not appointment:
         raise HTTPException(status_code=404, detail="Appointment not found")
     
-    appointment.status = "cancelled"
-    db.commit()
+    if appointment.status != "cancelled":
+        appointment.status = "cancelled"
+        await slot_holds.release_appointment(db, appointment.id)
+        await db.commit()
+        availability_index.cancel(appointment.counselor_id, appointment.id, appointment.appointment_time)
     
     return {"status": "cancelled", "appointment_id": appointment_id}
\ No newline at end of file
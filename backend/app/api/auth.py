@@ -1,13 +1,11 @@
 """
 Authentication API endpoints - Anonymous JWT tokens
 """
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.security import HTTPBearer
+from fastapi import APIRouter, Depends
 from pydantic import BaseModel
-from app.core.security import create_anonymous_token, verify_token
+from app.core.security import create_anonymous_token, get_current_subject
 
 router = APIRouter()
-security = HTTPBearer()
 
 class TokenResponse(BaseModel):
     access_token: str
@@ -20,12 +18,6 @@ async def create_anonymous_session():
     return {"access_token": token, "token_type": "bearer"}
 
 @router.get("/verify")
-async def verify_session(token: str = Depends(security)):
+async def verify_session(subject: str = Depends(get_current_subject)):
     """Verify the current session token"""
-    subject = verify_token(token.credentials)
-    if not subject:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token"
-        )
     return {"subject": subject, "valid": True}
\ No newline at end of file
@@ -1,18 +1,28 @@
 """
 Chat API endpoints - AI chatbot and peer support
 """
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.security import HTTPBearer
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Query, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
-from typing import List
-from app.db.base import get_db
+from typing import List, Optional
+from app.db.base import get_async_db
 from app.db.models.chat import ChatMessage, PeerChat
+from app.db.write_behind import chat_write_behind
 from app.services.chatbot import ChatbotService
-from app.core.security import verify_token
+from app.services.crisis_matcher import crisis_matcher
+from app.services.escalation_queue import escalation_queue
+from app.services.peer_chat import PeerChatService
+from app.services.risk_escalation import RiskEscalationService
+from app.services.risk_state import risk_states
+from app.services.screening_scores import screening_scores
+from app.services.sentiment import sentiment_scorer
+from app.core.security import get_current_subject
+from app.core.pagination import keyset_before, paginate
+from app.core.serialization import list_response
 
 router = APIRouter()
-security = HTTPBearer()
+risk_service = RiskEscalationService()
 
 class ChatRequest(BaseModel):
     message: str
@@ -29,50 +39,84 @@ class PeerMessage(BaseModel):
 @router.post("/ai", response_model=ChatResponse)
 async def chat_with_ai(
     request: ChatRequest,
-    token: str = Depends(security),
-    db: Session = Depends(get_db)
+    subject: str = Depends(get_current_subject),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Chat with AI mental health assistant"""
-    subject = verify_token(token.credentials)
-    if not subject:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    
     # Get AI response (stub for now)
     chatbot = ChatbotService()
-    response, risk_detected = chatbot.get_response(request.message)
+    matches = crisis_matcher.scan(request.message)
+    category = await chatbot.classify(request.message, matches)
+    response, risk_detected = chatbot.compose_response(category)
+    
+    # Queue follow-up before answering so an escalation is never lost
+    risk_level = risk_service.assess_risk_level(
+        request.message,
+        await screening_scores.get(subject),
+        matches=matches,
+        chat_category=category
+    )
+    risk_state = await risk_states.get(subject)
+    escalated = await escalation_queue.escalate(
+        subject,
+        request.message,
+        risk_level,
+        risk_service.should_escalate(risk_level, risk_state.session_data())
+    )
+    risk_state.record(risk_level)
     
     # Save to database
     chat_record = ChatMessage(
         session_id=subject,
         message=request.message,
         response=response,
+        sentiment=sentiment_scorer.label(request.message),
         risk_detected=risk_detected,
-        escalated=False  # Will implement escalation logic
+        escalated=escalated
     )
-    db.add(chat_record)
-    db.commit()
+    if chat_write_behind.running:
+        # Risk-flagged turns must be on disk before we answer
+        await chat_write_behind.enqueue(chat_record, durable=risk_detected)
+    else:
+        db.add(chat_record)
+        await db.commit()
     
     return ChatResponse(
         response=response,
         risk_detected=risk_detected,
-        escalated=False
+        escalated=escalated
     )
 
 @router.get("/history")
 async def get_chat_history(
-    token: str = Depends(security),
-    db: Session = Depends(get_db)
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    subject: str = Depends(get_current_subject),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get user's chat history"""
-    subject = verify_token(token.credentials)
-    if not subject:
-        raise HTTPException(status_code=401, detail="Invalid token")
+    """Get user's chat history, newest first
     
-    messages = db.query(ChatMessage).filter(
-        ChatMessage.session_id == subject
-    ).order_by(ChatMessage.created_at.desc()).limit(50).all()
+    Pass the ``X-Next-Cursor`` response header back as ``cursor`` for the
+    next page.
+    """
+    # Plain column rows: no ORM identity map for a read-only page
+    query = select(
+        ChatMessage.id,
+        ChatMessage.message,
+        ChatMessage.response,
+        ChatMessage.created_at,
+        ChatMessage.risk_detected
+    ).filter(ChatMessage.session_id == subject)
+    after_cursor = keyset_before(ChatMessage.created_at, ChatMessage.id, cursor)
+    if after_cursor is not None:
+        query = query.filter(after_cursor)
+    result = await db.execute(
+        query.order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc()).limit(limit + 1)
+    )
+    messages = paginate(result.all(), limit, "created_at", response)
     
-    return [
+    return list_response([
         {
             "message": msg.message,
             "response": msg.response,
@@ -80,52 +124,71 @@ async def get_chat_history(
             "risk_detected": msg.risk_detected
         }
         for msg in messages
-    ]
+    ], response)
 
 @router.post("/peer")
 async def send_peer_message(
     request: PeerMessage,
-    token: str = Depends(security),
-    db: Session = Depends(get_db)
+    subject: str = Depends(get_current_subject),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Send message to peer support channel"""
-    subject = verify_token(token.credentials)
-    if not subject:
-        raise HTTPException(status_code=401, detail="Invalid token")
+    """Send message to peer support channel
     
-    # Save peer message
-    peer_msg = PeerChat(
-        room_id=request.room_id,
-        session_id=subject,
-        message=request.message,
-        is_moderated=False  # Implement moderation logic
-    )
-    db.add(peer_msg)
-    db.commit()
+    The message is stored once and pushed to ``/ws/peer/{room_id}``
+    subscribers. A blocked message is answered with ``flagged`` and, if it
+    was escalated, crisis resources.
+    """
+    service = PeerChatService()
+    peer_msg = await service.save(db, request.room_id, subject, request.message)
+    if peer_msg.is_flagged:
+        notice = service.flagged_notice(peer_msg)
+        return {
+            "status": "flagged",
+            "message_id": peer_msg.id,
+            "escalated": notice["escalated"],
+            "resources": notice["resources"]
+        }
+    await service.publish(peer_msg)
     
     return {"status": "sent", "message_id": peer_msg.id}
 
 @router.get("/peer/{room_id}")
 async def get_peer_messages(
     room_id: str,
-    token: str = Depends(security),
-    db: Session = Depends(get_db)
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=200),
+    subject: str = Depends(get_current_subject),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get messages from peer support channel"""
-    subject = verify_token(token.credentials)
-    if not subject:
-        raise HTTPException(status_code=401, detail="Invalid token")
+    """Get messages from peer support channel, newest first
     
-    messages = db.query(PeerChat).filter(
+    Pass the ``X-Next-Cursor`` response header back as ``cursor`` for the
+    next page.
+    """
+    query = select(
+        PeerChat.id,
+        PeerChat.message,
+        PeerChat.created_at,
+        PeerChat.session_id
+    ).filter(
         PeerChat.room_id == room_id,
         PeerChat.is_flagged == False
-    ).order_by(PeerChat.created_at.desc()).limit(100).all()
+    )
+    after_cursor = keyset_before(PeerChat.created_at, PeerChat.id, cursor)
+    if after_cursor is not None:
+        query = query.filter(after_cursor)
+    result = await db.execute(
+        query.order_by(PeerChat.created_at.desc(), PeerChat.id.desc()).limit(limit + 1)
+    )
+    messages = paginate(result.all(), limit, "created_at", response)
     
-    return [
+    return list_response([
         {
+            "id": msg.id,
             "message": msg.message,
             "created_at": msg.created_at,
             "session_id": msg.session_id[:8] + "..."  # Anonymize
         }
         for msg in messages
-    ]
\ No newline at end of file
+    ], response)
\ No newline at end of file
@@ -1,18 +1,26 @@
 """
 Mental health screening API endpoints (PHQ-9, GAD-7, GHQ)
 """
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.security import HTTPBearer
-from sqlalchemy.orm import Session
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
-from typing import List, Dict, Any
-from app.db.base import get_db
+from typing import List, Dict, Any, Optional
+from datetime import date
+from app.db.base import AsyncSessionLocal, get_async_db
 from app.db.models.screening import Screening, ScreeningTemplate
 from app.services.screening_service import ScreeningService
-from app.core.security import verify_token
+from app.services.screening_rollup import ScreeningRollupService
+from app.services.screening_export import ScreeningExportService
+from app.services.screening_analytics import screening_analytics
+from app.services.screening_scores import screening_scores
+from app.core.security import get_current_subject, require_export_api_key
+from app.core.pagination import keyset_before, paginate
+from app.core.serialization import list_response
 
 router = APIRouter()
-security = HTTPBearer()
 
 class ScreeningRequest(BaseModel):
     screening_type: str  # PHQ9, GAD7, GHQ
@@ -77,14 +85,10 @@ async def get_screening_templates():
 @router.post("/submit", response_model=ScreeningResult)
 async def submit_screening(
     request: ScreeningRequest,
-    token: str = Depends(security),
-    db: Session = Depends(get_db)
+    subject: str = Depends(get_current_subject),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Submit a completed screening"""
-    subject = verify_token(token.credentials)
-    if not subject:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    
     # Calculate score and risk level
     service = ScreeningService()
     score, risk_level = service.calculate_score(request.screening_type, request.responses)
@@ -98,8 +102,13 @@ async def submit_screening(
         risk_level=risk_level
     )
     db.add(screening)
-    db.commit()
-    db.refresh(screening)
+    await db.flush()
+    await db.refresh(screening)
+    
+    # Keep insight counters in the same transaction
+    await ScreeningRollupService().record_screening(db, screening)
+    await db.commit()
+    screening_scores.record(subject, screening.screening_type, screening.id, screening.score)
     
     return ScreeningResult(
         id=screening.id,
@@ -111,19 +120,33 @@ async def submit_screening(
 
 @router.get("/history")
 async def get_screening_history(
-    token: str = Depends(security),
-    db: Session = Depends(get_db)
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    subject: str = Depends(get_current_subject),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get user's screening history"""
-    subject = verify_token(token.credentials)
-    if not subject:
-        raise HTTPException(status_code=401, detail="Invalid token")
+    """Get user's screening history, newest first
     
-    screenings = db.query(Screening).filter(
-        Screening.session_id == subject
-    ).order_by(Screening.completed_at.desc()).all()
+    Pass the ``X-Next-Cursor`` response header back as ``cursor`` for the
+    next page.
+    """
+    query = select(
+        Screening.id,
+        Screening.screening_type,
+        Screening.score,
+        Screening.risk_level,
+        Screening.completed_at
+    ).filter(Screening.session_id == subject)
+    after_cursor = keyset_before(Screening.completed_at, Screening.id, cursor)
+    if after_cursor is not None:
+        query = query.filter(after_cursor)
+    result = await db.execute(
+        query.order_by(Screening.completed_at.desc(), Screening.id.desc()).limit(limit + 1)
+    )
+    screenings = paginate(result.all(), limit, "completed_at", response)
     
-    return [
+    return list_response([
         {
             "id": s.id,
             "screening_type": s.screening_type,
@@ -132,31 +155,97 @@ async def get_screening_history(
             "completed_at": s.completed_at.isoformat()
         }
         for s in screenings
-    ]
+    ], response)
 
 @router.get("/insights")
-async def get_anonymized_insights(db: Session = Depends(get_db)):
-    """Get anonymized insights for institutional analysis"""
-    # Basic aggregations - expand for full analytics
-    from sqlalchemy import func
+async def get_anonymized_insights(
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get anonymized insights for institutional analysis
     
-    insights = db.query(
-        Screening.screening_type,
-        Screening.risk_level,
-        func.count(Screening.id).label('count')
-    ).group_by(
-        Screening.screening_type,
-        Screening.risk_level
-    ).all()
+    Served from the per-day rollup table; ``start_date``/``end_date`` are
+    inclusive.
+    """
+    return await ScreeningRollupService().get_insights(db, start_date, end_date)
+
+async def _refreshed_analytics(db: AsyncSession):
+    await screening_analytics.refresh(db)
+    return screening_analytics
+
+@router.get("/insights/quantiles")
+async def get_score_quantiles(
+    screening_type: str = Query(..., pattern="^(PHQ9|GAD7|GHQ)$"),
+    q: List[float] = Query([0.25, 0.5, 0.75, 0.9]),
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Score quantiles and mean for one screening type"""
+    if any(not 0 <= value <= 1 for value in q):
+        raise HTTPException(status_code=400, detail="Quantiles must be between 0 and 1")
+    analytics = await _refreshed_analytics(db)
+    return await asyncio.to_thread(analytics.score_quantiles, screening_type, q, start_date, end_date)
+
+@router.get("/insights/histogram")
+async def get_score_histogram(
+    screening_type: str = Query(..., pattern="^(PHQ9|GAD7|GHQ)$"),
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Number of screenings at each possible score"""
+    analytics = await _refreshed_analytics(db)
+    return await asyncio.to_thread(analytics.score_histogram, screening_type, start_date, end_date)
+
+@router.get("/insights/items")
+async def get_item_distributions(
+    screening_type: str = Query(..., pattern="^(PHQ9|GAD7|GHQ)$"),
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Answer distribution for every question of one screening type"""
+    analytics = await _refreshed_analytics(db)
+    return await asyncio.to_thread(analytics.item_distributions, screening_type, start_date, end_date)
+
+@router.get("/insights/trends")
+async def get_risk_trends(
+    screening_type: str = Query(..., pattern="^(PHQ9|GAD7|GHQ)$"),
+    bucket: str = Query("week", pattern="^(day|week)$"),
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Screening volume and risk level mix per day or week"""
+    analytics = await _refreshed_analytics(db)
+    return await asyncio.to_thread(analytics.risk_trends, screening_type, bucket, start_date, end_date)
+
+@router.get("/export", dependencies=[Depends(require_export_api_key)])
+async def export_screenings(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    screening_type: Optional[str] = None,
+    include_responses: bool = False
+):
+    """Stream anonymized screening rows as NDJSON or CSV
     
-    return {
-        "total_screenings": db.query(Screening).count(),
-        "risk_distribution": [
-            {
-                "screening_type": insight.screening_type,
-                "risk_level": insight.risk_level,
-                "count": insight.count
-            }
-            for insight in insights
-        ]
-    }
\ No newline at end of file
+    Requires the ``X-API-Key`` header. Session ids are replaced by a keyed
+    hash; ``start_date``/``end_date`` are inclusive.
+    """
+    service = ScreeningExportService(format, include_responses)
+    filters = {"start_date": start_date, "end_date": end_date, "screening_type": screening_type}
+    
+    async def body():
+        # Own session: it must outlive the handler while the body streams
+        async with AsyncSessionLocal() as db:
+            async for chunk in service.stream(db, **filters):
+                yield chunk
+    
+    return StreamingResponse(
+        body(),
+        media_type=service.media_type,
+        headers={"Content-Disposition": f'attachment; filename="screenings.{format}"'}
+    )
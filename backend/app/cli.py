@@ -0,0 +1,186 @@
+"""
+Maintenance commands for the Sahara backend
+
+Run from the backend directory:
+    python -m app.cli rebuild-rollups
+    python -m app.cli export-screenings --format csv --output screenings.csv
+    python -m app.cli backfill-sentiment --chunk-size 5000
+    python -m app.cli purge-expired --dry-run
+    python -m app.cli normalize-timestamps
+"""
+import argparse
+import asyncio
+import json
+import sys
+from datetime import date
+
+from app.core.config import settings
+from app.db.base import Base, SessionLocal, engine
+from app.db.models import appointment, chat, escalation, screening, user  # noqa: F401 - register tables
+
+
+def rebuild_rollups(args: argparse.Namespace) -> int:
+    """Backfill screening_rollups from the screenings table"""
+    from app.services.screening_rollup import ScreeningRollupService
+
+    db = SessionLocal()
+    try:
+        buckets = ScreeningRollupService().rebuild(db)
+    finally:
+        db.close()
+    print(f"Rebuilt {buckets} screening rollup buckets")
+    return 0
+
+
+def export_screenings(args: argparse.Namespace) -> int:
+    """Write anonymized screening rows to a file or stdout"""
+    from app.services.screening_export import ScreeningExportService
+
+    service = ScreeningExportService(args.format, args.include_responses, args.batch_size)
+    output = sys.stdout if args.output == "-" else open(args.output, "w", newline="")
+    db = SessionLocal()
+    try:
+        for chunk in service.iter_batches(
+            db,
+            start_date=args.start_date,
+            end_date=args.end_date,
+            screening_type=args.screening_type
+        ):
+            output.write(chunk)
+    finally:
+        db.close()
+        if output is not sys.stdout:
+            output.close()
+    return 0
+
+
+def backfill_sentiment(args: argparse.Namespace) -> int:
+    """Fill chat_messages.sentiment for rows written before it was scored"""
+    from app.services.sentiment import SentimentBackfill
+
+    def report(progress):
+        done = progress.last_id - args.start_id
+        total = max(progress.max_id - args.start_id, 1)
+        print(
+            f"id {progress.last_id}/{progress.max_id} ({100 * done / total:.1f}%): "
+            f"{progress.updated} scored, {progress.rows_per_second:,.0f} rows/s",
+            file=sys.stderr
+        )
+
+    db = SessionLocal()
+    try:
+        result = SentimentBackfill(chunk_size=args.chunk_size).run(
+            db,
+            start_id=args.start_id,
+            end_id=args.end_id,
+            progress=report if not args.quiet else None
+        )
+    finally:
+        db.close()
+    print(
+        f"Scored {result.updated} chat messages up to id {result.last_id} "
+        f"in {result.elapsed:.1f}s ({result.rows_per_second:,.0f} rows/s)"
+    )
+    return 0
+
+
+def purge_expired(args: argparse.Namespace) -> int:
+    """Apply the RETENTION_* policies once and print the report"""
+    from app.services.retention import RetentionService
+
+    service = RetentionService(batch_size=args.batch_size)
+    if not any(policy.days > 0 for policy in service.policies):
+        print("No retention policy is enabled (set RETENTION_*_DAYS)", file=sys.stderr)
+        return 1
+    report = asyncio.run(service.run(dry_run=args.dry_run, tables=args.tables))
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+def enable_incremental_vacuum(args: argparse.Namespace) -> int:
+    """Switch an existing SQLite file to auto_vacuum=INCREMENTAL (rewrites the file)"""
+    if engine.dialect.name != "sqlite":
+        print("Only SQLite databases need this", file=sys.stderr)
+        return 1
+    with engine.connect() as conn:
+        raw = conn.connection.driver_connection
+        raw.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        # The mode only changes once the whole file is rebuilt
+        raw.execute("VACUUM")
+        mode = raw.execute("PRAGMA auto_vacuum").fetchone()[0]
+    print(f"auto_vacuum is now {mode} (2 = incremental)")
+    return 0
+
+
+def normalize_timestamps(args: argparse.Namespace) -> int:
+    """Give CURRENT_TIMESTAMP-era rows the timestamp format history cursors compare against"""
+    from app.core.pagination import normalize_legacy_timestamps
+    from app.db.models.chat import ChatMessage, PeerChat
+    from app.db.models.screening import Screening
+
+    db = SessionLocal()
+    try:
+        for column in (ChatMessage.created_at, PeerChat.created_at, Screening.completed_at):
+            updated = normalize_legacy_timestamps(db, column, column.class_.id, args.batch_size)
+            print(f"{column.class_.__tablename__}.{column.key}: {updated} rows normalized")
+    finally:
+        db.close()
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="Sahara maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rollups = commands.add_parser("rebuild-rollups", help="Recompute /screenings/insights counters from raw screenings")
+    rollups.set_defaults(handler=rebuild_rollups)
+
+    export = commands.add_parser("export-screenings", help="Stream anonymized screenings as NDJSON or CSV")
+    export.add_argument("--format", choices=["ndjson", "csv"], default="ndjson")
+    export.add_argument("--output", default="-", help="File to write, or - for stdout")
+    export.add_argument("--start-date", type=date.fromisoformat, help="Inclusive, YYYY-MM-DD")
+    export.add_argument("--end-date", type=date.fromisoformat, help="Inclusive, YYYY-MM-DD")
+    export.add_argument("--type", dest="screening_type", help="PHQ9, GAD7 or GHQ")
+    export.add_argument("--include-responses", action="store_true", help="Add item responses")
+    export.add_argument("--batch-size", type=int, default=1000, help="Rows fetched per round trip")
+    export.set_defaults(handler=export_screenings)
+
+    sentiment = commands.add_parser("backfill-sentiment", help="Score chat messages that have no sentiment yet")
+    sentiment.add_argument("--chunk-size", type=int, default=5000, help="Ids per range, scored and committed together")
+    sentiment.add_argument("--start-id", type=int, default=0, help="Resume after this id (exclusive)")
+    sentiment.add_argument("--end-id", type=int, help="Stop at this id (inclusive); defaults to the current max")
+    sentiment.add_argument("--quiet", action="store_true", help="No per-range progress lines")
+    sentiment.set_defaults(handler=backfill_sentiment)
+
+    purge = commands.add_parser("purge-expired", help="Delete rows past their retention period")
+    purge.add_argument("--dry-run", action="store_true", help="Only count the rows that would be deleted")
+    purge.add_argument("--table", dest="tables", action="append", help="Limit to this table (repeatable)")
+    purge.add_argument(
+        "--batch-size", type=int, default=settings.RETENTION_BATCH_SIZE, help="Ids per delete transaction"
+    )
+    purge.set_defaults(handler=purge_expired)
+
+    vacuum = commands.add_parser(
+        "enable-incremental-vacuum",
+        help="Let an existing SQLite file give freed pages back (one full VACUUM; locks the database)"
+    )
+    vacuum.set_defaults(handler=enable_incremental_vacuum)
+
+    timestamps = commands.add_parser(
+        "normalize-timestamps",
+        help="Add microseconds to second-resolution history timestamps so cursor pagination terminates"
+    )
+    timestamps.add_argument("--batch-size", type=int, default=10000, help="Ids per update transaction")
+    timestamps.set_defaults(handler=normalize_timestamps)
+
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    Base.metadata.create_all(bind=engine)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -14,9 +14,122 @@ class Settings(BaseSettings):
     SECRET_KEY: str = "your-secret-key-change-in-production"
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    # Decoded-token LRU used by the shared auth dependency (0 disables it)
+    TOKEN_CACHE_SIZE: int = 10000
+    # bcrypt runs in a process pool; calls beyond MAX_PENDING are rejected
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_MAX_PENDING: int = 32
     
     # Database
     DATABASE_URL: str = "sqlite:///./sahara.db"
+    # Derived from DATABASE_URL (aiosqlite / asyncpg) when not set
+    ASYNC_DATABASE_URL: Optional[str] = None
+    
+    # Chat persistence: batch ChatMessage/PeerChat inserts into group commits
+    CHAT_WRITE_BEHIND: bool = False
+    CHAT_WRITE_BEHIND_BATCH_SIZE: int = 100
+    CHAT_WRITE_BEHIND_FLUSH_MS: int = 50
+    CHAT_WRITE_BEHIND_MAX_QUEUE: int = 10000
+    
+    # WebSocket fan-out: per-client outbound queue and slow consumer handling
+    # (drop_oldest, drop_newest or disconnect)
+    WS_CLIENT_QUEUE_SIZE: int = 100
+    WS_SLOW_CONSUMER_POLICY: str = "drop_oldest"
+    WS_SEND_TIMEOUT_SECONDS: float = 10.0
+    # memory:// for one worker; unix:///path/to/socket to share broadcasts
+    # between uvicorn workers on one host
+    WS_BACKPLANE_URL: str = "memory://"
+    # /ws/chat streaming: words per chunk and unanswered messages per socket
+    CHAT_STREAM_CHUNK_WORDS: int = 3
+    CHAT_STREAM_MAX_PENDING: int = 8
+    
+    # List endpoints: render trusted rows straight to JSON bytes (orjson when
+    # installed) instead of walking them with jsonable_encoder
+    FAST_JSON_RESPONSES: bool = False
+    
+    # Screening export: required X-API-Key (the endpoint is off when unset)
+    # and rows fetched per database round trip
+    EXPORT_API_KEY: Optional[str] = None
+    EXPORT_BATCH_SIZE: int = 1000
+    # Columnar screening analytics: reload new rows at most this often
+    ANALYTICS_REFRESH_SECONDS: float = 30.0
+    
+    # Appointment slot holds: how long a claimed slot waits for confirmation,
+    # and how often abandoned holds are purged
+    SLOT_HOLD_TTL_SECONDS: int = 300
+    SLOT_HOLD_PURGE_SECONDS: float = 60.0
+    # Availability index: rebuilt from the database at least this often, so
+    # bookings made by other workers show up (0 never rebuilds)
+    AVAILABILITY_RELOAD_SECONDS: float = 30.0
+    
+    # Risk escalation queue: worker pool size (plus workers that only take
+    # urgent items), lease length before an unacknowledged item is redelivered,
+    # attempts before an item is parked as failed, idle poll interval
+    ESCALATION_WORKERS: int = 4
+    ESCALATION_URGENT_WORKERS: int = 1
+    ESCALATION_VISIBILITY_TIMEOUT_SECONDS: float = 60.0
+    ESCALATION_MAX_ATTEMPTS: int = 5
+    ESCALATION_POLL_SECONDS: float = 1.0
+    # Per-session risk history for should_escalate: window length, ring
+    # buffer size per session and sessions kept in memory (LRU)
+    RISK_STATE_WINDOW_SECONDS: float = 86400.0
+    RISK_STATE_HISTORY: int = 32
+    RISK_STATE_MAX_SESSIONS: int = 10000
+    # Latest screening scores per session for chat risk assessment: sessions
+    # kept (LRU) and how long before an entry is reloaded from the database
+    SCREENING_SCORE_CACHE_SIZE: int = 10000
+    SCREENING_SCORE_TTL_SECONDS: float = 300.0
+    # Peer chat moderation: workers settling queued messages in batches of
+    # up to BATCH_SIZE (waiting at most MAX_WAIT_MS to fill one), queue bound,
+    # how often unmoderated leftovers are swept back into the queue, and the
+    # optional classifier: "none" or "numpy" (MODEL_PATH .npz in the chatbot
+    # model format, with an "unsafe" label) and its flag threshold
+    PEER_MODERATION_WORKERS: int = 2
+    PEER_MODERATION_BATCH_SIZE: int = 64
+    PEER_MODERATION_MAX_WAIT_MS: float = 20.0
+    PEER_MODERATION_MAX_QUEUE: int = 10000
+    PEER_MODERATION_SWEEP_SECONDS: float = 60.0
+    PEER_MODERATION_CLASSIFIER: str = "none"
+    PEER_MODERATION_MODEL_PATH: Optional[str] = None
+    PEER_MODERATION_THRESHOLD: float = 0.8
+    
+    # Data retention: days to keep rows (0 keeps them forever), judged by
+    # chat_messages/peer_chats.created_at, anonymous_users.last_active and
+    # screenings.completed_at. Handled escalations quote the message that
+    # raised them and go with the chat messages. Rows are deleted in id-range
+    # batches of BATCH_SIZE, each its own short write transaction, with a
+    # pause in between; each run then reclaims up to VACUUM_PAGES free pages
+    # (SQLite incremental vacuum)
+    RETENTION_CHAT_MESSAGES_DAYS: int = 0
+    RETENTION_PEER_CHATS_DAYS: int = 0
+    RETENTION_ANONYMOUS_USERS_DAYS: int = 0
+    RETENTION_SCREENINGS_DAYS: int = 0
+    RETENTION_BATCH_SIZE: int = 1000
+    RETENTION_BATCH_PAUSE_MS: float = 10.0
+    RETENTION_INTERVAL_SECONDS: float = 3600.0
+    RETENTION_VACUUM_PAGES: int = 2000
+    
+    # Chatbot inference: "keyword" (matcher only) or "numpy" (CHAT_MODEL_PATH
+    # .npz, or a model built from the keyword lists). Concurrent turns are
+    # batched up to MAX_BATCH or MAX_WAIT_MS; they fall back to keywords when
+    # MAX_QUEUE are waiting or a result takes longer than the timeout
+    CHAT_MODEL_BACKEND: str = "keyword"
+    CHAT_MODEL_PATH: Optional[str] = None
+    CHAT_MODEL_MAX_BATCH: int = 32
+    CHAT_MODEL_MAX_WAIT_MS: float = 5.0
+    CHAT_MODEL_MAX_QUEUE: int = 256
+    CHAT_MODEL_TIMEOUT_SECONDS: float = 0.5
+    # CHAT_MODEL_BACKEND=remote: model server URL (POST {"messages": [...]}
+    # -> {"labels": [...]}), pooled keep-alive connections, per-call timeout
+    # (keep it under CHAT_MODEL_TIMEOUT_SECONDS), a hedged second call once
+    # the first is slower than this latency percentile (0 disables), and the
+    # circuit breaker's failure threshold and cool-down
+    CHAT_MODEL_URL: Optional[str] = None
+    CHAT_MODEL_MAX_CONNECTIONS: int = 20
+    CHAT_MODEL_REQUEST_TIMEOUT_SECONDS: float = 0.4
+    CHAT_MODEL_HEDGE_PERCENTILE: float = 95.0
+    CHAT_MODEL_BREAKER_FAILURES: int = 5
+    CHAT_MODEL_BREAKER_RESET_SECONDS: float = 30.0
     
     # CORS
     BACKEND_CORS_ORIGINS: list = ["http://localhost:3000", "http://127.0.0.1:3000"]
@@ -0,0 +1,82 @@
+"""
+Keyset (cursor) pagination helpers
+
+Cursors are opaque, URL-safe encodings of the ``(timestamp, id)`` of the last
+row on a page. List endpoints return the next cursor in the ``X-Next-Cursor``
+header so response bodies stay plain lists.
+
+On SQLite the cursor is compared as ``'YYYY-MM-DD HH:MM:SS.ffffff'`` text.
+Rows stamped by ``CURRENT_TIMESTAMP`` before the columns got a Python-side
+default have no fraction, sort before their own cursor and would be served
+again on every page; ``normalize_legacy_timestamps`` (``python -m app.cli
+normalize-timestamps``) rewrites them once.
+"""
+import base64
+import binascii
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple
+from fastapi import HTTPException, Response
+from sqlalchemy import String, and_, cast, func, or_, select, update
+from sqlalchemy.orm import Session
+
+# Length of a CURRENT_TIMESTAMP value, 'YYYY-MM-DD HH:MM:SS'
+LEGACY_TIMESTAMP_LENGTH = 19
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(timestamp: datetime, row_id: int) -> str:
+    raw = f"{timestamp.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Decode a cursor, raising 400 if it was not produced by ``encode_cursor``"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, row_id = base64.urlsafe_b64decode(padded).decode().split("|")
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def keyset_before(timestamp_column, id_column, cursor: Optional[str]):
+    """Filter for rows after ``cursor`` in (timestamp DESC, id DESC) order"""
+    if not cursor:
+        return None
+    timestamp, row_id = decode_cursor(cursor)
+    return or_(
+        timestamp_column < timestamp,
+        and_(timestamp_column == timestamp, id_column < row_id)
+    )
+
+def paginate(rows: Sequence[Any], limit: int, timestamp_attr: str, response: Response) -> List[Any]:
+    """Trim a ``limit + 1`` result to one page and set the next-page cursor"""
+    page = list(rows[:limit])
+    if len(rows) > limit:
+        last = page[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(getattr(last, timestamp_attr), last.id)
+    return page
+
+def normalize_legacy_timestamps(db: Session, timestamp_column, id_column, batch_size: int = 10000) -> int:
+    """Append ``.000000`` to second-resolution SQLite timestamps; returns rows changed
+    
+    Walks the table in id ranges of ``batch_size``, one commit each, and
+    can be re-run safely.
+    """
+    if db.get_bind().dialect.name != "sqlite":
+        return 0
+    low, high = db.execute(select(func.min(id_column), func.max(id_column))).one()
+    updated = 0
+    while low is not None and low <= high:
+        result = db.execute(
+            update(timestamp_column.class_)
+            .where(
+                id_column >= low,
+                id_column < low + batch_size,
+                func.length(timestamp_column) == LEGACY_TIMESTAMP_LENGTH
+            )
+            .values({timestamp_column.key: cast(timestamp_column, String) + ".000000"})
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        updated += result.rowcount
+        low += batch_size
+    return updated
@@ -1,13 +1,24 @@
 """
 Security utilities for JWT tokens and password hashing
 """
+import asyncio
+import hashlib
+import hmac
+import multiprocessing
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
-from typing import Any, Union, Optional
+from typing import Any, Dict, Union, Optional, Tuple
+from fastapi import Depends, HTTPException, status
+from fastapi.security import APIKeyHeader, HTTPAuthorizationCredentials, HTTPBearer
 from jose import jwt
 from passlib.context import CryptContext
 from app.core.config import settings
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+bearer_scheme = HTTPBearer()
+api_key_scheme = APIKeyHeader(name="X-API-Key", auto_error=False)
 
 def create_access_token(
     subject: Union[str, Any], expires_delta: timedelta = None
@@ -28,18 +39,221 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
+def _timed_call(fn, *args) -> Tuple[Any, float]:
+    # Runs in a pool worker; reports run time so callers can derive queue wait
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+class PasswordHashingBusy(Exception):
+    """Raised when the hashing pool already has its maximum pending calls"""
+
+class PasswordHasher:
+    """Runs bcrypt in a bounded process pool, off the event loop
+    
+    At most ``max_pending`` calls may be running or queued; further calls
+    fail fast with ``PasswordHashingBusy`` so a login storm cannot pile up
+    unbounded work behind chat traffic.
+    """
+    def __init__(self, max_workers: int = 2, max_pending: int = 32):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.total_run_ms = 0.0
+    
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+    
+    async def _run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise PasswordHashingBusy("Password hashing pool is saturated")
+        
+        self.pending += 1
+        started = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            result, run_seconds = await loop.run_in_executor(
+                self._get_executor(), _timed_call, fn, *args
+            )
+        finally:
+            self.pending -= 1
+        
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        wait_ms = max(elapsed_ms - run_seconds * 1000, 0.0)
+        self.completed += 1
+        self.total_run_ms += run_seconds * 1000
+        self.total_wait_ms += wait_ms
+        self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+        return result
+    
+    async def hash(self, password: str) -> str:
+        return await self._run(get_password_hash, password)
+    
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+    
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "in_flight": min(self.pending, self.max_workers),
+            "queued": max(self.pending - self.max_workers, 0),
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.total_wait_ms / self.completed, 3) if self.completed else 0.0,
+            "max_wait_ms": round(self.max_wait_ms, 3),
+            "avg_run_ms": round(self.total_run_ms / self.completed, 3) if self.completed else 0.0
+        }
+
+password_hasher = PasswordHasher(
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    max_pending=settings.PASSWORD_HASH_MAX_PENDING
+)
+
+async def get_password_hash_async(password: str) -> str:
+    """``get_password_hash`` without blocking the event loop"""
+    return await password_hasher.hash(password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """``verify_password`` without blocking the event loop"""
+    return await password_hasher.verify(plain_password, hashed_password)
+
 def create_anonymous_token() -> str:
     """Create an anonymous JWT token for guest users"""
     import uuid
     anonymous_id = str(uuid.uuid4())
     return create_access_token(subject=f"anon:{anonymous_id}")
 
-def verify_token(token: str) -> Optional[str]:
-    """Verify JWT token and return subject"""
+def decode_token(token: str) -> Optional[Dict[str, Any]]:
+    """Verify JWT signature and expiry and return the payload"""
     try:
-        payload = jwt.decode(
+        return jwt.decode(
             token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
         )
-        return payload.get("sub")
     except jwt.JWTError:
-        return None
\ No newline at end of file
+        return None
+
+def verify_token(token: str) -> Optional[str]:
+    """Verify JWT token and return subject"""
+    payload = decode_token(token)
+    return payload.get("sub") if payload else None
+
+class TokenCache:
+    """Bounded LRU of verified token subjects keyed by token digest
+    
+    Entries are dropped once the token's ``exp`` passes, so a cached subject
+    never outlives the token it was decoded from.
+    """
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self._entries: "OrderedDict[bytes, Tuple[str, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+    
+    @staticmethod
+    def key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+    
+    def get(self, token: str) -> Optional[str]:
+        key = self.key(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        subject, expires_at = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            self.expired += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return subject
+    
+    def put(self, token: str, subject: str, expires_at: float):
+        if self.max_size <= 0:
+            return
+        key = self.key(token)
+        self._entries[key] = (subject, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+    
+    def clear(self):
+        self._entries.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+token_cache = TokenCache(settings.TOKEN_CACHE_SIZE)
+
+def verify_token_cached(token: str) -> Optional[str]:
+    """``verify_token`` backed by the decoded-token LRU"""
+    subject = token_cache.get(token)
+    if subject is not None:
+        return subject
+    
+    payload = decode_token(token)
+    if not payload or not payload.get("sub"):
+        return None
+    # Tokens without exp are not cached; they would never be evicted on expiry
+    if "exp" in payload:
+        token_cache.put(token, payload["sub"], float(payload["exp"]))
+    return payload["sub"]
+
+async def get_current_subject(
+    credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme)
+) -> str:
+    """Shared auth dependency: resolve the bearer token to its subject
+    
+    Declare it before ``get_async_db`` so requests with bad tokens are
+    rejected before a database session is opened.
+    """
+    subject = verify_token_cached(credentials.credentials)
+    if not subject:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid token"
+        )
+    return subject
+
+async def require_export_api_key(api_key: Optional[str] = Depends(api_key_scheme)):
+    """Institutional data access: ``X-API-Key`` must match ``EXPORT_API_KEY``"""
+    if not settings.EXPORT_API_KEY:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Export is not enabled"
+        )
+    if not api_key or not hmac.compare_digest(api_key, settings.EXPORT_API_KEY):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid API key"
+        )
@@ -0,0 +1,62 @@
+"""
+Counselor appointment models
+"""
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Index, UniqueConstraint, text
+from app.db.base import Base
+
+# Partial-index predicate shared by SQLite and PostgreSQL
+ACTIVE_APPOINTMENT = text("status != 'cancelled'")
+
+class Appointment(Base):
+    __tablename__ = "appointments"
+    __table_args__ = (
+        # At most one live booking per counselor and slot
+        Index(
+            "uq_appointments_active_slot",
+            "counselor_id",
+            "appointment_time",
+            unique=True,
+            sqlite_where=ACTIVE_APPOINTMENT,
+            postgresql_where=ACTIVE_APPOINTMENT
+        ),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(String, index=True)
+    counselor_id = Column(String, index=True)
+    appointment_time = Column(DateTime)
+    status = Column(String, default="scheduled")  # scheduled, confirmed, cancelled
+    notes = Column(String)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class CounselorProfile(Base):
+    __tablename__ = "counselor_profiles"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    counselor_id = Column(String, unique=True, index=True)
+    name = Column(String)
+    specialization = Column(String)
+    bio = Column(String)
+    available = Column(Boolean, default=True)
+
+class SlotHold(Base):
+    """Short-lived claim on a slot while a user confirms a booking
+    
+    One row per (counselor, slot). A ``held`` row past ``expires_at`` can be
+    taken over by the next claim; a ``confirmed`` row stays until the
+    appointment is cancelled or the slot is in the past.
+    """
+    __tablename__ = "slot_holds"
+    __table_args__ = (
+        UniqueConstraint("counselor_id", "appointment_time", name="uq_slot_hold_slot"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    counselor_id = Column(String, nullable=False)
+    appointment_time = Column(DateTime, nullable=False)
+    session_id = Column(String, nullable=False)
+    hold_token = Column(String, nullable=False, unique=True)
+    status = Column(String, nullable=False, default="held")  # held, confirmed
+    expires_at = Column(DateTime, nullable=False, index=True)
+    appointment_id = Column(Integer)
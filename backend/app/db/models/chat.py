@@ -1,12 +1,17 @@
 """
 Chat and conversation models
 """
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, Index
 from sqlalchemy.sql import func
 from app.db.base import Base
 
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
+    __table_args__ = (
+        # Keyset pagination of /chat/history
+        Index("ix_chat_messages_session_created", "session_id", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(String, index=True)  # Anonymous session ID
@@ -15,10 +20,16 @@ class ChatMessage(Base):
     sentiment = Column(String)  # positive, negative, neutral
     risk_detected = Column(Boolean, default=False)
     escalated = Column(Boolean, default=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Set in Python so stored values keep microseconds and compare exactly
+    # against pagination cursors
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow, server_default=func.now())
 
 class PeerChat(Base):
     __tablename__ = "peer_chats"
+    __table_args__ = (
+        # Keyset pagination of /chat/peer/{room_id}
+        Index("ix_peer_chats_room_flagged_created", "room_id", "is_flagged", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     room_id = Column(String, index=True)
@@ -26,4 +37,6 @@ class PeerChat(Base):
     message = Column(Text)
     is_moderated = Column(Boolean, default=False)
     is_flagged = Column(Boolean, default=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
+    # Blocked on send and handed to the escalation queue
+    escalated = Column(Boolean, default=False)
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow, server_default=func.now())
\ No newline at end of file
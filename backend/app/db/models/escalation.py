@@ -0,0 +1,45 @@
+"""
+Risk escalation queue models
+"""
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, DateTime, Text, JSON, Index, text
+from app.db.base import Base
+
+# Rows a worker may claim; also the claim index's partial-index predicate, so
+# the claim query must use this exact clause for the planner to match it
+CLAIMABLE_ESCALATION = text("status IN ('pending', 'processing')")
+
+class Escalation(Base):
+    """One escalated chat turn, queued for follow-up
+    
+    ``priority`` sorts ascending (0 = urgent). ``visible_at`` is when the
+    row can next be claimed: the enqueue time for new rows, the end of the
+    lease while a worker holds it, and the retry time after a failure.
+    """
+    __tablename__ = "escalations"
+    __table_args__ = (
+        # Dequeue order: claimable rows by priority, then age. Settled rows
+        # stay out of the index, and the claim walks it in ORDER BY order
+        Index(
+            "ix_escalations_claim",
+            "priority",
+            "enqueued_at",
+            "id",
+            sqlite_where=CLAIMABLE_ESCALATION,
+            postgresql_where=CLAIMABLE_ESCALATION
+        ),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(String, index=True)
+    risk_level = Column(String, nullable=False)
+    priority = Column(Integer, nullable=False)
+    content_summary = Column(Text)
+    actions_taken = Column(JSON)
+    status = Column(String, nullable=False, default="pending")  # pending, processing, done, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    lease_token = Column(String)
+    last_error = Column(Text)
+    enqueued_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    visible_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    completed_at = Column(DateTime)
@@ -1,13 +1,18 @@
 """
 Mental health screening models (PHQ-9, GAD-7, GHQ)
 """
-from sqlalchemy import Column, Integer, String, DateTime, JSON, ForeignKey
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, Date, DateTime, JSON, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.db.base import Base
 
 class Screening(Base):
     __tablename__ = "screenings"
+    __table_args__ = (
+        # Keyset pagination of /screenings/history
+        Index("ix_screenings_session_completed", "session_id", "completed_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(String, index=True)  # Anonymous session ID
@@ -15,7 +20,7 @@ class Screening(Base):
     responses = Column(JSON)  # Store answers as JSON
     score = Column(Integer)
     risk_level = Column(String)  # low, moderate, high, severe
-    completed_at = Column(DateTime(timezone=True), server_default=func.now())
+    completed_at = Column(DateTime(timezone=True), default=datetime.utcnow, server_default=func.now())
     
 class ScreeningTemplate(Base):
     __tablename__ = "screening_templates"
@@ -24,4 +29,17 @@ class ScreeningTemplate(Base):
     name = Column(String, unique=True, index=True)  # PHQ9, GAD7, GHQ
     questions = Column(JSON)  # Store questions as JSON
     scoring_rules = Column(JSON)  # Store scoring logic
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class ScreeningRollup(Base):
+    """Per-day screening counts, maintained alongside every submitted screening"""
+    __tablename__ = "screening_rollups"
+    __table_args__ = (
+        UniqueConstraint("screening_type", "risk_level", "day", name="uq_screening_rollup_bucket"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    screening_type = Column(String, nullable=False)
+    risk_level = Column(String, nullable=False)
+    day = Column(Date, nullable=False, index=True)
+    count = Column(Integer, nullable=False, default=0)
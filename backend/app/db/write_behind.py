@@ -0,0 +1,216 @@
+"""
+Group-commit write-behind queue for chat persistence
+
+Chat routes enqueue ORM rows instead of committing them one by one. A single
+flush task drains the queue and writes each batch in one transaction once
+either ``batch_size`` rows are waiting or ``flush_interval`` has elapsed since
+the first row of the batch arrived. Durable rows (e.g. risk-flagged messages)
+are flushed immediately and their ``enqueue`` call returns only after commit.
+
+A failed commit is retried up to ``max_attempts`` times with a growing
+delay. If the batch still fails, its rows are written one at a time, so a
+single bad row doesn't take the rest of the batch down with it. Only rows
+that fail on their own are dropped, and their durable callers get the error.
+
+``stop`` flushes everything queued before it. Rows enqueued while the queue
+is stopping are written straight away rather than queued behind the stop.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.db.base import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class WriteBehindQueue:
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        batch_size: int = 100,
+        flush_interval: float = 0.05,
+        max_queue: int = 10000,
+        max_attempts: int = 3,
+        retry_delay: float = 0.1
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        self.rows_enqueued = 0
+        self.rows_flushed = 0
+        self.rows_failed = 0
+        self.rows_written_directly = 0
+        self.retries = 0
+        self.batches_flushed = 0
+        self.last_batch_size = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._flushes = 0
+        self._total_flush_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        if self.running:
+            return
+        self._stopping = False
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush everything still queued, then stop the flush task"""
+        if not self.running:
+            return
+        # From here on enqueue writes directly, so nothing lands behind _STOP
+        self._stopping = True
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+    async def enqueue(self, row: Any, durable: bool = False) -> Any:
+        """Queue ``row`` for the next batch
+
+        Blocks while the queue is full (backpressure). With ``durable=True``
+        the batch is flushed right away and this returns after the commit,
+        raising if the write failed. While the queue is stopping, the row is
+        written before this returns.
+        """
+        if not self.running:
+            raise RuntimeError("Write-behind queue is not running")
+        future = asyncio.get_running_loop().create_future() if durable else None
+        if self._stopping:
+            self.rows_enqueued += 1
+            self.rows_written_directly += 1
+            await self._flush([(row, future)])
+            if future is not None:
+                await future
+            return row
+        await self._queue.put((row, future))
+        self.rows_enqueued += 1
+        if future is not None:
+            await future
+        return row
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+            batch: List[Tuple[Any, Optional[asyncio.Future]]] = [item]
+            durable = item[1] is not None
+            deadline = loop.time() + self.flush_interval
+
+            while len(batch) < self.batch_size:
+                if not self._queue.empty():
+                    item = self._queue.get_nowait()
+                else:
+                    # Durable rows skip the wait but still share the commit
+                    # with whatever was already queued
+                    timeout = deadline - loop.time()
+                    if durable or timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                durable = durable or item[1] is not None
+
+            await self._flush(batch)
+
+        # Anything that still got in after _STOP
+        leftovers = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not _STOP:
+                leftovers.append(item)
+        for i in range(0, len(leftovers), self.batch_size):
+            await self._flush(leftovers[i:i + self.batch_size])
+
+    async def _flush(self, batch: List[Tuple[Any, Optional[asyncio.Future]]]):
+        started = time.perf_counter()
+        error = await self._write([row for row, _ in batch], self.max_attempts)
+        if error is not None and len(batch) > 1:
+            # Find the rows that can't be written and keep the rest
+            errors = [await self._write([row], 1) for row, _ in batch]
+        else:
+            errors = [error] * len(batch)
+        failed = sum(error is not None for error in errors)
+        self.rows_failed += failed
+        self.rows_flushed += len(batch) - failed
+        if failed < len(batch):
+            self.batches_flushed += 1
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.last_batch_size = len(batch)
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        self._flushes += 1
+        self._total_flush_ms += elapsed_ms
+
+        for (_, future), error in zip(batch, errors):
+            if future is None or future.done():
+                continue
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(error)
+
+    async def _write(self, rows: List[Any], attempts: int) -> Optional[BaseException]:
+        """Commit ``rows`` in one transaction; returns the last error if every attempt failed"""
+        for attempt in range(1, attempts + 1):
+            try:
+                async with self.session_factory() as db:
+                    db.add_all(rows)
+                    await db.commit()
+                return None
+            except Exception as exc:
+                if attempt == attempts:
+                    logger.exception("Write-behind flush of %d rows failed after %d attempts", len(rows), attempts)
+                    return exc
+                self.retries += 1
+                logger.warning("Write-behind flush of %d rows failed (%s); retrying", len(rows), exc)
+                await asyncio.sleep(self.retry_delay * attempt)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue": self.max_queue,
+            "rows_enqueued": self.rows_enqueued,
+            "rows_flushed": self.rows_flushed,
+            "rows_failed": self.rows_failed,
+            "rows_written_directly": self.rows_written_directly,
+            "retries": self.retries,
+            "batches_flushed": self.batches_flushed,
+            "last_batch_size": self.last_batch_size,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "avg_flush_ms": round(self._total_flush_ms / self._flushes, 3) if self._flushes else 0.0,
+            "max_flush_ms": round(self.max_flush_ms, 3)
+        }
+
+
+chat_write_behind = WriteBehindQueue(
+    batch_size=settings.CHAT_WRITE_BEHIND_BATCH_SIZE,
+    flush_interval=settings.CHAT_WRITE_BEHIND_FLUSH_MS / 1000,
+    max_queue=settings.CHAT_WRITE_BEHIND_MAX_QUEUE
+)
@@ -3,24 +3,70 @@ Sahara Backend - FastAPI Application Entry Point
 """
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
-import json
-from typing import List
+from fastapi.responses import HTMLResponse, JSONResponse
+from contextlib import asynccontextmanager
+from typing import Optional
 
 from app.api import auth, chat, screenings, appointments
 from app.core.config import settings
-from app.db.base import engine, Base
+from app.core.security import PasswordHashingBusy, password_hasher, token_cache, verify_token_cached
+from app.db.base import AsyncSessionLocal, engine, Base
+from app.db.write_behind import chat_write_behind
+from app.services.availability import availability_index
+from app.services.backplane import create_backplane
+from app.services.chat_stream import ChatStreamSession
+from app.services.connection_manager import manager
+from app.services.escalation_queue import escalation_workers
+from app.services.inference import chat_inference, create_inference_backend
+from app.services.moderation import create_moderation_classifier, peer_moderator
+from app.services.peer_chat import PeerChatService
+from app.services.retention import retention_job
+from app.services.risk_state import risk_states
+from app.services.screening_analytics import screening_analytics
+from app.services.screening_scores import screening_scores
+from app.services.slot_holds import hold_purger
+from app.services.ws_codec import PayloadError, negotiate_codec, receive_payload
 
 # Create database tables
 Base.metadata.create_all(bind=engine)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Background workers
+    if settings.CHAT_WRITE_BEHIND:
+        await chat_write_behind.start()
+    if not settings.WS_BACKPLANE_URL.startswith("memory://"):
+        await manager.use_backplane(create_backplane(settings.WS_BACKPLANE_URL))
+    await hold_purger.start()
+    await escalation_workers.start()
+    await peer_moderator.start(
+        create_moderation_classifier(settings.PEER_MODERATION_CLASSIFIER, settings.PEER_MODERATION_MODEL_PATH)
+    )
+    await retention_job.start()
+    await screening_analytics.start()
+    backend = create_inference_backend(settings.CHAT_MODEL_BACKEND, settings.CHAT_MODEL_PATH)
+    if backend is not None:
+        await chat_inference.start(backend)
+    yield
+    await chat_inference.stop()
+    await screening_analytics.stop()
+    await retention_job.stop()
+    await peer_moderator.stop()
+    await escalation_workers.stop()
+    await hold_purger.stop()
+    await manager.backplane.stop()
+    # Flush pending writes before shutdown
+    await chat_write_behind.stop()
+    password_hasher.shutdown()
+
 # FastAPI app instance
 app = FastAPI(
     title="Sahara Mental Health API",
     description="AI-powered mental health support platform",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -30,53 +76,107 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+@app.exception_handler(PasswordHashingBusy)
+async def password_hashing_busy_handler(request, exc: PasswordHashingBusy):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Service busy, please retry"},
+        headers={"Retry-After": "1"}
+    )
+
 # Include API routers
 app.include_router(auth.router, prefix="/api/v1/auth", tags=["authentication"])
 app.include_router(chat.router, prefix="/api/v1/chat", tags=["chat"])
 app.include_router(screenings.router, prefix="/api/v1/screenings", tags=["screenings"])
 app.include_router(appointments.router, prefix="/api/v1/appointments", tags=["appointments"])
 
-# WebSocket connection manager
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-
-    async def send_personal_message(self, message: str, websocket: WebSocket):
-        await websocket.send_text(message)
-
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            await connection.send_text(message)
-
-manager = ConnectionManager()
-
 @app.websocket("/ws/chat")
-async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+async def websocket_endpoint(websocket: WebSocket, token: str = ""):
+    """Streaming chatbot channel
+    
+    Authenticate with ``?token=``. Each ``{"content": ...}`` message is
+    answered with a ``start`` frame (risk flags and resources), ``chunk``
+    frames and a ``done`` frame; see ``app.services.chat_stream``. Frames
+    are JSON unless MessagePack was negotiated (``app.services.ws_codec``).
+    A frame that isn't an object gets an ``error`` frame; the socket stays
+    open.
+    """
+    subject = verify_token_cached(token)
+    if not subject:
+        await websocket.close(code=1008)
+        return
+    
+    codec, subprotocol = negotiate_codec(websocket)
+    await manager.connect(websocket, codec, subprotocol)
+    session = ChatStreamSession(websocket, subject)
+    session.start()
     try:
         while True:
-            data = await websocket.receive_text()
-            message_data = json.loads(data)
-            
-            # Echo back for now - replace with AI chatbot logic
-            response = {
-                "type": "message",
-                "content": f"Echo: {message_data.get('content', '')}",
-                "timestamp": message_data.get("timestamp"),
-                "sender": "system"
-            }
-            
-            await manager.send_personal_message(json.dumps(response), websocket)
+            try:
+                data = await receive_payload(websocket)
+            except PayloadError as exc:
+                await manager.send_payload({"type": "error", "detail": str(exc)}, websocket)
+                continue
+            await session.submit(data)
     except WebSocketDisconnect:
+        pass
+    finally:
+        # Stop generating for a client that is gone
+        await session.close()
+        manager.disconnect(websocket)
+
+@app.websocket("/ws/peer/{room_id}")
+async def peer_websocket_endpoint(
+    websocket: WebSocket,
+    room_id: str,
+    token: str = "",
+    last_id: Optional[int] = None
+):
+    """Peer support room channel
+    
+    Authenticate with ``?token=``; pass ``?last_id=`` on reconnect to replay
+    messages missed since that id. Replayed and pushed messages can overlap
+    around the join, so clients should de-duplicate by id.
+    """
+    subject = verify_token_cached(token)
+    if not subject:
+        await websocket.close(code=1008)
+        return
+    
+    service = PeerChatService()
+    codec, subprotocol = negotiate_codec(websocket)
+    await manager.connect(websocket, codec, subprotocol)
+    # Subscribe before reading the backlog so nothing falls in between
+    manager.join(websocket, room_id)
+    try:
+        async with AsyncSessionLocal() as db:
+            backlog = await service.catch_up(db, room_id, last_id)
+        for peer_msg in backlog:
+            payload = {"type": "peer_message", **service.serialize(peer_msg)}
+            await manager.send_payload(payload, websocket)
+        
+        while True:
+            try:
+                data = await receive_payload(websocket)
+            except PayloadError as exc:
+                await manager.send_payload({"type": "error", "detail": str(exc)}, websocket)
+                continue
+            text = str(data.get("message", "")).strip()
+            if not text:
+                continue
+            async with AsyncSessionLocal() as db:
+                peer_msg = await service.save(db, room_id, subject, text)
+            if peer_msg.is_flagged:
+                # Only the sender hears about a blocked message
+                await manager.send_payload(service.flagged_notice(peer_msg), websocket)
+            else:
+                await service.publish(peer_msg)
+    except WebSocketDisconnect:
+        pass
+    finally:
         manager.disconnect(websocket)
 
 @app.get("/")
@@ -85,4 +185,23 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "environment": settings.ENVIRONMENT}
\ No newline at end of file
+    return {"status": "healthy", "environment": settings.ENVIRONMENT}
+
+@app.get("/stats")
+async def runtime_stats():
+    """Runtime counters for background workers and caches"""
+    return {
+        "chat_write_behind": chat_write_behind.stats(),
+        "auth_token_cache": token_cache.stats(),
+        "password_hashing": password_hasher.stats(),
+        "websockets": manager.stats(),
+        "screening_analytics": screening_analytics.stats(),
+        "availability": availability_index.stats(),
+        "slot_holds": hold_purger.stats(),
+        "escalations": await escalation_workers.stats(),
+        "risk_state": risk_states.stats(),
+        "screening_scores": screening_scores.stats(),
+        "chat_inference": chat_inference.stats(),
+        "peer_moderation": peer_moderator.stats(),
+        "retention": retention_job.stats()
+    }
\ No newline at end of file
@@ -0,0 +1,257 @@
+"""
+Counselor availability index
+
+Each counselor has a sorted list of booked intervals, loaded from the
+``appointments`` table and then kept current by ``book``/``cancel``. Only
+appointments that haven't ended are loaded: past ones can't overlap a slot
+that is still bookable. Free
+slots are the working-hour slots (weekdays, ``SLOT_HOURS``) that no booking
+overlaps:
+
+* one counselor over a date range: a bisect to the first booking in range,
+  then one merge walk over slots and bookings - O(log n + k)
+* earliest slots across counselors with a specialization: a heap merge of
+  each counselor's lazy free-slot stream, so only the bookings in front of
+  each counselor's first free slot are looked at
+
+The index is per process. Bookings made by another worker are not seen
+until the next reload: the index is rebuilt once it is older than
+``max_age``, and at once after ``invalidate``, which the booking endpoints
+call whenever the database turns down a slot the index showed as free. The
+database remains the source of truth, and bookings are arbitrated there
+(see ``slot_holds``).
+"""
+import asyncio
+import heapq
+import itertools
+import time as clock
+from bisect import bisect_left, bisect_right
+from datetime import datetime, time, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.db.models.appointment import Appointment
+
+# Working hours: Monday-Friday, one-hour sessions starting at these hours
+WORKDAYS = range(0, 5)
+SLOT_HOURS = [9, 10, 11, 14, 15, 16]
+SLOT_LENGTH = timedelta(hours=1)
+
+# How far ahead multi-counselor searches look
+DEFAULT_HORIZON_DAYS = 60
+
+# Demo directory - in production, this would be from database
+COUNSELORS = [
+    {
+        "counselor_id": "counselor_1",
+        "name": "Dr. Sarah Johnson",
+        "specialization": "Anxiety & Depression",
+        "bio": "Licensed clinical psychologist with 10+ years experience",
+        "available": True
+    },
+    {
+        "counselor_id": "counselor_2",
+        "name": "Dr. Michael Chen",
+        "specialization": "Trauma & PTSD",
+        "bio": "Trauma specialist with expertise in EMDR therapy",
+        "available": True
+    },
+    {
+        "counselor_id": "counselor_3",
+        "name": "Dr. Maria Rodriguez",
+        "specialization": "Family & Relationships",
+        "bio": "Marriage and family therapist specializing in relationship counseling",
+        "available": True
+    }
+]
+
+
+def specialization_tags(specialization: str) -> Set[str]:
+    """``"Anxiety & Depression"`` -> ``{"anxiety", "depression"}``"""
+    return {part.strip().lower() for part in specialization.split("&") if part.strip()}
+
+
+def local_time(value: datetime) -> datetime:
+    """``value`` as a naive local time, converting it first if it has an offset"""
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return value
+
+
+def is_working_slot(start: datetime) -> bool:
+    return (
+        start.weekday() in WORKDAYS
+        and start.hour in SLOT_HOURS
+        and start.minute == 0 and start.second == 0 and start.microsecond == 0
+    )
+
+
+def working_slots(start: datetime, end: Optional[datetime] = None) -> Iterator[datetime]:
+    """Slot start times at or after ``start`` (and before ``end``), in order"""
+    day = start.date()
+    while True:
+        if day.weekday() in WORKDAYS:
+            for hour in SLOT_HOURS:
+                slot = datetime.combine(day, time(hour))
+                if end is not None and slot >= end:
+                    return
+                if slot >= start:
+                    yield slot
+        elif end is not None and datetime.combine(day, time.min) >= end:
+            return
+        day += timedelta(days=1)
+
+
+class CounselorSchedule:
+    """Booked intervals for one counselor, sorted by start"""
+    __slots__ = ("starts", "ends", "appointment_ids")
+
+    def __init__(self):
+        self.starts: List[datetime] = []
+        self.ends: List[datetime] = []
+        self.appointment_ids: List[int] = []
+
+    def add(self, appointment_id: int, start: datetime, end: datetime):
+        i = bisect_right(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+        self.appointment_ids.insert(i, appointment_id)
+
+    def remove(self, appointment_id: int, start: datetime) -> bool:
+        i = bisect_left(self.starts, start)
+        while i < len(self.starts) and self.starts[i] == start:
+            if self.appointment_ids[i] == appointment_id:
+                del self.starts[i], self.ends[i], self.appointment_ids[i]
+                return True
+            i += 1
+        return False
+
+    def is_free(self, start: datetime, end: datetime) -> bool:
+        """No booking overlaps [start, end)"""
+        i = bisect_left(self.starts, end)
+        # Bookings never overlap each other, so only the one before can reach in
+        return i == 0 or self.ends[i - 1] <= start
+
+    def free_slots(self, start: datetime, end: Optional[datetime] = None) -> Iterator[datetime]:
+        """Free working slots from ``start``; walks bookings alongside the slots"""
+        # First booking that can overlap a slot starting at or after ``start``
+        i = max(bisect_left(self.starts, start) - 1, 0)
+        count = len(self.starts)
+        for slot in working_slots(start, end):
+            slot_end = slot + SLOT_LENGTH
+            while i < count and self.ends[i] <= slot:
+                i += 1
+            if i < count and self.starts[i] < slot_end:
+                continue
+            yield slot
+
+
+class AvailabilityIndex:
+    def __init__(
+        self,
+        counselors: List[Dict[str, Any]] = COUNSELORS,
+        max_age: float = settings.AVAILABILITY_RELOAD_SECONDS
+    ):
+        self.counselors = {counselor["counselor_id"]: counselor for counselor in counselors}
+        # specialization tag -> counselor ids
+        self.by_tag: Dict[str, List[str]] = {}
+        for counselor in counselors:
+            for tag in specialization_tags(counselor["specialization"]):
+                self.by_tag.setdefault(tag, []).append(counselor["counselor_id"])
+        self.schedules: Dict[str, CounselorSchedule] = {}
+        self.max_age = max_age
+        self.loaded = False
+        self.loaded_at = 0.0
+        self.reloads = 0
+        self.invalidations = 0
+        self._load_lock = asyncio.Lock()
+
+    def schedule(self, counselor_id: str) -> CounselorSchedule:
+        schedule = self.schedules.get(counselor_id)
+        if schedule is None:
+            schedule = self.schedules[counselor_id] = CounselorSchedule()
+        return schedule
+
+    @property
+    def stale(self) -> bool:
+        if not self.loaded:
+            return True
+        return bool(self.max_age) and clock.monotonic() - self.loaded_at >= self.max_age
+
+    async def ensure_loaded(self, db: AsyncSession):
+        if self.stale:
+            async with self._load_lock:
+                if self.stale:
+                    await self.reload(db)
+
+    def invalidate(self):
+        """Rebuild on next use, e.g. after another worker booked a slot shown as free"""
+        self.loaded = False
+        self.invalidations += 1
+
+    async def reload(self, db: AsyncSession):
+        """Rebuild every schedule from the active appointments that haven't ended"""
+        result = await db.execute(
+            select(Appointment.id, Appointment.counselor_id, Appointment.appointment_time).where(
+                Appointment.status != "cancelled",
+                Appointment.appointment_time > datetime.now() - SLOT_LENGTH
+            )
+        )
+        schedules: Dict[str, CounselorSchedule] = {}
+        for appointment_id, counselor_id, start in sorted(result.all(), key=lambda row: row[2]):
+            schedule = schedules.setdefault(counselor_id, CounselorSchedule())
+            schedule.starts.append(start)
+            schedule.ends.append(start + SLOT_LENGTH)
+            schedule.appointment_ids.append(appointment_id)
+        self.schedules = schedules
+        self.loaded = True
+        self.loaded_at = clock.monotonic()
+        self.reloads += 1
+
+    def is_free(self, counselor_id: str, start: datetime) -> bool:
+        return self.schedule(counselor_id).is_free(start, start + SLOT_LENGTH)
+
+    def book(self, counselor_id: str, appointment_id: int, start: datetime):
+        self.schedule(counselor_id).add(appointment_id, start, start + SLOT_LENGTH)
+
+    def cancel(self, counselor_id: str, appointment_id: int, start: datetime):
+        self.schedule(counselor_id).remove(appointment_id, start)
+
+    def free_slots(self, counselor_id: str, start: datetime, end: datetime) -> List[datetime]:
+        return list(self.schedule(counselor_id).free_slots(start, end))
+
+    def earliest_slots(
+        self,
+        specialization: Optional[str] = None,
+        after: Optional[datetime] = None,
+        limit: int = 5,
+        horizon_days: int = DEFAULT_HORIZON_DAYS
+    ) -> List[Tuple[datetime, str]]:
+        """The ``limit`` earliest free (slot, counselor_id) pairs, soonest first"""
+        after = local_time(after) if after else datetime.now()
+        end = after + timedelta(days=horizon_days)
+        if specialization:
+            counselor_ids = self.by_tag.get(specialization.strip().lower(), [])
+        else:
+            counselor_ids = list(self.counselors)
+        streams = [
+            zip(self.schedule(counselor_id).free_slots(after, end), itertools.repeat(counselor_id))
+            for counselor_id in counselor_ids
+            if self.counselors[counselor_id]["available"]
+        ]
+        return list(itertools.islice(heapq.merge(*streams), limit))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "loaded": self.loaded,
+            "age_seconds": round(clock.monotonic() - self.loaded_at, 1) if self.loaded else None,
+            "reloads": self.reloads,
+            "invalidations": self.invalidations,
+            "counselors": len(self.schedules),
+            "bookings": sum(len(schedule.starts) for schedule in self.schedules.values())
+        }
+
+
+availability_index = AvailabilityIndex()
@@ -0,0 +1,312 @@
+"""
+WebSocket backplane: carries broadcasts and room messages between workers
+
+Each uvicorn worker (or container on the same host) owns only its own
+sockets. The connection manager publishes every outgoing fan-out message to
+the backplane and delivers to local sockets whatever the backplane hands
+back, so a message published in one worker reaches subscribers in all of
+them.
+
+* ``memory://``          - in-process, for a single worker (default)
+* ``unix:///path/sock``  - local IPC through a small broker on a Unix domain
+  socket. The first worker to take ``<path>.lock`` hosts the broker inside
+  its event loop; if that worker exits, the others reconnect and one of them
+  takes over. A dedicated broker process can be run instead with
+  ``python -m app.services.backplane /path/sock``.
+
+  While a worker is reconnecting, its publishes are buffered (up to
+  ``max_pending`` frames) and sent once the connection is back; past that
+  they are delivered to local sockets only. Publishing never raises because
+  the broker is gone: the message has usually been persisted already.
+"""
+import asyncio
+import fcntl
+import logging
+import os
+import struct
+import sys
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, Set, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+Message = Union[str, bytes]
+Handler = Callable[[str, Message], None]
+
+# Frame header: payload length, payload kind (0 text / 1 bytes), channel length
+FRAME_HEADER = struct.Struct(">IBH")
+KIND_TEXT = 0
+KIND_BYTES = 1
+
+
+def encode_frame(channel: str, message: Message) -> bytes:
+    channel_bytes = channel.encode()
+    if isinstance(message, bytes):
+        kind, payload = KIND_BYTES, message
+    else:
+        kind, payload = KIND_TEXT, message.encode()
+    return FRAME_HEADER.pack(len(payload), kind, len(channel_bytes)) + channel_bytes + payload
+
+
+async def read_frame(reader: asyncio.StreamReader) -> bytes:
+    """Read one raw frame (header included)"""
+    header = await reader.readexactly(FRAME_HEADER.size)
+    payload_length, _, channel_length = FRAME_HEADER.unpack(header)
+    return header + await reader.readexactly(channel_length + payload_length)
+
+
+def decode_frame(frame: bytes) -> Tuple[str, Message]:
+    payload_length, kind, channel_length = FRAME_HEADER.unpack_from(frame)
+    body = frame[FRAME_HEADER.size:]
+    channel = body[:channel_length].decode()
+    payload = body[channel_length:channel_length + payload_length]
+    return channel, payload if kind == KIND_BYTES else payload.decode()
+
+
+def acquire_broker_lock(path: str) -> Optional[int]:
+    """Take ``<path>.lock``; the holder is the only process serving ``path``"""
+    fd = os.open(f"{path}.lock", os.O_CREAT | os.O_RDWR, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    return fd
+
+
+class Backplane:
+    """Interface: ``publish`` sends to every worker, including this one"""
+
+    def __init__(self):
+        self.handler: Optional[Handler] = None
+        self.published = 0
+        self.received = 0
+
+    def attach(self, handler: Handler):
+        """Set the callback that delivers a message to this worker's sockets"""
+        self.handler = handler
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def publish(self, channel: str, message: Message):
+        raise NotImplementedError
+
+    def _dispatch(self, channel: str, message: Message):
+        self.received += 1
+        if self.handler is not None:
+            self.handler(channel, message)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "type": type(self).__name__,
+            "published": self.published,
+            "received": self.received
+        }
+
+
+class InProcessBackplane(Backplane):
+    async def publish(self, channel: str, message: Message):
+        self.published += 1
+        self._dispatch(channel, message)
+
+
+class BackplaneBroker:
+    """Relays every frame it receives to all connected workers"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._writers: Set[asyncio.StreamWriter] = set()
+        self.frames_relayed = 0
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self._handle, path=self.path)
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._writers):
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    async def serve_forever(self):
+        await self.start()
+        await self._server.serve_forever()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._writers.add(writer)
+        try:
+            while True:
+                frame = await read_frame(reader)
+                self.frames_relayed += 1
+                peers = list(self._writers)
+                for peer in peers:
+                    peer.write(frame)
+                await asyncio.gather(*(peer.drain() for peer in peers), return_exceptions=True)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+
+class UnixSocketBackplane(Backplane):
+    def __init__(self, path: str, retry_interval: float = 0.05, max_pending: int = 1000):
+        super().__init__()
+        self.path = path
+        self.retry_interval = retry_interval
+        self.max_pending = max_pending
+        self.broker: Optional[BackplaneBroker] = None
+        self.reconnects = 0
+        self.publish_errors = 0
+        self.delivered_locally = 0
+        self._lock_fd: Optional[int] = None
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._read_task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._connected = False
+        # Frames published while the broker was unreachable
+        self._pending: Deque[Tuple[str, Message]] = deque()
+
+    async def start(self):
+        self._closing = False
+        await self._connect()
+        self._connected = True
+        self._read_task = asyncio.create_task(self._read_loop())
+
+    async def stop(self):
+        self._closing = True
+        if self._read_task is not None:
+            self._read_task.cancel()
+            try:
+                await self._read_task
+            except asyncio.CancelledError:
+                pass
+            self._read_task = None
+        self._connected = False
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self.broker is not None:
+            await self.broker.stop()
+            self.broker = None
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def _try_lock(self) -> bool:
+        # Held for as long as this worker hosts the broker
+        if self._lock_fd is None:
+            self._lock_fd = acquire_broker_lock(self.path)
+        return self._lock_fd is not None
+
+    async def _connect(self):
+        while True:
+            try:
+                self._reader, self._writer = await asyncio.open_unix_connection(self.path)
+                return
+            except (FileNotFoundError, ConnectionRefusedError):
+                if self.broker is None and self._try_lock():
+                    self.broker = BackplaneBroker(self.path)
+                    await self.broker.start()
+                    logger.info("Hosting WebSocket backplane broker on %s", self.path)
+                    continue
+                await asyncio.sleep(self.retry_interval)
+
+    async def _read_loop(self):
+        while not self._closing:
+            try:
+                frame = await read_frame(self._reader)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                if self._closing:
+                    return
+                # Broker went away; reconnect (possibly hosting it ourselves)
+                self._connected = False
+                self.reconnects += 1
+                logger.warning("Lost the WebSocket backplane broker on %s; reconnecting", self.path)
+                await self._connect()
+                await self._flush_pending()
+                continue
+            channel, message = decode_frame(frame)
+            try:
+                self._dispatch(channel, message)
+            except Exception:
+                logger.exception("Backplane handler failed for channel %s", channel)
+
+    async def publish(self, channel: str, message: Message):
+        self.published += 1
+        if self._writer is None:
+            # Not started (e.g. no lifespan in tests): local delivery only
+            self._dispatch(channel, message)
+            return
+        if not self._connected:
+            self._hold(channel, message)
+            return
+        try:
+            self._writer.write(encode_frame(channel, message))
+            await self._writer.drain()
+        except OSError as exc:
+            # The read loop notices too and reconnects; send this one then
+            self.publish_errors += 1
+            logger.warning("Backplane publish to %s failed (%s); holding it until reconnected", self.path, exc)
+            self._connected = False
+            self._hold(channel, message)
+
+    def _hold(self, channel: str, message: Message):
+        if len(self._pending) < self.max_pending:
+            self._pending.append((channel, message))
+            return
+        # Other workers miss it, but this worker's sockets still get it
+        self.delivered_locally += 1
+        self._dispatch(channel, message)
+
+    async def _flush_pending(self):
+        """Send what was held during the reconnect, in order, then resume publishing"""
+        while self._pending:
+            channel, message = self._pending[0]
+            try:
+                self._writer.write(encode_frame(channel, message))
+                await self._writer.drain()
+            except OSError:
+                # Lost again; the read loop reconnects and flushes once more
+                return
+            self._pending.popleft()
+        self._connected = True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **super().stats(),
+            "path": self.path,
+            "hosting_broker": self.broker is not None,
+            "connected": self._connected,
+            "reconnects": self.reconnects,
+            "publish_errors": self.publish_errors,
+            "pending": len(self._pending),
+            "delivered_locally": self.delivered_locally
+        }
+
+
+def create_backplane(url: str) -> Backplane:
+    if url.startswith("memory://"):
+        return InProcessBackplane()
+    if url.startswith("unix://"):
+        return UnixSocketBackplane(url[len("unix://"):])
+    raise ValueError(f"Unsupported backplane URL: {url}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    socket_path = sys.argv[1] if len(sys.argv) > 1 else "/tmp/sahara-backplane.sock"
+    if acquire_broker_lock(socket_path) is None:
+        sys.exit(f"Another process is already serving {socket_path}")
+    asyncio.run(BackplaneBroker(socket_path).serve_forever())
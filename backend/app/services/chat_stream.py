@@ -0,0 +1,165 @@
+"""
+Streaming chatbot sessions for the /ws/chat socket
+
+Each connection gets a ``ChatStreamSession`` that runs turns one at a time
+in its own task. A turn scans the message once, runs the chatbot and risk
+pipeline, sends a ``start`` frame (risk flags and crisis resources first, so
+they never wait behind the reply), streams ``chunk`` frames and ends with a
+``done`` frame carrying the full text. The turn is persisted even when the
+client disconnects mid-response; only the text already generated is stored.
+"""
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+from fastapi import WebSocket
+from app.core.config import settings
+from app.db.base import AsyncSessionLocal
+from app.db.models.chat import ChatMessage
+from app.db.write_behind import chat_write_behind
+from app.services.chatbot import ChatbotService
+from app.services.connection_manager import manager
+from app.services.crisis_matcher import crisis_matcher
+from app.services.escalation_queue import escalation_queue
+from app.services.risk_escalation import RiskEscalationService
+from app.services.risk_state import risk_states
+from app.services.screening_scores import screening_scores
+from app.services.sentiment import sentiment_scorer
+
+logger = logging.getLogger(__name__)
+
+
+async def persist_turn(record: ChatMessage, durable: bool):
+    """Store a chat turn outside of any request-scoped session"""
+    if chat_write_behind.running:
+        await chat_write_behind.enqueue(record, durable=durable)
+        return
+    async with AsyncSessionLocal() as db:
+        db.add(record)
+        await db.commit()
+
+
+class ChatStreamSession:
+    def __init__(
+        self,
+        websocket: WebSocket,
+        subject: str,
+        chatbot: Optional[ChatbotService] = None,
+        risk_service: Optional[RiskEscalationService] = None,
+        chunk_words: int = settings.CHAT_STREAM_CHUNK_WORDS,
+        max_pending: int = settings.CHAT_STREAM_MAX_PENDING
+    ):
+        self.websocket = websocket
+        self.subject = subject
+        self.chatbot = chatbot or ChatbotService()
+        self.risk_service = risk_service or RiskEscalationService()
+        self.chunk_words = chunk_words
+        self.turns = 0
+        self._inbox: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self._runner: Optional[asyncio.Task] = None
+        self._pending_writes: List[asyncio.Task] = []
+
+    def start(self):
+        self._runner = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Cancel the turn in progress and wait for its turn to be stored"""
+        if self._runner is not None:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+        if self._pending_writes:
+            await asyncio.gather(*self._pending_writes, return_exceptions=True)
+
+    async def submit(self, data: Dict[str, Any]):
+        """Queue an incoming client message; rejects it when too many are waiting"""
+        content = str(data.get("content", "")).strip()
+        if not content:
+            return
+        try:
+            self._inbox.put_nowait((content, data.get("timestamp")))
+        except asyncio.QueueFull:
+            await self._send({"type": "error", "detail": "Too many pending messages"})
+
+    async def _send(self, payload: Dict[str, Any]):
+        await manager.send_payload(payload, self.websocket)
+
+    async def _run(self):
+        while True:
+            content, timestamp = await self._inbox.get()
+            try:
+                await self._turn(content, timestamp)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Chat turn failed")
+                await self._send({"type": "error", "detail": "Could not generate a response"})
+
+    async def _turn(self, content: str, timestamp: Any):
+        self.turns += 1
+        turn = self.turns
+        matches = crisis_matcher.scan(content)
+        # One classification drives the risk flag, the risk level and the
+        # reply, as on /chat/ai
+        category = await self.chatbot.classify(content, matches)
+        risk_detected = self.chatbot.detect_risk_level(content, matches, category)
+        risk_level = self.risk_service.assess_risk_level(
+            content,
+            await screening_scores.get(self.subject),
+            matches=matches,
+            chat_category=category
+        )
+        risk_state = await risk_states.get(self.subject)
+        escalated = await escalation_queue.escalate(
+            self.subject,
+            content,
+            risk_level,
+            self.risk_service.should_escalate(risk_level, risk_state.session_data())
+        )
+        risk_state.record(risk_level)
+        actions = self.risk_service.get_escalation_actions(risk_level)
+
+        await self._send({
+            "type": "start",
+            "turn": turn,
+            "risk_detected": risk_detected,
+            "risk_level": risk_level,
+            "escalated": escalated,
+            "resources": actions["resources"],
+            "timestamp": timestamp
+        })
+
+        chunks: List[str] = []
+        try:
+            async for chunk in self.chatbot.stream_response(
+                content, matches, self.chunk_words, category
+            ):
+                chunks.append(chunk)
+                await self._send({"type": "chunk", "turn": turn, "content": chunk})
+        finally:
+            record = ChatMessage(
+                session_id=self.subject,
+                message=content,
+                response="".join(chunks),
+                sentiment=sentiment_scorer.label(content),
+                risk_detected=risk_detected,
+                escalated=escalated
+            )
+            # Own task, so a disconnect mid-response still stores the turn
+            write = asyncio.ensure_future(persist_turn(record, durable=risk_detected))
+            self._pending_writes.append(write)
+            write.add_done_callback(self._pending_writes.remove)
+        await asyncio.shield(write)
+
+        await self._send({
+            "type": "done",
+            "turn": turn,
+            "content": record.response,
+            "risk_detected": risk_detected,
+            "escalated": escalated,
+            "timestamp": timestamp,
+            "sender": "system"
+        })
@@ -1,17 +1,19 @@
 """
 AI Chatbot service for mental health first-aid
 """
+import asyncio
 import re
-from typing import Tuple
+from typing import AsyncIterator, Optional, Tuple
+from app.services.crisis_matcher import CHATBOT_KEYWORDS, MatchResult, crisis_matcher
+from app.services.inference import InferenceUnavailable, chat_inference
+
+# A word and the whitespace after it
+WORD_PATTERN = re.compile(r"\S+\s*")
 
 class ChatbotService:
     def __init__(self):
         # Crisis keywords that trigger risk detection
-        self.crisis_keywords = [
-            "suicide", "kill myself", "end my life", "want to die", 
-            "hurt myself", "self-harm", "cutting", "overdose",
-            "hopeless", "no point", "better off dead"
-        ]
+        self.crisis_keywords = CHATBOT_KEYWORDS["crisis"]
         
         # Supportive responses for different scenarios
         self.responses = {
@@ -37,27 +39,62 @@ class ChatbotService:
             ]
         }
     
-    def detect_risk_level(self, message: str) -> bool:
-        """Detect if message contains crisis indicators"""
-        message_lower = message.lower()
-        return any(keyword in message_lower for keyword in self.crisis_keywords)
+    def detect_risk_level(
+        self,
+        message: str,
+        matches: Optional[MatchResult] = None,
+        category: Optional[str] = None
+    ) -> bool:
+        """Detect if message contains crisis indicators
+        
+        Pass the ``classify`` result as ``category`` so a crisis label from
+        the model counts too, as it does in ``respond``.
+        """
+        if matches is None:
+            matches = crisis_matcher.scan(message)
+        return matches.has("crisis") or category == "crisis"
     
-    def categorize_message(self, message: str) -> str:
+    def categorize_message(self, message: str, matches: Optional[MatchResult] = None) -> str:
         """Categorize the type of mental health concern"""
-        message_lower = message.lower()
+        if matches is None:
+            matches = crisis_matcher.scan(message)
         
-        if self.detect_risk_level(message):
+        if matches.has("crisis"):
             return "crisis"
-        elif any(word in message_lower for word in ["anxious", "anxiety", "worry", "nervous", "panic"]):
+        elif matches.has("anxiety"):
             return "anxiety"
-        elif any(word in message_lower for word in ["depressed", "depression", "sad", "hopeless", "empty"]):
+        elif matches.has("depression"):
             return "depression"
         else:
             return "general"
     
-    def get_response(self, message: str) -> Tuple[str, bool]:
-        """Generate appropriate response based on message content"""
-        category = self.categorize_message(message)
+    async def classify(self, message: str, matches: Optional[MatchResult] = None) -> str:
+        """Reply category from the inference model, or from keywords
+        
+        Crisis keywords always win; the model only refines other messages,
+        and may itself label one ``crisis``.
+        """
+        category = self.categorize_message(message, matches)
+        if category == "crisis" or not chat_inference.running:
+            return category
+        try:
+            predicted = await chat_inference.predict(message)
+        except InferenceUnavailable:
+            return category
+        return predicted if predicted in self.responses else category
+    
+    def get_response(self, message: str, matches: Optional[MatchResult] = None) -> Tuple[str, bool]:
+        """Generate appropriate response based on message content
+        
+        Pass ``matches`` from a prior ``crisis_matcher.scan`` to reuse the scan.
+        """
+        return self.compose_response(self.categorize_message(message, matches))
+    
+    async def respond(self, message: str, matches: Optional[MatchResult] = None) -> Tuple[str, bool]:
+        """``get_response`` with the category from ``classify``"""
+        return self.compose_response(await self.classify(message, matches))
+    
+    def compose_response(self, category: str) -> Tuple[str, bool]:
         risk_detected = category == "crisis"
         
         # Get appropriate response
@@ -68,4 +105,28 @@ class ChatbotService:
         if risk_detected:
             response += "\n\nImmediate help:\n• National Suicide Prevention Lifeline: 988\n• Crisis Text Line: Text HOME to 741741\n• Emergency Services: 911"
         
-        return response, risk_detected
\ No newline at end of file
+        return response, risk_detected
+    
+    async def stream_response(
+        self,
+        message: str,
+        matches: Optional[MatchResult] = None,
+        chunk_words: int = 3,
+        category: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """Yield the response a few words at a time
+        
+        The chunks join back into exactly the ``respond`` text. Replies are
+        composed from templates, so the whole text exists before the first
+        chunk: chunking paces delivery but doesn't get the first words out
+        sooner. A generating model would yield here as it produces text.
+        Pass ``category`` from a prior ``classify`` to reuse it.
+        """
+        if category is None:
+            category = await self.classify(message, matches)
+        response, _ = self.compose_response(category)
+        words = WORD_PATTERN.findall(response)
+        for i in range(0, len(words), chunk_words):
+            yield "".join(words[i:i + chunk_words])
+            # Let the socket writer send this chunk before the next one
+            await asyncio.sleep(0)
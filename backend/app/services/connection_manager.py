@@ -0,0 +1,250 @@
+"""
+WebSocket connection manager with per-client outbound queues
+
+Each connected socket gets a bounded outbound queue drained by its own
+writer task, so a broadcast only enqueues and a slow client never delays
+the others. When a client's queue is full, broadcasts and direct replies
+alike apply the configured slow-consumer policy, so no sender ever waits on
+a client:
+
+* ``drop_oldest``  - discard the oldest queued message to make room
+* ``drop_newest``  - discard the message being broadcast
+* ``disconnect``   - evict the client (it can reconnect and catch up)
+
+Broadcasts and room messages go through a backplane (see
+``app.services.backplane``) so they also reach sockets held by other
+workers; the default in-process backplane delivers straight back here.
+Fan-out messages travel as JSON text and are re-encoded once per codec
+(see ``app.services.ws_codec``) for clients that negotiated another format.
+"""
+import asyncio
+import logging
+from typing import Any, Dict, Optional, Set, Union
+
+from fastapi import WebSocket
+from app.core.config import settings
+from app.services.backplane import Backplane, InProcessBackplane
+from app.services.ws_codec import json_codec
+
+logger = logging.getLogger(__name__)
+
+Message = Union[str, bytes]
+
+SLOW_CONSUMER_POLICIES = ("drop_oldest", "drop_newest", "disconnect")
+
+# Close code sent to evicted slow consumers ("try again later")
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+# Backplane channels
+BROADCAST_CHANNEL = "broadcast"
+ROOM_CHANNEL_PREFIX = "room:"
+
+
+class ClientConnection:
+    __slots__ = ("websocket", "codec", "queue", "writer", "dropped", "rooms")
+
+    def __init__(self, websocket: WebSocket, queue_size: int, codec=json_codec):
+        self.websocket = websocket
+        self.codec = codec
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.writer: Optional[asyncio.Task] = None
+        self.dropped = 0
+        self.rooms: Set[str] = set()
+
+
+class ConnectionManager:
+    def __init__(
+        self,
+        queue_size: int = 100,
+        slow_consumer_policy: str = "drop_oldest",
+        send_timeout: float = 10.0,
+        backplane: Optional[Backplane] = None
+    ):
+        if slow_consumer_policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"Unknown slow consumer policy: {slow_consumer_policy}")
+        self.queue_size = queue_size
+        self.slow_consumer_policy = slow_consumer_policy
+        self.send_timeout = send_timeout
+        self.active_connections: Dict[WebSocket, ClientConnection] = {}
+        # room id -> subscribed clients
+        self.rooms: Dict[str, Set[ClientConnection]] = {}
+
+        self.messages_sent = 0
+        self.messages_dropped = 0
+        self.clients_evicted = 0
+
+        self.backplane = backplane or InProcessBackplane()
+        self.backplane.attach(self.deliver)
+
+    async def use_backplane(self, backplane: Backplane):
+        """Swap in and start a cross-worker backplane"""
+        backplane.attach(self.deliver)
+        await backplane.start()
+        previous, self.backplane = self.backplane, backplane
+        await previous.stop()
+
+    async def connect(self, websocket: WebSocket, codec=json_codec, subprotocol: Optional[str] = None):
+        if subprotocol is None:
+            await websocket.accept()
+        else:
+            await websocket.accept(subprotocol=subprotocol)
+        self.register(websocket, codec)
+
+    def register(self, websocket: WebSocket, codec=json_codec) -> ClientConnection:
+        """Track an already-accepted socket and start its writer task"""
+        client = ClientConnection(websocket, self.queue_size, codec)
+        client.writer = asyncio.create_task(self._writer(client))
+        self.active_connections[websocket] = client
+        return client
+
+    def disconnect(self, websocket: WebSocket):
+        client = self.active_connections.pop(websocket, None)
+        if client is None:
+            return
+        for room_id in list(client.rooms):
+            self._leave(client, room_id)
+        if client.writer is not None and client.writer is not asyncio.current_task():
+            client.writer.cancel()
+
+    def join(self, websocket: WebSocket, room_id: str):
+        client = self.active_connections[websocket]
+        client.rooms.add(room_id)
+        self.rooms.setdefault(room_id, set()).add(client)
+
+    def leave(self, websocket: WebSocket, room_id: str):
+        client = self.active_connections.get(websocket)
+        if client is not None:
+            self._leave(client, room_id)
+
+    def _leave(self, client: ClientConnection, room_id: str):
+        client.rooms.discard(room_id)
+        members = self.rooms.get(room_id)
+        if members is not None:
+            members.discard(client)
+            if not members:
+                del self.rooms[room_id]
+
+    async def send_personal_message(self, message: Message, websocket: WebSocket):
+        """Queue a direct reply; a full queue gets the slow-consumer policy"""
+        client = self._live_client(websocket)
+        if client is not None:
+            self._offer(client, message)
+
+    async def send_payload(self, payload: Dict[str, Any], websocket: WebSocket):
+        """Queue a direct reply encoded with the client's negotiated codec"""
+        client = self._live_client(websocket)
+        if client is not None:
+            self._offer(client, client.codec.encode(payload))
+
+    def _live_client(self, websocket: WebSocket) -> Optional[ClientConnection]:
+        """The socket's client if it is registered and its writer still running"""
+        client = self.active_connections.get(websocket)
+        if client is not None and client.writer is not None and client.writer.done():
+            # Nothing would ever drain the queue again
+            self.disconnect(websocket)
+            return None
+        return client
+
+    async def broadcast(self, message: Message):
+        """Send ``message`` to every client in every worker"""
+        await self.backplane.publish(BROADCAST_CHANNEL, message)
+
+    async def publish(self, room_id: str, message: Message):
+        """Send ``message`` to the subscribers of one room in every worker"""
+        await self.backplane.publish(ROOM_CHANNEL_PREFIX + room_id, message)
+
+    def deliver(self, channel: str, message: Message):
+        """Fan a backplane message out to local sockets without awaiting any send
+
+        Text messages are JSON; each non-JSON codec re-encodes them once.
+        """
+        if channel == BROADCAST_CHANNEL:
+            clients = list(self.active_connections.values())
+        elif channel.startswith(ROOM_CHANNEL_PREFIX):
+            clients = list(self.rooms.get(channel[len(ROOM_CHANNEL_PREFIX):], ()))
+        else:
+            return
+        encoded: Dict[str, Message] = {json_codec.name: message}
+        for client in clients:
+            codec = client.codec
+            if isinstance(message, str) and codec.name not in encoded:
+                encoded[codec.name] = codec.from_json(message)
+            self._offer(client, encoded.get(codec.name, message))
+
+    def _offer(self, client: ClientConnection, message: Message):
+        try:
+            client.queue.put_nowait(message)
+            return
+        except asyncio.QueueFull:
+            pass
+
+        if self.slow_consumer_policy == "drop_oldest":
+            client.queue.get_nowait()
+            client.queue.put_nowait(message)
+            self._record_drop(client)
+        elif self.slow_consumer_policy == "drop_newest":
+            self._record_drop(client)
+        else:
+            self._evict(client)
+
+    def _record_drop(self, client: ClientConnection):
+        client.dropped += 1
+        self.messages_dropped += 1
+
+    def _evict(self, client: ClientConnection):
+        if client.websocket not in self.active_connections:
+            return
+        self.clients_evicted += 1
+        self.disconnect(client.websocket)
+        asyncio.create_task(self._close(client.websocket, SLOW_CONSUMER_CLOSE_CODE))
+
+    async def _close(self, websocket: WebSocket, code: int):
+        try:
+            await websocket.close(code=code)
+        except Exception:
+            # Socket already gone
+            pass
+
+    async def _writer(self, client: ClientConnection):
+        websocket = client.websocket
+        try:
+            while True:
+                message = await client.queue.get()
+                if isinstance(message, bytes):
+                    send = websocket.send_bytes(message)
+                else:
+                    send = websocket.send_text(message)
+                await asyncio.wait_for(send, self.send_timeout)
+                self.messages_sent += 1
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            logger.info("Evicting WebSocket client stalled for %.1fs", self.send_timeout)
+            self._evict(client)
+        except Exception:
+            # Peer went away mid-send; the receive loop will see the disconnect
+            self.disconnect(websocket)
+
+    def stats(self) -> Dict[str, Any]:
+        clients = list(self.active_connections.values())
+        codecs: Dict[str, int] = {}
+        for client in clients:
+            codecs[client.codec.name] = codecs.get(client.codec.name, 0) + 1
+        return {
+            "connections": len(clients),
+            "codecs": codecs,
+            "rooms": len(self.rooms),
+            "queued_messages": sum(client.queue.qsize() for client in clients),
+            "messages_sent": self.messages_sent,
+            "messages_dropped": self.messages_dropped,
+            "clients_evicted": self.clients_evicted,
+            "slow_consumer_policy": self.slow_consumer_policy,
+            "backplane": self.backplane.stats()
+        }
+
+
+manager = ConnectionManager(
+    queue_size=settings.WS_CLIENT_QUEUE_SIZE,
+    slow_consumer_policy=settings.WS_SLOW_CONSUMER_POLICY,
+    send_timeout=settings.WS_SEND_TIMEOUT_SECONDS
+)
@@ -0,0 +1,192 @@
+"""
+Single-pass multi-pattern matcher for crisis and concern keywords
+
+All trigger lists used by the chatbot and the risk escalation service are
+compiled into one Aho-Corasick automaton at import time, so a message is
+casefolded and scanned exactly once no matter how many keyword lists exist.
+
+Keywords must start at a word boundary. With ``prefixes=True`` (the crisis
+matcher) they may end inside a word, so inflections match the way plain
+substring search matched them: "hopeless" finds "hopelessness", "suicide"
+finds "suicides", "self-harm" finds "self-harming". Missing an inflected
+crisis term costs more than the odd false positive. Only the start
+boundary keeps "spills" from matching "pills".
+"""
+from collections import deque
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+
+# Keyword lists by category. Chatbot categories ("crisis", "anxiety",
+# "depression") and escalation triggers share one automaton.
+CHATBOT_KEYWORDS: Dict[str, List[str]] = {
+    "crisis": [
+        "suicide", "kill myself", "end my life", "want to die",
+        "hurt myself", "self-harm", "cutting", "overdose",
+        "hopeless", "no point", "better off dead"
+    ],
+    "anxiety": ["anxious", "anxiety", "worry", "worried", "worrying", "nervous", "panic"],
+    "depression": ["depressed", "depression", "sad", "hopeless", "empty"],
+}
+
+ESCALATION_TRIGGERS: Dict[str, List[str]] = {
+    "suicide_ideation": ["suicide", "suicidal", "kill myself", "end my life", "want to die"],
+    "self_harm": ["hurt myself", "cut myself", "self-harm", "cutting"],
+    "crisis_language": ["hopeless", "no point", "better off dead", "can't go on"],
+    "substance_abuse": ["overdose", "overdosed", "pills", "too many", "drinking too much"]
+}
+
+
+class Match(NamedTuple):
+    category: str
+    keyword: str
+    start: int  # offset into the original (non-casefolded) text
+    end: int
+
+
+class MatchResult:
+    """Every category hit for one scanned message"""
+
+    __slots__ = ("matches", "categories")
+
+    def __init__(self, matches: List[Match]):
+        self.matches = matches
+        self.categories = {m.category for m in matches}
+
+    def has(self, category: str) -> bool:
+        return category in self.categories
+
+    def by_category(self) -> Dict[str, List[Match]]:
+        grouped: Dict[str, List[Match]] = {}
+        for match in self.matches:
+            grouped.setdefault(match.category, []).append(match)
+        return grouped
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+
+class CrisisMatcher:
+    """Aho-Corasick automaton with word-boundary checks and Unicode casefolding"""
+
+    def __init__(self, keyword_lists: Dict[str, Iterable[str]], prefixes: bool = False):
+        # Match keywords as word prefixes instead of whole words
+        self.prefixes = prefixes
+        # goto[state] maps a character to the next state; outputs[state]
+        # holds the indexes of keywords ending at that state
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._outputs: List[List[int]] = [[]]
+        # keyword_index -> (folded keyword, [categories])
+        self._keywords: List[Tuple[str, List[str]]] = []
+        index_by_keyword: Dict[str, int] = {}
+
+        for category, keywords in keyword_lists.items():
+            for keyword in keywords:
+                folded = keyword.casefold()
+                if not folded:
+                    continue
+                if folded in index_by_keyword:
+                    categories = self._keywords[index_by_keyword[folded]][1]
+                    if category not in categories:
+                        categories.append(category)
+                    continue
+                index_by_keyword[folded] = len(self._keywords)
+                self._keywords.append((folded, [category]))
+                self._add(folded, index_by_keyword[folded])
+
+        self._build_failure_links()
+        self._build_transitions()
+
+    def _add(self, keyword: str, keyword_index: int):
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append([])
+                self._goto[state][char] = next_state
+            state = next_state
+        self._outputs[state].append(keyword_index)
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                if self._fail[next_state] == next_state:
+                    self._fail[next_state] = 0
+                self._outputs[next_state].extend(self._outputs[self._fail[next_state]])
+
+    def _build_transitions(self):
+        # Fold failure links into a full transition table over the keyword
+        # alphabet so the scan loop does one dict lookup per character
+        self._delta: List[Dict[str, int]] = [dict(self._goto[0])]
+        queue = deque(self._goto[0].values())
+        order = []
+        while queue:
+            state = queue.popleft()
+            order.append(state)
+            queue.extend(self._goto[state].values())
+        self._delta.extend({} for _ in range(len(self._goto) - 1))
+        for state in order:
+            transitions = dict(self._delta[self._fail[state]])
+            transitions.update(self._goto[state])
+            self._delta[state] = transitions
+
+    def scan(self, text: str) -> MatchResult:
+        """Return every keyword hit in ``text`` in one linear pass
+
+        Hits start at a word boundary and, unless ``prefixes``, end at one.
+        """
+        folded = text.casefold()
+        if len(folded) == len(text):
+            offsets = None
+        else:
+            # Casefolding changed lengths (e.g. "ß" -> "ss"); map each folded
+            # character back to its source position
+            folded_chars = []
+            offsets = []
+            for position, char in enumerate(text):
+                for folded_char in char.casefold():
+                    folded_chars.append(folded_char)
+                    offsets.append(position)
+            folded = "".join(folded_chars)
+
+        delta = self._delta
+        outputs = self._outputs
+        keywords = self._keywords
+        length = len(folded)
+        whole_words = not self.prefixes
+        matches: List[Match] = []
+        state = 0
+
+        for position, char in enumerate(folded):
+            state = delta[state].get(char, 0)
+            if not outputs[state]:
+                continue
+            for keyword_index in outputs[state]:
+                keyword, categories = keywords[keyword_index]
+                start = position - len(keyword) + 1
+                if start > 0 and _is_word_char(folded[start - 1]) and _is_word_char(keyword[0]):
+                    continue
+                if whole_words and position + 1 < length \
+                        and _is_word_char(folded[position + 1]) and _is_word_char(keyword[-1]):
+                    continue
+                if offsets is None:
+                    span = (start, position + 1)
+                else:
+                    span = (offsets[start], offsets[position] + 1)
+                for category in categories:
+                    matches.append(Match(category, keyword, span[0], span[1]))
+
+        return MatchResult(matches)
+
+
+crisis_matcher = CrisisMatcher({**CHATBOT_KEYWORDS, **ESCALATION_TRIGGERS}, prefixes=True)
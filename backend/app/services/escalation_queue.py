@@ -0,0 +1,333 @@
+"""
+Durable priority queue for risk escalations, drained by a worker pool
+
+Escalated chat turns are inserted into the ``escalations`` table and
+committed before the chat reply goes out, so nothing is lost if the process
+dies. Workers claim one row at a time with a single conditional UPDATE:
+
+* claim order is priority (``urgent`` < ``high`` < ``normal``), then
+  enqueue time
+* a claim leases the row until ``visible_at`` (now + visibility timeout);
+  a worker that dies or hangs mid-item lets the lease run out and the row
+  is delivered again (at-least-once, so handlers must tolerate repeats)
+* failures are retried with a growing delay, then parked as ``failed``
+
+Every worker takes urgent items first, and ``urgent_workers`` more take
+*only* urgent items, so an urgent escalation never waits behind a backlog
+of normal ones even while every general worker is busy.
+"""
+import asyncio
+import logging
+import secrets
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+from sqlalchemy import func, select, update
+from app.core.config import settings
+from app.db.base import AsyncSessionLocal
+from app.db.models.escalation import CLAIMABLE_ESCALATION, Escalation
+from app.services.risk_escalation import RiskEscalationService
+
+logger = logging.getLogger(__name__)
+
+PRIORITIES = {"urgent": 0, "high": 1, "normal": 2}
+PRIORITY_NAMES = {code: name for name, code in PRIORITIES.items()}
+
+# Columns handed to workers
+CLAIM_COLUMNS = (
+    Escalation.id,
+    Escalation.session_id,
+    Escalation.risk_level,
+    Escalation.priority,
+    Escalation.content_summary,
+    Escalation.actions_taken,
+    Escalation.attempts,
+    Escalation.enqueued_at,
+    Escalation.lease_token
+)
+
+
+class EscalationQueue:
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        visibility_timeout: float = settings.ESCALATION_VISIBILITY_TIMEOUT_SECONDS,
+        max_attempts: int = settings.ESCALATION_MAX_ATTEMPTS,
+        retry_delay: float = 5.0
+    ):
+        self.session_factory = session_factory
+        self.visibility_timeout = timedelta(seconds=visibility_timeout)
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.risk_service = RiskEscalationService()
+        self._work_available = asyncio.Event()
+
+        self.enqueued = {name: 0 for name in PRIORITIES}
+        self.completed = 0
+        self.retried = 0
+        self.dead = 0
+
+    async def enqueue(
+        self,
+        session_id: str,
+        risk_level: str,
+        priority: str,
+        content: str,
+        actions_taken: List[str]
+    ) -> int:
+        """Store an escalation and wake idle workers; returns once committed"""
+        entry = self.risk_service.log_escalation(session_id, risk_level, content, actions_taken)
+        row = Escalation(
+            session_id=session_id,
+            risk_level=risk_level,
+            priority=PRIORITIES[priority],
+            content_summary=entry["content_summary"],
+            actions_taken=actions_taken
+        )
+        async with self.session_factory() as db:
+            db.add(row)
+            await db.commit()
+        self.enqueued[priority] += 1
+        self._work_available.set()
+        return row.id
+
+    async def escalate(self, session_id: str, content: str, risk_level: str, escalate: bool) -> bool:
+        """Queue a chat turn if its assessment calls for follow-up
+
+        Returns whether it was escalated, i.e. queued ahead of routine
+        follow-ups.
+        """
+        priority = self.risk_service.escalation_priority(risk_level, escalate)
+        if priority is None:
+            return False
+        actions = self.risk_service.get_escalation_actions(risk_level)
+        await self.enqueue(session_id, risk_level, priority, content, actions["immediate_actions"])
+        return priority != "normal"
+
+    async def claim(self, priorities: Sequence[int] = tuple(PRIORITY_NAMES)) -> Optional[Any]:
+        """Lease the next visible item among ``priorities``, or None"""
+        now = datetime.utcnow()
+        visible = (CLAIMABLE_ESCALATION, Escalation.visible_at <= now)
+        candidate = (
+            select(Escalation.id)
+            .where(*visible, Escalation.priority.in_(priorities))
+            .order_by(Escalation.priority, Escalation.enqueued_at, Escalation.id)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        async with self.session_factory() as db:
+            result = await db.execute(
+                update(Escalation)
+                .where(Escalation.id == candidate, *visible)
+                .values(
+                    status="processing",
+                    attempts=Escalation.attempts + 1,
+                    lease_token=secrets.token_hex(8),
+                    visible_at=now + self.visibility_timeout
+                )
+                .returning(Escalation.id)
+            )
+            # Read the row back rather than RETURNING it: result types for a
+            # RETURNING statement first run concurrently can be cached
+            # untyped, leaving datetimes and JSON as strings
+            claimed_id = result.scalar()
+            item = None
+            if claimed_id is not None:
+                item = (await db.execute(select(*CLAIM_COLUMNS).where(Escalation.id == claimed_id))).first()
+            await db.commit()
+        return item
+
+    async def complete(self, item: Any, actions_taken: List[str]) -> bool:
+        """Acknowledge a claimed item; False if its lease was lost meanwhile"""
+        done = await self._settle(
+            item,
+            status="done",
+            actions_taken=actions_taken,
+            completed_at=datetime.utcnow()
+        )
+        if done:
+            self.completed += 1
+        return done
+
+    async def fail(self, item: Any, error: str) -> bool:
+        """Release a claimed item for a later retry, or park it after too many attempts"""
+        if item.attempts >= self.max_attempts:
+            self.dead += 1
+            return await self._settle(item, status="failed", last_error=error)
+        self.retried += 1
+        retry_at = datetime.utcnow() + timedelta(seconds=self.retry_delay * item.attempts)
+        return await self._settle(item, status="pending", visible_at=retry_at, last_error=error)
+
+    async def _settle(self, item: Any, **values) -> bool:
+        async with self.session_factory() as db:
+            result = await db.execute(
+                update(Escalation)
+                .where(
+                    Escalation.id == item.id,
+                    Escalation.lease_token == item.lease_token,
+                    Escalation.status == "processing"
+                )
+                .values(lease_token=None, **values)
+            )
+            await db.commit()
+        return result.rowcount == 1
+
+    async def wait_for_work(self, timeout: float):
+        """Sleep until something is enqueued in this process or ``timeout`` passes"""
+        try:
+            await asyncio.wait_for(self._work_available.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def clear_wakeup(self):
+        self._work_available.clear()
+
+    async def backlog(self) -> Dict[str, Dict[str, Any]]:
+        """Unfinished items per priority and the age of the oldest, in seconds"""
+        async with self.session_factory() as db:
+            result = await db.execute(
+                select(Escalation.priority, func.count(), func.min(Escalation.enqueued_at))
+                .where(CLAIMABLE_ESCALATION)
+                .group_by(Escalation.priority)
+            )
+            rows = result.all()
+        now = datetime.utcnow()
+        backlog = {name: {"depth": 0, "oldest_age_seconds": 0.0} for name in PRIORITIES}
+        for priority, depth, oldest in rows:
+            backlog[PRIORITY_NAMES[priority]] = {
+                "depth": depth,
+                "oldest_age_seconds": round((now - oldest).total_seconds(), 3)
+            }
+        return backlog
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enqueued": dict(self.enqueued),
+            "completed": self.completed,
+            "retried": self.retried,
+            "failed": self.dead
+        }
+
+
+async def log_counselor_notifier(item: Any):
+    """Default notification: a log line without message content"""
+    logger.warning(
+        "Escalation %s (%s, risk %s) needs counselor follow-up",
+        item.id, PRIORITY_NAMES[item.priority], item.risk_level
+    )
+
+
+class EscalationWorkerPool:
+    def __init__(
+        self,
+        queue: EscalationQueue,
+        notify: Callable[[Any], Awaitable[None]] = log_counselor_notifier,
+        workers: int = settings.ESCALATION_WORKERS,
+        urgent_workers: int = settings.ESCALATION_URGENT_WORKERS,
+        poll_interval: float = settings.ESCALATION_POLL_SECONDS
+    ):
+        self.queue = queue
+        self.notify = notify
+        self.workers = workers
+        self.urgent_workers = urgent_workers
+        self.poll_interval = poll_interval
+        self._tasks: List[asyncio.Task] = []
+
+        self.processed = 0
+        self.errors = 0
+        self.redelivered = 0
+        # Time from enqueue to claim, per priority
+        self._waits = {name: [0, 0.0, 0.0] for name in PRIORITIES}  # count, total ms, max ms
+
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    async def start(self):
+        if self.running:
+            return
+        everything = tuple(PRIORITY_NAMES)
+        urgent_only = (PRIORITIES["urgent"],)
+        self._tasks = [
+            asyncio.create_task(self._worker(everything)) for _ in range(self.workers)
+        ] + [
+            asyncio.create_task(self._worker(urgent_only)) for _ in range(self.urgent_workers)
+        ]
+
+    async def stop(self):
+        """Stop the workers; items they were holding are redelivered after their lease"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self, priorities: Sequence[int]):
+        while True:
+            self.queue.clear_wakeup()
+            try:
+                item = await self.queue.claim(priorities)
+            except Exception:
+                logger.exception("Escalation claim failed")
+                item = None
+            if item is None:
+                await self.queue.wait_for_work(self.poll_interval)
+                continue
+            try:
+                await self.process(item)
+            except Exception:
+                # The lease runs out and the item is delivered again
+                logger.exception("Escalation %s could not be settled", item.id)
+
+    async def process(self, item: Any):
+        self._record_wait(item)
+        if item.attempts > self.queue.max_attempts:
+            # Lease ran out too often; whatever happened, stop redelivering
+            await self.queue.fail(item, "lease expired too many times")
+            return
+        try:
+            await self.notify(item)
+        except Exception as exc:
+            self.errors += 1
+            logger.exception("Escalation %s failed", item.id)
+            await self.queue.fail(item, repr(exc))
+            return
+        actions = list(item.actions_taken or [])
+        actions.append(f"Counselors notified at {datetime.utcnow().isoformat()}")
+        await self.queue.complete(item, actions)
+        self.processed += 1
+
+    def _record_wait(self, item: Any):
+        if item.attempts > 1:
+            self.redelivered += 1
+            return
+        wait_ms = (datetime.utcnow() - item.enqueued_at).total_seconds() * 1000
+        waits = self._waits[PRIORITY_NAMES[item.priority]]
+        waits[0] += 1
+        waits[1] += wait_ms
+        waits[2] = max(waits[2], wait_ms)
+
+    async def stats(self) -> Dict[str, Any]:
+        """Worker counters plus the current backlog, which costs one query"""
+        return {
+            "running": self.running,
+            "workers": self.workers,
+            "urgent_workers": self.urgent_workers,
+            "processed": self.processed,
+            "errors": self.errors,
+            "redelivered": self.redelivered,
+            "queue_wait_ms": {
+                name: {
+                    "count": count,
+                    "avg": round(total / count, 2) if count else 0.0,
+                    "max": round(longest, 2)
+                }
+                for name, (count, total, longest) in self._waits.items()
+            },
+            "queue": self.queue.stats(),
+            "backlog": await self.queue.backlog()
+        }
+
+
+escalation_queue = EscalationQueue()
+escalation_workers = EscalationWorkerPool(escalation_queue)
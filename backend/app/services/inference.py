@@ -0,0 +1,378 @@
+"""
+Pluggable chatbot inference with micro-batching
+
+A backend turns a batch of messages into reply categories (the keys of
+``ChatbotService.responses``). ``run_batch`` is the only method the
+scheduler calls, so a backend can compute locally in a thread or await a
+remote service.
+
+``MicroBatcher`` sits in front of the backend. Concurrent ``/chat/ai`` and
+``/ws/chat`` turns each ``predict`` one message; the scheduler takes the
+first waiting message, gathers more for at most ``max_wait_ms`` or until
+``max_batch``, and runs them through the backend as one batch. Up to the
+backend's ``max_concurrency`` batches run at once (one for local models,
+the connection pool size for a remote model server). Under light
+load (the previous batch was a single message) a lone message goes straight
+through instead of waiting. When ``max_queue`` messages are already
+waiting, a result takes longer than ``timeout``, or the backend fails,
+``predict`` raises ``InferenceUnavailable`` and the chatbot answers from
+its keyword path.
+"""
+import asyncio
+import logging
+import re
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from typing import Any, Dict, List, Optional, Sequence, Set
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.crisis_matcher import CHATBOT_KEYWORDS
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+
+
+class InferenceUnavailable(Exception):
+    """No model answer in time; use the keyword path"""
+
+
+class InferenceBackend:
+    name = "base"
+    # Batches the micro-batcher may have in flight at once
+    max_concurrency = 1
+
+    async def start(self):
+        """Acquire long-lived resources (threads, connection pools)"""
+
+    async def run_batch(self, texts: Sequence[str]) -> List[str]:
+        """One reply category per text, in order
+
+        Raise ``InferenceUnavailable`` to refuse a batch without it being
+        logged as an error.
+        """
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+
+class LocalBackend(InferenceBackend):
+    """Runs ``predict_batch`` on a dedicated thread, one batch at a time"""
+
+    def __init__(self):
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def predict_batch(self, texts: Sequence[str]) -> List[str]:
+        raise NotImplementedError
+
+    async def run_batch(self, texts: Sequence[str]) -> List[str]:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"inference-{self.name}")
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self.predict_batch, list(texts))
+
+    async def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+def text_features(text: str) -> List[str]:
+    """Lowercased unigrams and bigrams"""
+    tokens = TOKEN_PATTERN.findall(text.lower())
+    return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+
+class NumpyClassifierBackend(LocalBackend):
+    """Hashed n-gram embedding bag -> tanh hidden layer -> category logits
+
+    Weights come from an ``.npz`` with ``embeddings`` (features x hidden),
+    ``hidden``/``hidden_bias``, ``output``/``output_bias`` and ``labels``.
+    A batch is pooled with one ``reduceat`` and scored with two matrix
+    products, so the per-message cost falls as the batch grows.
+    """
+    name = "numpy"
+
+    def __init__(
+        self,
+        embeddings: np.ndarray,
+        hidden: np.ndarray,
+        hidden_bias: np.ndarray,
+        output: np.ndarray,
+        output_bias: np.ndarray,
+        labels: Sequence[str]
+    ):
+        super().__init__()
+        self.dim = embeddings.shape[0]
+        # Extra zero row for messages without any features
+        self.embeddings = np.vstack([embeddings, np.zeros((1, embeddings.shape[1]), embeddings.dtype)])
+        self.hidden = hidden
+        self.hidden_bias = hidden_bias
+        self.output = output
+        self.output_bias = output_bias
+        self.labels = [str(label) for label in labels]
+
+    @classmethod
+    def load(cls, path: str) -> "NumpyClassifierBackend":
+        with np.load(path) as data:
+            return cls(
+                data["embeddings"].astype(np.float32),
+                data["hidden"].astype(np.float32),
+                data["hidden_bias"].astype(np.float32),
+                data["output"].astype(np.float32),
+                data["output_bias"].astype(np.float32),
+                data["labels"].tolist()
+            )
+
+    def save(self, path: str):
+        np.savez_compressed(
+            path,
+            embeddings=self.embeddings[:-1],
+            hidden=self.hidden,
+            hidden_bias=self.hidden_bias,
+            output=self.output,
+            output_bias=self.output_bias,
+            labels=np.array(self.labels)
+        )
+
+    @classmethod
+    def from_keywords(
+        cls,
+        keywords: Dict[str, List[str]] = CHATBOT_KEYWORDS,
+        dim: int = 2 ** 14
+    ) -> "NumpyClassifierBackend":
+        """A model that reproduces the keyword lists, for when no trained file is configured"""
+        labels = ["general", *keywords]
+        size = len(labels)
+        embeddings = np.zeros((dim, size), np.float32)
+        for column, category in enumerate(labels[1:], start=1):
+            for keyword in keywords[category]:
+                tokens = TOKEN_PATTERN.findall(keyword.lower())
+                # Single words by themselves, phrases by their bigrams
+                phrase = tokens if len(tokens) == 1 else [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+                for feature in phrase:
+                    embeddings[cls.feature_id(feature, dim), column] = 1.0
+        output_bias = np.zeros(size, np.float32)
+        output_bias[0] = 0.01
+        return cls(
+            embeddings,
+            np.eye(size, dtype=np.float32),
+            np.zeros(size, np.float32),
+            np.eye(size, dtype=np.float32),
+            output_bias,
+            labels
+        )
+
+    @staticmethod
+    def feature_id(feature: str, dim: int) -> int:
+        # crc32 rather than hash(): stable across processes and restarts
+        return zlib.crc32(feature.encode()) % dim
+
+    def logits(self, texts: Sequence[str]) -> np.ndarray:
+        ids = [[self.feature_id(f, self.dim) for f in text_features(text)] or [self.dim] for text in texts]
+        lengths = np.fromiter((len(row) for row in ids), np.int64, len(ids))
+        flat = np.fromiter(chain.from_iterable(ids), np.int64, int(lengths.sum()))
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        pooled = np.add.reduceat(self.embeddings[flat], starts, axis=0) / lengths[:, None]
+        hidden = np.tanh(pooled @ self.hidden + self.hidden_bias)
+        return hidden @ self.output + self.output_bias
+
+    def predict_batch(self, texts: Sequence[str]) -> List[str]:
+        return [self.labels[i] for i in self.logits(texts).argmax(axis=1)]
+
+
+def create_inference_backend(name: str, model_path: Optional[str] = None) -> Optional[InferenceBackend]:
+    """The configured backend, or None for the keyword path only"""
+    if name == "keyword":
+        return None
+    if name == "numpy":
+        if model_path:
+            return NumpyClassifierBackend.load(model_path)
+        return NumpyClassifierBackend.from_keywords()
+    if name == "remote":
+        from app.services.remote_inference import RemoteModelBackend
+        if not settings.CHAT_MODEL_URL:
+            raise ValueError("CHAT_MODEL_URL is required for the remote backend")
+        return RemoteModelBackend(settings.CHAT_MODEL_URL)
+    raise ValueError(f"Unsupported inference backend: {name}")
+
+
+class MicroBatcher:
+    def __init__(
+        self,
+        max_batch: int = settings.CHAT_MODEL_MAX_BATCH,
+        max_wait_ms: float = settings.CHAT_MODEL_MAX_WAIT_MS,
+        max_queue: int = settings.CHAT_MODEL_MAX_QUEUE,
+        timeout: float = settings.CHAT_MODEL_TIMEOUT_SECONDS
+    ):
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.backend: Optional[InferenceBackend] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._arrived: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._in_flight: Set[asyncio.Task] = set()
+        self._last_batch_size = 0
+
+        self.requests = 0
+        self.batches = 0
+        self.batched_items = 0
+        self.largest_batch = 0
+        self.overloaded = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.refused = 0
+        self._total_batch_ms = 0.0
+        self.max_batch_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self, backend: InferenceBackend):
+        if self.running:
+            return
+        self.backend = backend
+        await backend.start()
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._arrived = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        for task in self._in_flight:
+            task.cancel()
+        await asyncio.gather(*self._in_flight, return_exceptions=True)
+        while not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(InferenceUnavailable("stopped"))
+        await self.backend.close()
+
+    async def predict(self, text: str) -> str:
+        if not self.running:
+            raise InferenceUnavailable("not running")
+        self.requests += 1
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((text, future))
+        except asyncio.QueueFull:
+            self.overloaded += 1
+            raise InferenceUnavailable("overloaded")
+        self._arrived.set()
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            # Nobody will read the late result or error
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            raise InferenceUnavailable("timeout")
+
+    async def _collect(self) -> List[Any]:
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            # Lone requests under light load don't wait for company
+            if len(batch) == 1 and self._last_batch_size <= 1:
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self._arrived.clear()
+            try:
+                await asyncio.wait_for(self._arrived.wait(), remaining)
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        # Up to ``max_concurrency`` batches in flight; while every slot is
+        # taken, requests keep queueing and the next batch grows
+        slots = asyncio.Semaphore(max(1, self.backend.max_concurrency))
+        while True:
+            await slots.acquire()
+            try:
+                batch = await self._collect()
+            except BaseException:
+                slots.release()
+                raise
+            task = asyncio.create_task(self._dispatch(batch))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+            task.add_done_callback(lambda _: slots.release())
+
+    async def _dispatch(self, batch: List[Any]):
+        started = time.perf_counter()
+        try:
+            labels = await self.backend.run_batch([text for text, _ in batch])
+        except asyncio.CancelledError:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(InferenceUnavailable("stopped"))
+            raise
+        except Exception as exc:
+            if isinstance(exc, InferenceUnavailable):
+                self.refused += 1
+            else:
+                self.errors += 1
+                logger.exception("Inference batch of %d failed", len(batch))
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(InferenceUnavailable(repr(exc)))
+            return
+        for (_, future), label in zip(batch, labels):
+            if not future.done():
+                future.set_result(label)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self._last_batch_size = len(batch)
+        self.batches += 1
+        self.batched_items += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        self._total_batch_ms += elapsed_ms
+        self.max_batch_ms = max(self.max_batch_ms, elapsed_ms)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "backend": self.backend.name if self.backend else None,
+            "requests": self.requests,
+            "batches": self.batches,
+            "avg_batch_size": round(self.batched_items / self.batches, 2) if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+            "avg_batch_ms": round(self._total_batch_ms / self.batches, 3) if self.batches else 0.0,
+            "max_batch_ms": round(self.max_batch_ms, 3),
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "in_flight": len(self._in_flight),
+            "max_concurrency": self.backend.max_concurrency if self.backend else 0,
+            "fallbacks": {
+                "overloaded": self.overloaded,
+                "timeouts": self.timeouts,
+                "errors": self.errors,
+                "refused_by_backend": self.refused
+            },
+            "backend_stats": self.backend.stats() if self.backend else {}
+        }
+
+
+chat_inference = MicroBatcher()
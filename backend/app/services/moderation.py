@@ -0,0 +1,321 @@
+"""
+Peer chat moderation, mostly off the request path
+
+* fast path: ``check`` runs on send, with one scan of the compiled
+  moderation matcher. Messages that are obviously unsafe (urging someone to
+  harm themselves, asking for methods) are stored already flagged and never
+  pushed to the room. The sender is told so, and a sender in crisis is
+  escalated to a counselor (``app.services.peer_chat``).
+* everything else is stored with ``is_moderated=False``, pushed at once,
+  and its id queued. Workers drain the queue in batches: one query loads
+  the batch, the matcher plus an optional classifier (selected by
+  ``PEER_MODERATION_CLASSIFIER``) score it, and two
+  UPDATEs (flagged / clean) settle it in one commit. Flagged messages drop
+  out of history and catch-up, and rooms get a ``peer_message_removed``
+  event so connected clients can hide them.
+
+The database flag is the durable record. Ids that don't fit in the queue,
+or were queued when the process stopped, are found again by a periodic
+sweep for old unmoderated rows. Moderation lag is measured from the
+message's ``created_at`` to the commit that settles it.
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Deque, Dict, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import select, update
+from app.core.config import settings
+from app.db.base import AsyncSessionLocal
+from app.db.models.chat import PeerChat
+from app.services.connection_manager import manager
+from app.services.crisis_matcher import CrisisMatcher
+from app.services.inference import NumpyClassifierBackend
+
+logger = logging.getLogger(__name__)
+
+# Blocked on send: never shown to the room
+MODERATION_BLOCK: Dict[str, List[str]] = {
+    "incitement": [
+        "kill yourself", "kys", "go die", "you should die", "hope you die",
+        "just do it already", "nobody would miss you"
+    ],
+    "method_seeking": [
+        "how to kill myself", "best way to die", "painless way to die",
+        "lethal dose", "how many pills would"
+    ],
+}
+
+# Flagged by the background stage
+MODERATION_FLAG: Dict[str, List[str]] = {
+    # Aimed at someone else; "I feel so stupid" is what the rooms are for
+    "abuse": [
+        "you idiot", "you're an idiot", "you're stupid", "you are stupid", "you loser",
+        "you're pathetic", "you are pathetic", "shut up", "nobody cares about you"
+    ],
+    "contact_sharing": ["whatsapp", "telegram", "snapchat", "dm me", "text me at", "my number is"],
+    "spam": ["buy now", "click here", "free money", "promo code", "discount code"],
+}
+
+moderation_matcher = CrisisMatcher({**MODERATION_BLOCK, **MODERATION_FLAG})
+
+LAG_WINDOW = 1024
+
+
+class ModerationClassifier:
+    """Optional second opinion for messages the matcher lets through"""
+    name = "base"
+
+    async def unsafe_probabilities(self, texts: Sequence[str]) -> List[float]:
+        raise NotImplementedError
+
+
+class NumpyModerationClassifier(ModerationClassifier):
+    """Softmax probability of the ``unsafe`` label from a chatbot-format model
+
+    Any ``NumpyClassifierBackend`` file works as long as one of its labels
+    is ``unsafe``. Batches are scored on a worker thread.
+    """
+    name = "numpy"
+
+    def __init__(self, model: NumpyClassifierBackend, unsafe_label: str = "unsafe"):
+        if unsafe_label not in model.labels:
+            raise ValueError(f"Moderation model has no {unsafe_label!r} label: {model.labels}")
+        self.model = model
+        self.column = model.labels.index(unsafe_label)
+
+    def probabilities(self, texts: Sequence[str]) -> List[float]:
+        logits = self.model.logits(texts)
+        weights = np.exp(logits - logits.max(axis=1, keepdims=True))
+        return (weights[:, self.column] / weights.sum(axis=1)).tolist()
+
+    async def unsafe_probabilities(self, texts: Sequence[str]) -> List[float]:
+        return await asyncio.to_thread(self.probabilities, list(texts))
+
+
+def create_moderation_classifier(name: str, model_path: Optional[str] = None) -> Optional[ModerationClassifier]:
+    """The configured classifier, or None for the matcher only"""
+    if name == "none":
+        return None
+    if name == "numpy":
+        if not model_path:
+            raise ValueError("PEER_MODERATION_MODEL_PATH is required for the numpy classifier")
+        return NumpyModerationClassifier(NumpyClassifierBackend.load(model_path))
+    raise ValueError(f"Unsupported moderation classifier: {name}")
+
+
+class PeerModerator:
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        classifier: Optional[ModerationClassifier] = None,
+        threshold: float = settings.PEER_MODERATION_THRESHOLD,
+        workers: int = settings.PEER_MODERATION_WORKERS,
+        batch_size: int = settings.PEER_MODERATION_BATCH_SIZE,
+        max_wait_ms: float = settings.PEER_MODERATION_MAX_WAIT_MS,
+        max_queue: int = settings.PEER_MODERATION_MAX_QUEUE,
+        sweep_interval: float = settings.PEER_MODERATION_SWEEP_SECONDS
+    ):
+        self.session_factory = session_factory
+        self.classifier = classifier
+        self.threshold = threshold
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue = max_queue
+        self.sweep_interval = sweep_interval
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._lags: Deque[float] = deque(maxlen=LAG_WINDOW)
+
+        self.blocked = 0
+        self.queued = 0
+        self.overflowed = 0
+        self.swept = 0
+        self.moderated = 0
+        self.flagged = 0
+        self.batches = 0
+        self.classifier_errors = 0
+        self.max_lag_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    async def start(self, classifier: Optional[ModerationClassifier] = None):
+        if self.running:
+            return
+        if classifier is not None:
+            self.classifier = classifier
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._sweeper()))
+
+    async def stop(self):
+        """Stop the workers; unfinished ids are picked up by the next sweep"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def check(self, text: str) -> Optional[str]:
+        """Synchronous fast path: the blocking category ``text`` hits, if any"""
+        for match in moderation_matcher.scan(text).matches:
+            if match.category in MODERATION_BLOCK:
+                self.blocked += 1
+                return match.category
+        return None
+
+    def submit(self, message_id: int):
+        """Queue a stored message for moderation; never waits"""
+        if not self.running:
+            return
+        try:
+            self._queue.put_nowait(message_id)
+        except asyncio.QueueFull:
+            # Still unmoderated in the database; the sweep will find it
+            self.overflowed += 1
+            return
+        self.queued += 1
+
+    async def moderate(self, message_ids: Sequence[int]) -> List[int]:
+        """Settle a batch of unmoderated messages; returns the flagged ids"""
+        async with self.session_factory() as db:
+            result = await db.execute(
+                select(PeerChat.id, PeerChat.room_id, PeerChat.message, PeerChat.created_at)
+                .where(PeerChat.id.in_(message_ids), PeerChat.is_moderated == False)
+            )
+            rows = result.all()
+            if not rows:
+                return []
+
+            flagged = {row.id for row in rows if moderation_matcher.scan(row.message or "").matches}
+            unsure = [row for row in rows if row.id not in flagged]
+            if self.classifier is not None and unsure:
+                try:
+                    probabilities = await self.classifier.unsafe_probabilities([row.message or "" for row in unsure])
+                except Exception:
+                    # Matcher verdicts still stand
+                    self.classifier_errors += 1
+                    logger.exception("Moderation classifier failed on %d messages", len(unsure))
+                else:
+                    flagged.update(row.id for row, p in zip(unsure, probabilities) if p >= self.threshold)
+
+            clean = [row.id for row in rows if row.id not in flagged]
+            if flagged:
+                await db.execute(
+                    update(PeerChat)
+                    .where(PeerChat.id.in_(sorted(flagged)), PeerChat.is_moderated == False)
+                    .values(is_moderated=True, is_flagged=True)
+                )
+            if clean:
+                await db.execute(
+                    update(PeerChat)
+                    .where(PeerChat.id.in_(clean), PeerChat.is_moderated == False)
+                    .values(is_moderated=True)
+                )
+            await db.commit()
+
+        now = datetime.utcnow()
+        for row in rows:
+            if row.created_at is not None:
+                lag_ms = (now - row.created_at.replace(tzinfo=None)).total_seconds() * 1000
+                self._lags.append(lag_ms)
+                self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+        self.batches += 1
+        self.moderated += len(rows)
+        self.flagged += len(flagged)
+
+        for row in rows:
+            if row.id in flagged:
+                await manager.publish(row.room_id, json.dumps({"type": "peer_message_removed", "id": row.id}))
+        return sorted(flagged)
+
+    async def sweep(self) -> int:
+        """Queue unmoderated messages older than one sweep interval
+
+        Waits for room in the queue rather than dropping ids, so call it
+        from a background task.
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=self.sweep_interval)
+        swept = 0
+        last_id = 0
+        while True:
+            async with self.session_factory() as db:
+                result = await db.execute(
+                    select(PeerChat.id)
+                    .where(PeerChat.is_moderated == False, PeerChat.created_at <= cutoff, PeerChat.id > last_id)
+                    .order_by(PeerChat.id)
+                    .limit(self.max_queue)
+                )
+                message_ids = result.scalars().all()
+            for message_id in message_ids:
+                await self._queue.put(message_id)
+            swept += len(message_ids)
+            self.swept += len(message_ids)
+            if len(message_ids) < self.max_queue:
+                return swept
+            last_id = message_ids[-1]
+
+    async def _collect(self) -> List[int]:
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _worker(self):
+        while True:
+            batch = await self._collect()
+            try:
+                await self.moderate(batch)
+            except Exception:
+                # Left unmoderated; the sweep retries it
+                logger.exception("Moderation batch of %d failed", len(batch))
+
+    async def _sweeper(self):
+        while True:
+            try:
+                await self.sweep()
+            except Exception:
+                logger.exception("Moderation sweep failed")
+            await asyncio.sleep(self.sweep_interval)
+
+    def stats(self) -> Dict[str, Any]:
+        lags = sorted(self._lags)
+        return {
+            "running": self.running,
+            "workers": self.workers,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "blocked_on_send": self.blocked,
+            "queued": self.queued,
+            "overflowed": self.overflowed,
+            "swept": self.swept,
+            "moderated": self.moderated,
+            "flagged": self.flagged,
+            "batches": self.batches,
+            "avg_batch_size": round(self.moderated / self.batches, 2) if self.batches else 0.0,
+            "classifier": self.classifier.name if self.classifier else None,
+            "classifier_errors": self.classifier_errors,
+            "lag_ms": {
+                "p50": round(lags[len(lags) // 2], 2) if lags else 0.0,
+                "p95": round(lags[int(len(lags) * 0.95)], 2) if lags else 0.0,
+                "max": round(self.max_lag_ms, 2)
+            }
+        }
+
+
+peer_moderator = PeerModerator()
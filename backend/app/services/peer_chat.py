@@ -0,0 +1,100 @@
+"""
+Peer support rooms: persistence, catch-up and push to room subscribers
+"""
+import json
+from typing import Any, Dict, List, Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.models.chat import PeerChat
+from app.db.write_behind import chat_write_behind
+from app.services.connection_manager import manager
+from app.services.escalation_queue import escalation_queue
+from app.services.moderation import peer_moderator
+from app.services.risk_escalation import RiskEscalationService
+
+# Blocked categories that say the sender is in crisis
+CRISIS_BLOCK_CATEGORIES = frozenset({"method_seeking"})
+
+class PeerChatService:
+    def __init__(self, catch_up_limit: int = 200):
+        # Most messages replayed to a subscriber on join
+        self.catch_up_limit = catch_up_limit
+        self.risk_service = RiskEscalationService()
+
+    def serialize(self, message: PeerChat) -> Dict[str, Any]:
+        """Anonymized representation shared by REST and WebSocket clients"""
+        return {
+            "id": message.id,
+            "room_id": message.room_id,
+            "message": message.message,
+            "created_at": message.created_at.isoformat() if message.created_at else None,
+            "session_id": message.session_id[:8] + "..."  # Anonymize
+        }
+
+    async def save(self, db: AsyncSession, room_id: str, session_id: str, text: str) -> PeerChat:
+        """Persist a message once; the returned row always has its id
+        
+        Obviously unsafe messages are stored already flagged (don't publish
+        them); the rest are queued for background moderation. A blocked
+        message from someone in crisis (asking for methods, or assessed high
+        risk) is escalated at urgent priority before it is stored.
+        """
+        category = peer_moderator.check(text)
+        blocked = category is not None
+        escalated = False
+        if blocked and (
+            category in CRISIS_BLOCK_CATEGORIES or self.risk_service.assess_risk_level(text) == "high"
+        ):
+            escalated = await escalation_queue.escalate(session_id, text, "high", True)
+        peer_msg = PeerChat(
+            room_id=room_id,
+            session_id=session_id,
+            message=text,
+            is_moderated=blocked,
+            is_flagged=blocked,
+            escalated=escalated
+        )
+        if chat_write_behind.running:
+            # Subscribers catch up by id, so wait for the group commit
+            await chat_write_behind.enqueue(peer_msg, durable=True)
+        else:
+            db.add(peer_msg)
+            await db.commit()
+        if not blocked:
+            peer_moderator.submit(peer_msg.id)
+        return peer_msg
+
+    def flagged_notice(self, message: PeerChat) -> Dict[str, Any]:
+        """Reply to the sender of a blocked message, with crisis resources if escalated"""
+        resources = self.risk_service.get_escalation_actions("high")["resources"] if message.escalated else []
+        return {
+            "type": "flagged",
+            "message_id": message.id,
+            "escalated": bool(message.escalated),
+            "resources": resources
+        }
+
+    async def publish(self, message: PeerChat):
+        """Push a stored message to everyone subscribed to its room"""
+        payload = {"type": "peer_message", **self.serialize(message)}
+        await manager.publish(message.room_id, json.dumps(payload))
+
+    async def catch_up(
+        self,
+        db: AsyncSession,
+        room_id: str,
+        last_id: Optional[int] = None
+    ) -> List[PeerChat]:
+        """Messages after ``last_id`` (or the most recent ones), oldest first"""
+        query = select(PeerChat).filter(
+            PeerChat.room_id == room_id,
+            PeerChat.is_flagged == False
+        )
+        if last_id is not None:
+            result = await db.execute(
+                query.filter(PeerChat.id > last_id).order_by(PeerChat.id).limit(self.catch_up_limit)
+            )
+            return list(result.scalars().all())
+
+        result = await db.execute(query.order_by(PeerChat.id.desc()).limit(self.catch_up_limit))
+        return list(reversed(result.scalars().all()))
@@ -0,0 +1,184 @@
+"""
+Remote model server backend for chatbot inference
+
+Sends each micro-batch to an external model server as one call::
+
+    POST <url>  {"messages": ["...", ...]}  ->  {"labels": ["anxiety", ...]}
+
+* one ``httpx.AsyncClient`` per backend, created in ``start`` (app
+  startup) and shared by every call, so connections are pooled and kept
+  alive instead of being opened per request
+* every call is bounded by ``timeout`` seconds end to end; the
+  micro-batcher keeps up to ``max_connections`` batches in flight
+* hedging: once enough latencies are known, a call still running after
+  the ``hedge_percentile`` latency gets a second, identical call; the first
+  good answer wins and the other is cancelled (classification is
+  read-only, so duplicates are harmless)
+* a circuit breaker opens after ``failure_threshold`` consecutive failed
+  calls; while open, batches are refused at once and the chatbot answers
+  from keywords, and after ``reset_timeout`` seconds one probe call decides
+  whether to close it again
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Sequence
+
+import httpx
+
+from app.core.config import settings
+from app.services.inference import InferenceBackend, InferenceUnavailable
+
+# Latencies needed before hedging starts, and how many are kept
+MIN_HEDGE_SAMPLES = 20
+LATENCY_WINDOW = 512
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        failure_threshold: int = settings.CHAT_MODEL_BREAKER_FAILURES,
+        reset_timeout: float = settings.CHAT_MODEL_BREAKER_RESET_SECONDS
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"  # closed, open, half_open
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opens = 0
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+            # Let a single probe through
+            self.state = "half_open"
+            return True
+        return False
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.opens += 1
+
+
+class RemoteModelBackend(InferenceBackend):
+    name = "remote"
+
+    def __init__(
+        self,
+        url: str,
+        max_connections: int = settings.CHAT_MODEL_MAX_CONNECTIONS,
+        timeout: float = settings.CHAT_MODEL_REQUEST_TIMEOUT_SECONDS,
+        hedge_percentile: float = settings.CHAT_MODEL_HEDGE_PERCENTILE,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        self.url = url
+        self.max_connections = max_connections
+        self.max_concurrency = max_connections
+        self.timeout = timeout
+        self.hedge_percentile = hedge_percentile
+        self.breaker = breaker or CircuitBreaker()
+        self.client: Optional[httpx.AsyncClient] = None
+        self._latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+        self.calls = 0
+        self.failures = 0
+        self.refused = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    async def start(self):
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                )
+            )
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def run_batch(self, texts: Sequence[str]) -> List[str]:
+        if self.client is None:
+            raise InferenceUnavailable("not started")
+        if not self.breaker.allow():
+            self.refused += 1
+            raise InferenceUnavailable("circuit open")
+        try:
+            labels = await self._hedged_call(list(texts))
+        except Exception as exc:
+            self.failures += 1
+            self.breaker.record_failure()
+            raise InferenceUnavailable(repr(exc)) from exc
+        self.breaker.record_success()
+        return labels
+
+    async def _call(self, texts: List[str]) -> List[str]:
+        self.calls += 1
+        started = time.perf_counter()
+        response = await asyncio.wait_for(self.client.post(self.url, json={"messages": texts}), self.timeout)
+        response.raise_for_status()
+        labels = response.json()["labels"]
+        if len(labels) != len(texts):
+            raise ValueError(f"Expected {len(texts)} labels, got {len(labels)}")
+        self._latencies.append(time.perf_counter() - started)
+        return labels
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None while hedging is off"""
+        if not self.hedge_percentile or len(self._latencies) < MIN_HEDGE_SAMPLES:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[int(self.hedge_percentile / 100 * (len(ordered) - 1))]
+
+    async def _hedged_call(self, texts: List[str]) -> List[str]:
+        delay = self.hedge_delay()
+        primary = asyncio.ensure_future(self._call(texts))
+        calls = [primary]
+        try:
+            if delay is None:
+                return await primary
+            done, _ = await asyncio.wait(calls, timeout=delay)
+            if not done:
+                self.hedged += 1
+                calls.append(asyncio.ensure_future(self._call(texts)))
+            pending = set(calls)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.hedge_wins += 1
+                        return task.result()
+            # Every call failed
+            return primary.result()
+        finally:
+            for task in calls:
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        ordered = sorted(self._latencies)
+
+        def percentile(p: float) -> float:
+            return round(ordered[int(p / 100 * (len(ordered) - 1))] * 1000, 2) if ordered else 0.0
+
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "refused": self.refused,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "latency_ms": {"p50": percentile(50), "p95": percentile(95), "p99": percentile(99)},
+            "breaker": {"state": self.breaker.state, "opens": self.breaker.opens}
+        }
@@ -0,0 +1,267 @@
+"""
+Retention: delete old chat, peer, escalation, screening and session rows in
+small batches
+
+Each table has a policy: how many days to keep (0 keeps everything) and
+the column that dates a row. A run deletes rows older than the cutoff in
+``batch_size`` id ranges, each its own short transaction with a pause
+after it, so the write lock is never held for long and other writers get
+in between batches.
+
+For tables whose age column grows with the id (``created_at`` on
+``chat_messages`` and ``peer_chats``), a binary search over the primary
+key finds the last id older than the cutoff, and only ranges up to it are
+visited. Each DELETE still checks the age column, so a row written out of
+order is never removed early, and ranges past that id are still visited
+as long as they turn up expired rows. ``anonymous_users`` are dated by
+``last_active``, which is unrelated to the id, so the whole id span is
+walked range by range.
+
+``escalations`` keep the first 100 characters of the message that raised
+them, so they follow the chat message period. Only ``done`` rows are
+deleted: pending, leased or failed escalations still need a counselor,
+however old. ``screenings`` have their own period. Purging them resets the
+in-memory analytics and score caches that were loaded from them. The
+per-day ``screening_rollups`` are anonymous counts and are kept.
+
+On SQLite, freed pages are then handed back to the filesystem with
+``PRAGMA incremental_vacuum``. This needs ``auto_vacuum=INCREMENTAL``,
+which new database files get from ``app.db.base``. Older files need a
+one-off ``python -m app.cli enable-incremental-vacuum``.
+
+``dry_run`` counts what would be deleted without touching anything.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from sqlalchemy import delete, func, select, text
+from app.core.config import settings
+from app.db.base import AsyncSessionLocal
+from app.db.models.chat import ChatMessage, PeerChat
+from app.db.models.escalation import Escalation
+from app.db.models.screening import Screening
+from app.db.models.user import AnonymousUser
+from app.services.screening_analytics import screening_analytics
+from app.services.screening_scores import screening_scores
+
+logger = logging.getLogger(__name__)
+
+# PRAGMA auto_vacuum value for INCREMENTAL
+INCREMENTAL_VACUUM = 2
+
+
+class RetentionPolicy(NamedTuple):
+    model: Any
+    age_column: Any
+    days: int
+    # Age column grows with the id, so the expired rows sit below one id
+    ordered: bool
+    # Extra condition a row must meet to be deleted
+    where: Any = None
+    # Called after a run deleted rows, to drop caches built from them
+    on_purge: Optional[Callable[[], None]] = None
+
+    @property
+    def table(self) -> str:
+        return self.model.__tablename__
+
+
+def reset_screening_caches():
+    screening_analytics.reset()
+    screening_scores.clear()
+
+
+def default_policies() -> List[RetentionPolicy]:
+    return [
+        RetentionPolicy(ChatMessage, ChatMessage.created_at, settings.RETENTION_CHAT_MESSAGES_DAYS, True),
+        RetentionPolicy(PeerChat, PeerChat.created_at, settings.RETENTION_PEER_CHATS_DAYS, True),
+        RetentionPolicy(
+            Escalation, Escalation.enqueued_at, settings.RETENTION_CHAT_MESSAGES_DAYS, True,
+            where=Escalation.status == "done"
+        ),
+        RetentionPolicy(
+            Screening, Screening.completed_at, settings.RETENTION_SCREENINGS_DAYS, True,
+            on_purge=reset_screening_caches
+        ),
+        RetentionPolicy(AnonymousUser, AnonymousUser.last_active, settings.RETENTION_ANONYMOUS_USERS_DAYS, False),
+    ]
+
+
+class RetentionService:
+    def __init__(
+        self,
+        policies: Optional[List[RetentionPolicy]] = None,
+        session_factory=AsyncSessionLocal,
+        batch_size: int = settings.RETENTION_BATCH_SIZE,
+        batch_pause_ms: float = settings.RETENTION_BATCH_PAUSE_MS,
+        vacuum_pages: int = settings.RETENTION_VACUUM_PAGES
+    ):
+        self.policies = default_policies() if policies is None else policies
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause_ms / 1000
+        self.vacuum_pages = vacuum_pages
+
+    async def run(self, dry_run: bool = False, tables: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Apply every enabled policy (or only ``tables``), then vacuum"""
+        started = time.perf_counter()
+        report: Dict[str, Any] = {"dry_run": dry_run, "tables": {}}
+        for policy in self.policies:
+            if policy.days <= 0 or (tables is not None and policy.table not in tables):
+                continue
+            result = report["tables"][policy.table] = await self.purge(policy, dry_run)
+            if result["rows"] and not dry_run and policy.on_purge is not None:
+                policy.on_purge()
+        purged = sum(table["rows"] for table in report["tables"].values())
+        report["vacuum"] = await self.vacuum() if purged and not dry_run else None
+        report["rows"] = purged
+        report["seconds"] = round(time.perf_counter() - started, 3)
+        return report
+
+    async def purge(self, policy: RetentionPolicy, dry_run: bool = False) -> Dict[str, Any]:
+        """Delete (or count) one table's expired rows; returns rows, batches and seconds"""
+        started = time.perf_counter()
+        cutoff = datetime.utcnow() - timedelta(days=policy.days)
+        id_column = policy.model.id
+        expired = policy.age_column < cutoff
+        if policy.where is not None:
+            expired = expired & policy.where
+
+        async with self.session_factory() as db:
+            low, max_id = (await db.execute(select(func.min(id_column), func.max(id_column)))).one()
+            high = max_id
+            if low is not None and policy.ordered:
+                high = await self._last_expired_id(db, policy, cutoff, low, max_id) or low - 1
+
+        rows = batches = 0
+        found = 0
+        # Past ``high``, keep going while ranges still hold expired rows: a
+        # newer row written out of order can end the search early
+        while low is not None and low <= max_id and (low <= high or found):
+            in_range = (id_column >= low, id_column < low + self.batch_size)
+            async with self.session_factory() as db:
+                if dry_run:
+                    found = await db.scalar(select(func.count()).select_from(policy.model).where(*in_range, expired))
+                else:
+                    result = await db.execute(delete(policy.model).where(*in_range, expired))
+                    await db.commit()
+                    found = result.rowcount
+            rows += found
+            batches += 1
+            low += self.batch_size
+            if not dry_run and self.batch_pause:
+                await asyncio.sleep(self.batch_pause)
+
+        return {
+            "cutoff": cutoff.isoformat(),
+            "rows": rows,
+            "batches": batches,
+            "seconds": round(time.perf_counter() - started, 3)
+        }
+
+    async def _last_expired_id(self, db, policy: RetentionPolicy, cutoff: datetime, low: int, high: int) -> Optional[int]:
+        """Largest id whose row is older than ``cutoff``, by binary search over the primary key"""
+        id_column = policy.model.id
+        found = None
+        while low <= high:
+            middle = (low + high) // 2
+            row = (await db.execute(
+                select(id_column, policy.age_column).where(id_column >= middle).order_by(id_column).limit(1)
+            )).first()
+            if row is None or row[0] > high:
+                high = middle - 1
+            elif row[1] is not None and row[1].replace(tzinfo=None) < cutoff:
+                found = row[0]
+                low = row[0] + 1
+            else:
+                high = middle - 1
+        return found
+
+    async def vacuum(self) -> Optional[Dict[str, Any]]:
+        """Reclaim up to ``vacuum_pages`` free pages; None where that doesn't apply"""
+        async with self.session_factory() as db:
+            connection = await db.connection()
+            if connection.dialect.name != "sqlite":
+                return None
+            free_before = await db.scalar(text("PRAGMA freelist_count"))
+            if await db.scalar(text("PRAGMA auto_vacuum")) != INCREMENTAL_VACUUM:
+                return {"enabled": False, "free_pages": free_before}
+            page_size = await db.scalar(text("PRAGMA page_size"))
+            started = time.perf_counter()
+            raw = await connection.get_raw_connection()
+            # executescript steps the pragma to completion; a plain execute
+            # frees a single page
+            await raw.driver_connection.executescript(f"PRAGMA incremental_vacuum({int(self.vacuum_pages)})")
+            free_after = await db.scalar(text("PRAGMA freelist_count"))
+        return {
+            "enabled": True,
+            "pages_reclaimed": free_before - free_after,
+            "bytes_reclaimed": (free_before - free_after) * page_size,
+            "free_pages": free_after,
+            "seconds": round(time.perf_counter() - started, 3)
+        }
+
+
+class RetentionJob:
+    """Background task that applies the retention policies periodically"""
+
+    def __init__(self, service: Optional[RetentionService] = None, interval: float = settings.RETENTION_INTERVAL_SECONDS):
+        self.service = service or RetentionService()
+        self.interval = interval
+        self.runs = 0
+        self.rows_purged = 0
+        self.last_report: Optional[Dict[str, Any]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def enabled(self) -> bool:
+        return any(policy.days > 0 for policy in self.service.policies)
+
+    async def start(self):
+        if not self.running and self.enabled:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run_once(self) -> Dict[str, Any]:
+        report = await self.service.run()
+        self.runs += 1
+        self.rows_purged += report["rows"]
+        self.last_report = report
+        return report
+
+    async def _run(self):
+        while True:
+            try:
+                report = await self.run_once()
+                if report["rows"]:
+                    logger.info("Retention purged %d rows in %.1fs", report["rows"], report["seconds"])
+            except Exception:
+                logger.exception("Retention run failed")
+            await asyncio.sleep(self.interval)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "policies": {policy.table: policy.days for policy in self.service.policies},
+            "runs": self.runs,
+            "rows_purged": self.rows_purged,
+            "last_run": self.last_report
+        }
+
+
+retention_job = RetentionJob()
@@ -1,17 +1,21 @@
 """
 Risk escalation service for high-risk mental health situations
 """
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from datetime import datetime
+from app.services.crisis_matcher import ESCALATION_TRIGGERS, MatchResult, crisis_matcher
+
+# Score contributed by each escalation trigger category
+TRIGGER_WEIGHTS = {
+    "suicide_ideation": 10,
+    "self_harm": 8,
+    "crisis_language": 6,
+    "substance_abuse": 7
+}
 
 class RiskEscalationService:
     def __init__(self):
-        self.escalation_triggers = {
-            "suicide_ideation": ["suicide", "kill myself", "end my life", "want to die"],
-            "self_harm": ["hurt myself", "cut myself", "self-harm", "cutting"],
-            "crisis_language": ["hopeless", "no point", "better off dead", "can't go on"],
-            "substance_abuse": ["overdose", "pills", "too many", "drinking too much"]
-        }
+        self.escalation_triggers = ESCALATION_TRIGGERS
         
         self.crisis_resources = {
             "suicide_prevention": {
@@ -32,22 +36,31 @@ class RiskEscalationService:
             }
         }
     
-    def assess_risk_level(self, content: str, screening_scores: Dict[str, int] = None) -> str:
-        """Assess risk level based on content and screening scores"""
-        content_lower = content.lower()
+    def assess_risk_level(
+        self,
+        content: str,
+        screening_scores: Dict[str, int] = None,
+        matches: Optional[MatchResult] = None,
+        chat_category: Optional[str] = None
+    ) -> str:
+        """Assess risk level based on content and screening scores
+        
+        Pass ``matches`` from a prior ``crisis_matcher.scan`` to reuse the scan,
+        and ``chat_category`` from ``ChatbotService.classify`` so a crisis
+        the model sees without any crisis keyword is escalated too.
+        """
+        if matches is None:
+            matches = crisis_matcher.scan(content)
         risk_score = 0
         
         # Check for crisis language
-        for category, keywords in self.escalation_triggers.items():
-            if any(keyword in content_lower for keyword in keywords):
-                if category == "suicide_ideation":
-                    risk_score += 10
-                elif category == "self_harm":
-                    risk_score += 8
-                elif category == "crisis_language":
-                    risk_score += 6
-                elif category == "substance_abuse":
-                    risk_score += 7
+        for category in self.escalation_triggers:
+            if matches.has(category):
+                risk_score += TRIGGER_WEIGHTS[category]
+        
+        # A crisis label from the model alone counts like suicidal ideation
+        if chat_category == "crisis" and not matches.has("crisis"):
+            risk_score += TRIGGER_WEIGHTS["suicide_ideation"]
         
         # Factor in screening scores if available
         if screening_scores:
@@ -76,14 +89,30 @@ class RiskEscalationService:
         
         # Check for pattern of concerning behavior
         if session_data and risk_level == "moderate":
-            # Look for multiple moderate risks in short time period
-            recent_risks = session_data.get("recent_risk_assessments", [])
-            moderate_risks_today = sum(1 for risk in recent_risks if risk.get("level") == "moderate")
+            # Look for multiple moderate risks in short time period; the
+            # count comes precomputed from app.services.risk_state
+            moderate_risks_today = session_data.get("moderate_risk_count")
+            if moderate_risks_today is None:
+                recent_risks = session_data.get("recent_risk_assessments", [])
+                moderate_risks_today = sum(1 for risk in recent_risks if risk.get("level") == "moderate")
             if moderate_risks_today >= 3:
                 return True
         
         return False
     
+    def escalation_priority(self, risk_level: str, escalate: bool) -> Optional[str]:
+        """Queue priority for a follow-up, or None when none is needed
+        
+        Escalations take the priority of their risk level's actions; a
+        moderate risk that doesn't warrant escalation is still followed up,
+        behind everything else.
+        """
+        if risk_level not in ("high", "moderate"):
+            return None
+        if escalate:
+            return self.get_escalation_actions(risk_level)["priority"]
+        return "normal"
+    
     def get_escalation_actions(self, risk_level: str) -> Dict[str, Any]:
         """Get appropriate escalation actions for risk level"""
         actions = {
@@ -144,6 +173,5 @@ class RiskEscalationService:
             "requires_followup": risk_level in ["high", "moderate"]
         }
         
-        # In production, this would be saved to database
-        # For now, return the log entry
+        # Stored by the escalation queue (app.services.escalation_queue)
         return escalation_log
\ No newline at end of file
@@ -0,0 +1,161 @@
+"""
+Per-session sliding-window risk state
+
+Each session keeps its recent moderate and high assessments, levels and
+times, in a fixed-size ring buffer (two ``array`` columns) plus a running
+count per level for the entries still inside the time window. Minimal and
+low assessments aren't recorded: they never count toward escalation, and
+ordinary chat would otherwise push moderate entries out of the buffer
+while they are still inside the window. Recording an assessment and counting
+a level are O(1) amortized: entries that slide out of the window are
+dropped from the old end as time advances, each exactly once.
+
+Sessions live in an LRU map capped at ``max_sessions``, which bounds memory
+at roughly ``max_sessions * (history * 9 bytes + overhead)``. A session not
+in memory (new, evicted, or last seen by another worker) is rebuilt from the
+``escalations`` table, which holds every moderate and high assessment, so
+a rebuilt session counts exactly what the live one did.
+"""
+import time
+from array import array
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from sqlalchemy import select
+from app.core.config import settings
+from app.db.base import AsyncSessionLocal
+from app.db.models.escalation import Escalation
+
+LEVEL_CODES = {"minimal": 0, "low": 1, "moderate": 2, "high": 3}
+
+# Levels that are recorded; the same ones the escalations table holds
+RECORDED_LEVELS = frozenset({"moderate", "high"})
+
+EPOCH = datetime(1970, 1, 1)
+
+
+class SessionRiskState:
+    """Ring buffer of (level, time) assessments for one session"""
+    __slots__ = ("levels", "times", "start", "size", "counts", "window")
+
+    def __init__(self, history: int, window: float):
+        self.levels = array("b", bytes(history))
+        self.times = array("d", bytes(8 * history))
+        self.start = 0
+        self.size = 0
+        # Assessments per level among the entries in the buffer
+        self.counts = [0] * len(LEVEL_CODES)
+        self.window = window
+
+    def _drop_oldest(self):
+        self.counts[self.levels[self.start]] -= 1
+        self.start = (self.start + 1) % len(self.levels)
+        self.size -= 1
+
+    def _expire(self, now: float):
+        cutoff = now - self.window
+        while self.size and self.times[self.start] < cutoff:
+            self._drop_oldest()
+
+    def record(self, level: str, at: Optional[float] = None):
+        """Add an assessment; levels outside ``RECORDED_LEVELS`` are ignored"""
+        if level not in RECORDED_LEVELS:
+            return
+        at = time.time() if at is None else at
+        self._expire(at)
+        if self.size == len(self.levels):
+            self._drop_oldest()
+        end = (self.start + self.size) % len(self.levels)
+        code = LEVEL_CODES[level]
+        self.levels[end] = code
+        self.times[end] = at
+        self.counts[code] += 1
+        self.size += 1
+
+    def count(self, level: str, now: Optional[float] = None) -> int:
+        """Assessments at ``level`` within the window"""
+        self._expire(time.time() if now is None else now)
+        return self.counts[LEVEL_CODES[level]]
+
+    def session_data(self) -> Dict[str, Any]:
+        """The ``session_data`` argument for ``should_escalate``"""
+        return {"moderate_risk_count": self.count("moderate")}
+
+
+class RiskStateStore:
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        max_sessions: int = settings.RISK_STATE_MAX_SESSIONS,
+        history: int = settings.RISK_STATE_HISTORY,
+        window_seconds: float = settings.RISK_STATE_WINDOW_SECONDS
+    ):
+        self.session_factory = session_factory
+        self.max_sessions = max_sessions
+        self.history = history
+        self.window = window_seconds
+        self._states: "OrderedDict[str, SessionRiskState]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    async def get(self, session_id: str) -> SessionRiskState:
+        """The session's state, loaded from the database if not in memory"""
+        state = self._states.get(session_id)
+        if state is not None:
+            self.hits += 1
+            self._states.move_to_end(session_id)
+            return state
+        self.misses += 1
+        state = await self._load(session_id)
+        # Another request may have loaded it while we were waiting
+        loaded = self._states.get(session_id)
+        if loaded is not None:
+            return loaded
+        return self._put(session_id, state)
+
+    def _put(self, session_id: str, state: SessionRiskState) -> SessionRiskState:
+        self._states[session_id] = state
+        while len(self._states) > self.max_sessions:
+            self._states.popitem(last=False)
+            self.evictions += 1
+        return state
+
+    async def _load(self, session_id: str) -> SessionRiskState:
+        now = time.time()
+        since = datetime.utcfromtimestamp(now - self.window)
+        async with self.session_factory() as db:
+            result = await db.execute(
+                select(Escalation.risk_level, Escalation.enqueued_at)
+                .where(Escalation.session_id == session_id, Escalation.enqueued_at >= since)
+                .order_by(Escalation.enqueued_at.desc(), Escalation.id.desc())
+                .limit(self.history)
+            )
+            rows = result.all()
+        state = SessionRiskState(self.history, self.window)
+        for risk_level, enqueued_at in reversed(rows):
+            if risk_level in LEVEL_CODES:
+                state.record(risk_level, (enqueued_at - EPOCH).total_seconds())
+        return state
+
+    def forget(self, session_id: str):
+        self._states.pop(session_id, None)
+
+    def clear(self):
+        self._states.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "sessions": len(self._states),
+            "max_sessions": self.max_sessions,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions
+        }
+
+
+risk_states = RiskStateStore()
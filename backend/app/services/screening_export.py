@@ -0,0 +1,130 @@
+"""
+Streaming export of anonymized screening rows (NDJSON or CSV)
+
+Rows are read with ``yield_per`` so the database driver hands them over in
+batches instead of materializing the whole result; each batch is rendered
+into one chunk of output. Memory stays flat however many rows match, and
+the first bytes go out as soon as the first batch is read.
+
+Session ids are replaced by an HMAC (keyed with ``SECRET_KEY``): the same
+session always maps to the same value within one deployment, so rows can
+be grouped per person, but the hash cannot be reversed or recomputed
+without the key.
+"""
+import csv
+import hashlib
+import hmac
+import io
+from datetime import date, datetime, time, timedelta
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Sequence
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.serialization import dumps
+from app.db.models.screening import Screening
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv"
+}
+
+BASE_FIELDS = ["session_hash", "screening_type", "score", "risk_level", "completed_at"]
+
+
+def hash_session(session_id: str) -> str:
+    digest = hmac.new(settings.SECRET_KEY.encode(), session_id.encode(), hashlib.sha256)
+    return digest.hexdigest()[:32]
+
+
+class ScreeningExportService:
+    def __init__(
+        self,
+        export_format: str = "ndjson",
+        include_responses: bool = False,
+        batch_size: int = settings.EXPORT_BATCH_SIZE
+    ):
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format: {export_format}")
+        self.export_format = export_format
+        self.include_responses = include_responses
+        self.batch_size = batch_size
+        self.fields = BASE_FIELDS + (["responses"] if include_responses else [])
+
+    @property
+    def media_type(self) -> str:
+        return EXPORT_FORMATS[self.export_format]
+
+    def build_query(
+        self,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+        screening_type: Optional[str] = None
+    ):
+        """Rows in id order; ``start_date``/``end_date`` are inclusive"""
+        columns = [
+            Screening.session_id,
+            Screening.screening_type,
+            Screening.score,
+            Screening.risk_level,
+            Screening.completed_at
+        ]
+        if self.include_responses:
+            columns.append(Screening.responses)
+        query = select(*columns)
+        if start_date:
+            query = query.filter(Screening.completed_at >= datetime.combine(start_date, time.min))
+        if end_date:
+            query = query.filter(Screening.completed_at < datetime.combine(end_date + timedelta(days=1), time.min))
+        if screening_type:
+            query = query.filter(Screening.screening_type == screening_type)
+        return query.order_by(Screening.id).execution_options(yield_per=self.batch_size)
+
+    def to_record(self, row: Any) -> Dict[str, Any]:
+        record = {
+            "session_hash": hash_session(row.session_id),
+            "screening_type": row.screening_type,
+            "score": row.score,
+            "risk_level": row.risk_level,
+            "completed_at": row.completed_at.isoformat() if row.completed_at else None
+        }
+        if self.include_responses:
+            record["responses"] = row.responses
+        return record
+
+    def header(self) -> str:
+        if self.export_format != "csv":
+            return ""
+        return self._csv_lines([self.fields])
+
+    def render_batch(self, rows: Sequence[Any]) -> str:
+        records = [self.to_record(row) for row in rows]
+        if self.export_format == "ndjson":
+            return "".join(dumps(record).decode() + "\n" for record in records)
+        return self._csv_lines(
+            [record[field] if field != "responses" else dumps(record[field]).decode() for field in self.fields]
+            for record in records
+        )
+
+    def _csv_lines(self, rows) -> str:
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator="\n").writerows(rows)
+        return buffer.getvalue()
+
+    async def stream(self, db: AsyncSession, **filters) -> AsyncIterator[str]:
+        """Yield the export one batch at a time"""
+        header = self.header()
+        if header:
+            yield header
+        result = await db.stream(self.build_query(**filters))
+        async for rows in result.partitions():
+            yield self.render_batch(rows)
+
+    def iter_batches(self, db: Session, **filters) -> Iterator[str]:
+        """Synchronous ``stream`` for the CLI"""
+        header = self.header()
+        if header:
+            yield header
+        for rows in db.execute(self.build_query(**filters)).partitions():
+            yield self.render_batch(rows)
@@ -0,0 +1,112 @@
+"""
+Rollup counters for anonymized screening insights
+
+``screening_rollups`` holds one counter per (screening_type, risk_level, day).
+Counters are bumped in the same transaction that stores a screening, so
+``/screenings/insights`` reads O(number of buckets) rows instead of grouping
+the whole ``screenings`` table.
+"""
+from datetime import date
+from typing import Any, Dict, Optional
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.db.base import UPSERT_INSERTS
+from app.db.models.screening import Screening, ScreeningRollup
+
+BUCKET_COLUMNS = ["screening_type", "risk_level", "day"]
+
+class ScreeningRollupService:
+    async def record_screening(self, db: AsyncSession, screening: Screening):
+        """Count ``screening`` in its bucket; the caller commits"""
+        day = screening.completed_at.date()
+        insert_fn = UPSERT_INSERTS.get(db.bind.dialect.name)
+
+        if insert_fn is not None:
+            stmt = insert_fn(ScreeningRollup).values(
+                screening_type=screening.screening_type,
+                risk_level=screening.risk_level,
+                day=day,
+                count=1
+            ).on_conflict_do_update(
+                index_elements=BUCKET_COLUMNS,
+                set_={"count": ScreeningRollup.count + 1}
+            )
+            await db.execute(stmt)
+            return
+
+        # Dialects without ON CONFLICT: update, then insert if nothing matched
+        result = await db.execute(
+            update(ScreeningRollup).where(
+                ScreeningRollup.screening_type == screening.screening_type,
+                ScreeningRollup.risk_level == screening.risk_level,
+                ScreeningRollup.day == day
+            ).values(count=ScreeningRollup.count + 1)
+        )
+        if result.rowcount == 0:
+            db.add(ScreeningRollup(
+                screening_type=screening.screening_type,
+                risk_level=screening.risk_level,
+                day=day,
+                count=1
+            ))
+
+    def rebuild(self, db: Session) -> int:
+        """Recompute every bucket from the screenings table; returns bucket count"""
+        day = func.date(Screening.completed_at)
+        db.execute(delete(ScreeningRollup))
+        db.execute(
+            insert(ScreeningRollup).from_select(
+                ["screening_type", "risk_level", "day", "count"],
+                select(
+                    Screening.screening_type,
+                    Screening.risk_level,
+                    day,
+                    func.count(Screening.id)
+                ).where(
+                    Screening.completed_at.isnot(None)
+                ).group_by(
+                    Screening.screening_type,
+                    Screening.risk_level,
+                    day
+                )
+            )
+        )
+        db.commit()
+        return db.scalar(select(func.count(ScreeningRollup.id)))
+
+    async def get_insights(
+        self,
+        db: AsyncSession,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None
+    ) -> Dict[str, Any]:
+        """Risk distribution over an optional inclusive date range"""
+        query = select(
+            ScreeningRollup.screening_type,
+            ScreeningRollup.risk_level,
+            func.sum(ScreeningRollup.count).label("count")
+        )
+        if start_date is not None:
+            query = query.where(ScreeningRollup.day >= start_date)
+        if end_date is not None:
+            query = query.where(ScreeningRollup.day <= end_date)
+        query = query.group_by(
+            ScreeningRollup.screening_type,
+            ScreeningRollup.risk_level
+        )
+
+        result = await db.execute(query)
+        buckets = result.all()
+
+        return {
+            "total_screenings": sum(int(bucket.count) for bucket in buckets),
+            "risk_distribution": [
+                {
+                    "screening_type": bucket.screening_type,
+                    "risk_level": bucket.risk_level,
+                    "count": int(bucket.count)
+                }
+                for bucket in buckets
+            ]
+        }
@@ -0,0 +1,142 @@
+"""
+Per-session cache of the latest score for each screening type
+
+Chat turns weigh recent PHQ9/GAD7/GHQ scores into ``assess_risk_level``;
+this keeps those scores in memory so a turn doesn't query ``screenings``.
+
+* write-through: ``submit_screening`` records each new score after commit
+* lazy load: a miss loads the latest score per type in one query; sessions
+  without screenings are cached too (as empty), so they cost one query
+  rather than one per message
+* an entry is reloaded once it is older than ``ttl_seconds``, which bounds
+  how long a score submitted through another worker goes unseen
+* ``invalidate`` drops a session, e.g. after its screenings are deleted
+
+A score written through for a session that isn't loaded yet makes a
+partial entry; the next read loads the rest and keeps whichever score per
+type has the higher screening id, so a load racing a submit can't undo it.
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Tuple
+
+from sqlalchemy import func, select
+from app.core.config import settings
+from app.db.base import AsyncSessionLocal
+from app.db.models.screening import Screening
+
+
+class SessionScores:
+    __slots__ = ("scores", "loaded_at", "complete")
+
+    def __init__(self, loaded_at: float, complete: bool):
+        # screening type -> (screening id, score)
+        self.scores: Dict[str, Tuple[int, int]] = {}
+        self.loaded_at = loaded_at
+        self.complete = complete
+
+    def put(self, screening_type: str, screening_id: int, score: int):
+        current = self.scores.get(screening_type)
+        if current is None or current[0] < screening_id:
+            self.scores[screening_type] = (screening_id, score)
+
+
+class ScreeningScoreCache:
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        max_sessions: int = settings.SCREENING_SCORE_CACHE_SIZE,
+        ttl_seconds: float = settings.SCREENING_SCORE_TTL_SECONDS
+    ):
+        self.session_factory = session_factory
+        self.max_sessions = max_sessions
+        self.ttl = ttl_seconds
+        self._entries: "OrderedDict[str, SessionScores]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.writes = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    async def get(self, session_id: str) -> Dict[str, int]:
+        """Latest score per screening type, e.g. ``{"PHQ9": 17}``"""
+        entry = self._entries.get(session_id)
+        now = time.monotonic()
+        if entry is not None and entry.complete:
+            if now - entry.loaded_at < self.ttl:
+                self.hits += 1
+                self._entries.move_to_end(session_id)
+                return self._scores(entry)
+            self.expired += 1
+        self.misses += 1
+
+        loaded = await self._load(session_id, now)
+        # Keep anything written through while the query ran
+        current = self._entries.get(session_id)
+        if current is not None:
+            for screening_type, (screening_id, score) in current.scores.items():
+                loaded.put(screening_type, screening_id, score)
+        self._put(session_id, loaded)
+        return self._scores(loaded)
+
+    def record(self, session_id: str, screening_type: str, screening_id: int, score: int):
+        """Write-through for a committed screening"""
+        self.writes += 1
+        entry = self._entries.get(session_id)
+        if entry is None:
+            entry = self._put(session_id, SessionScores(time.monotonic(), complete=False))
+        entry.put(screening_type, screening_id, score)
+
+    def invalidate(self, session_id: str):
+        if self._entries.pop(session_id, None) is not None:
+            self.invalidations += 1
+
+    def clear(self):
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+
+    def _scores(self, entry: SessionScores) -> Dict[str, int]:
+        return {screening_type: score for screening_type, (_, score) in entry.scores.items()}
+
+    def _put(self, session_id: str, entry: SessionScores) -> SessionScores:
+        self._entries[session_id] = entry
+        self._entries.move_to_end(session_id)
+        while len(self._entries) > self.max_sessions:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return entry
+
+    async def _load(self, session_id: str, now: float) -> SessionScores:
+        latest_ids = (
+            select(func.max(Screening.id))
+            .where(Screening.session_id == session_id)
+            .group_by(Screening.screening_type)
+        )
+        async with self.session_factory() as db:
+            result = await db.execute(
+                select(Screening.screening_type, Screening.id, Screening.score)
+                .where(Screening.id.in_(latest_ids))
+            )
+            rows = result.all()
+        entry = SessionScores(now, complete=True)
+        for screening_type, screening_id, score in rows:
+            entry.put(screening_type, screening_id, score)
+        return entry
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "sessions": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "expired": self.expired,
+            "writes": self.writes,
+            "invalidations": self.invalidations,
+            "evictions": self.evictions
+        }
+
+
+screening_scores = ScreeningScoreCache()
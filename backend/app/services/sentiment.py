@@ -0,0 +1,237 @@
+"""
+Lexicon-based sentiment for chat messages
+
+Each known word carries a weight in [-3, 3]; a word within
+``NEGATION_WINDOW`` tokens after a negator ("not", "never", "can't", ...)
+counts ``NEGATION_SCALE`` times its weight. The summed weight ``s`` is
+squashed to ``s / sqrt(s^2 + 15)`` in (-1, 1) and labelled ``positive`` /
+``negative`` beyond ``±NEUTRAL_BAND``, else ``neutral``.
+
+``score`` handles one message in plain Python (inline on ``/chat/ai``);
+``score_batch`` maps every token of a batch to a vocabulary id once and
+does the weighting, negation and per-message sums as array operations, for
+backfills. Both give the same numbers.
+
+``SentimentBackfill`` fills ``chat_messages.sentiment`` for existing rows:
+it walks the table in fixed id ranges, scores each range in one batch and
+writes it back with one ``UPDATE ... WHERE id IN (...)`` per label and a
+commit. Only rows whose sentiment
+is NULL are touched, so an interrupted run can simply be started again
+(``start_id`` skips the ranges already done).
+"""
+import math
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+from app.db.models.chat import ChatMessage
+from app.services.inference import TOKEN_PATTERN
+
+LEXICON: Dict[str, float] = {
+    # Negative
+    "hopeless": -3.0, "worthless": -3.0, "miserable": -2.8, "suicidal": -3.0, "hate": -2.7,
+    "awful": -2.5, "terrible": -2.5, "horrible": -2.5, "depressed": -2.5, "devastated": -2.8,
+    "panic": -2.2, "scared": -2.0, "afraid": -2.0, "terrified": -2.7, "angry": -2.1,
+    "sad": -2.0, "lonely": -2.0, "alone": -1.2, "empty": -1.8, "crying": -1.9, "cry": -1.7,
+    "anxious": -1.8, "anxiety": -1.6, "worried": -1.6, "worry": -1.4, "nervous": -1.5,
+    "stressed": -1.8, "stress": -1.5, "overwhelmed": -2.0, "exhausted": -1.8, "tired": -1.2,
+    "hurt": -1.9, "pain": -1.9, "upset": -1.8, "frustrated": -1.8, "guilty": -1.8,
+    "ashamed": -2.0, "broken": -2.0, "lost": -1.3, "numb": -1.5, "bad": -1.8, "worse": -2.0,
+    "worst": -2.6, "struggling": -1.7, "fail": -1.8, "failed": -1.8, "failure": -2.1,
+    "useless": -2.2, "sick": -1.5, "problem": -1.2, "problems": -1.2, "difficult": -1.2,
+    # Positive
+    "happy": 2.5, "glad": 2.0, "great": 2.4, "good": 1.8, "better": 1.6, "best": 2.5,
+    "calm": 1.6, "relaxed": 1.9, "peaceful": 2.0, "grateful": 2.3, "thankful": 2.2,
+    "thanks": 1.7, "thank": 1.6, "love": 2.6, "loved": 2.5, "hope": 1.8, "hopeful": 2.1,
+    "proud": 2.1, "excited": 2.2, "confident": 2.0, "safe": 1.7, "okay": 0.9, "ok": 0.9,
+    "fine": 0.8, "helpful": 1.8, "helped": 1.6, "supported": 1.8, "support": 1.2,
+    "enjoy": 2.0, "enjoyed": 2.0, "fun": 2.0, "nice": 1.8, "wonderful": 2.7,
+    "amazing": 2.8, "improving": 1.7, "improved": 1.8, "progress": 1.5, "strong": 1.6,
+    "rested": 1.5, "motivated": 1.8, "smile": 1.8, "laugh": 2.0,
+}
+
+NEGATORS = frozenset({
+    "not", "no", "never", "nothing", "none", "nobody", "neither", "nor", "without", "hardly",
+    "don't", "doesn't", "didn't", "can't", "cannot", "couldn't", "won't", "wouldn't",
+    "isn't", "aren't", "wasn't", "weren't", "haven't", "hasn't", "shouldn't", "dont", "cant"
+})
+NEGATION_WINDOW = 3
+NEGATION_SCALE = -0.74
+NORMALIZER = 15.0
+NEUTRAL_BAND = 0.05
+
+LABELS = ("negative", "neutral", "positive")
+
+# Token characters as digits 1..37, so tokens of up to 12 characters pack
+# exactly into one uint64 (38 ** 12 < 2 ** 64)
+TOKEN_CHARS = "abcdefghijklmnopqrstuvwxyz0123456789'"
+CODE_BASE = np.uint64(len(TOKEN_CHARS) + 1)
+MAX_PACKED_LENGTH = 12
+CHAR_CODES = np.zeros(256, np.uint8)
+for _code, _char in enumerate(TOKEN_CHARS, start=1):
+    CHAR_CODES[ord(_char)] = _code
+
+
+PACK_POWERS = CODE_BASE ** np.arange(MAX_PACKED_LENGTH, dtype=np.uint64)
+
+
+def pack_token(token: str) -> int:
+    return sum(int(CHAR_CODES[ord(char)]) * int(CODE_BASE) ** offset for offset, char in enumerate(token))
+
+
+def sentiment_label(score: float) -> str:
+    if score >= NEUTRAL_BAND:
+        return "positive"
+    if score <= -NEUTRAL_BAND:
+        return "negative"
+    return "neutral"
+
+
+class SentimentScorer:
+    def __init__(self, lexicon: Dict[str, float] = LEXICON, negators: Sequence[str] = NEGATORS):
+        self.lexicon = dict(lexicon)
+        self.negators = frozenset(negators)
+        # Batch path: every vocabulary word packed into one integer key,
+        # sorted for searchsorted; index 0 of weights/negation is "unknown"
+        vocabulary = sorted(set(self.lexicon) | self.negators)
+        for word in vocabulary:
+            if len(word) > MAX_PACKED_LENGTH or not TOKEN_PATTERN.fullmatch(word):
+                raise ValueError(f"Lexicon entries must be single tokens of at most {MAX_PACKED_LENGTH} characters: {word!r}")
+        keys = np.array([pack_token(word) for word in vocabulary], np.uint64)
+        order = np.argsort(keys)
+        self._keys = keys[order]
+        self._weights = np.array(
+            [0.0] + [0.0 if word in self.negators else self.lexicon.get(word, 0.0) for word in vocabulary]
+        )[np.concatenate(([0], order + 1))]
+        self._negation = np.array([0] + [word in self.negators for word in vocabulary], np.int64)[
+            np.concatenate(([0], order + 1))
+        ]
+
+    def score(self, text: str) -> float:
+        total = 0.0
+        last_negator = -NEGATION_WINDOW - 1
+        for position, token in enumerate(TOKEN_PATTERN.findall(text.lower())):
+            if token in self.negators:
+                last_negator = position
+                continue
+            weight = self.lexicon.get(token)
+            if weight is not None:
+                total += weight * NEGATION_SCALE if position - last_negator <= NEGATION_WINDOW else weight
+        return total / math.sqrt(total * total + NORMALIZER)
+
+    def label(self, text: str) -> str:
+        return sentiment_label(self.score(text))
+
+    def score_batch(self, texts: Sequence[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros(0)
+        data = np.frombuffer("\x00".join(texts).lower().encode(), np.uint8)
+        separators = data == 0
+        if np.count_nonzero(separators) != len(texts) - 1:
+            # A message contains NUL itself; rare enough to do one by one
+            return np.array([self.score(text) for text in texts])
+
+        # Tokens are runs of [a-z0-9']; bytes of non-ASCII characters are
+        # never token characters, as with TOKEN_PATTERN
+        codes = CHAR_CODES[data]
+        word = codes > 0
+        token_start = word & ~np.concatenate(([False], word[:-1]))
+        starts = np.flatnonzero(token_start)
+        lengths = np.flatnonzero(word & ~np.concatenate((word[1:], [False]))) + 1 - starts
+        owners = np.searchsorted(np.flatnonzero(separators), starts)
+
+        # Pack every token as sum(code * CODE_BASE ** offset): each byte adds
+        # its term, one reduceat sums them per token (bytes between tokens
+        # are 0), and tokens too long to be vocabulary words never match
+        index = np.arange(len(data), dtype=np.int32)
+        offsets = index - np.maximum.accumulate(np.where(token_start, index, 0))
+        np.minimum(offsets, MAX_PACKED_LENGTH - 1, out=offsets)
+        terms = PACK_POWERS[offsets]
+        terms *= codes
+        keys = np.add.reduceat(terms, starts) if len(starts) else np.zeros(0, np.uint64)
+        slots = np.minimum(np.searchsorted(self._keys, keys), len(self._keys) - 1)
+        ids = np.where((lengths <= MAX_PACKED_LENGTH) & (self._keys[slots] == keys), slots + 1, 0)
+
+        # Negators among the NEGATION_WINDOW tokens before each token, same message only
+        first_token = np.searchsorted(owners, np.arange(len(texts)))
+        negators = np.concatenate(([0], np.cumsum(self._negation[ids])))
+        positions = np.arange(len(ids))
+        window_start = np.maximum(positions - NEGATION_WINDOW, first_token[owners])
+        negated = negators[positions] - negators[window_start] > 0
+
+        weights = self._weights[ids]
+        weights = np.where(negated, weights * NEGATION_SCALE, weights)
+        totals = np.bincount(owners, weights=weights, minlength=len(texts))
+        return totals / np.sqrt(totals * totals + NORMALIZER)
+
+    def label_batch(self, texts: Sequence[str]) -> List[str]:
+        scores = self.score_batch(texts)
+        codes = np.where(scores >= NEUTRAL_BAND, 2, np.where(scores <= -NEUTRAL_BAND, 0, 1))
+        return [LABELS[code] for code in codes.tolist()]
+
+
+# Bound parameters per statement stay well under database limits
+MAX_IDS_PER_UPDATE = 10000
+
+
+class BackfillProgress(NamedTuple):
+    last_id: int
+    max_id: int
+    updated: int
+    elapsed: float
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.updated / self.elapsed if self.elapsed else 0.0
+
+
+class SentimentBackfill:
+    def __init__(self, scorer: Optional[SentimentScorer] = None, chunk_size: int = 5000):
+        self.scorer = scorer or sentiment_scorer
+        self.chunk_size = chunk_size
+
+    def run(
+        self,
+        db: Session,
+        start_id: int = 0,
+        end_id: Optional[int] = None,
+        progress: Optional[Callable[[BackfillProgress], None]] = None
+    ) -> BackfillProgress:
+        """Score unscored messages with ``start_id < id <= end_id``, one committed range at a time"""
+        max_id = end_id if end_id is not None else db.scalar(select(func.max(ChatMessage.id))) or 0
+        started = time.perf_counter()
+        updated = 0
+        last_id = start_id
+        while last_id < max_id:
+            upper = min(last_id + self.chunk_size, max_id)
+            rows = db.execute(
+                select(ChatMessage.id, ChatMessage.message).where(
+                    ChatMessage.id > last_id,
+                    ChatMessage.id <= upper,
+                    ChatMessage.sentiment.is_(None)
+                )
+            ).all()
+            if rows:
+                labels = self.scorer.label_batch([message or "" for _, message in rows])
+                ids_by_label: Dict[str, List[int]] = {}
+                for (row_id, _), label in zip(rows, labels):
+                    ids_by_label.setdefault(label, []).append(row_id)
+                # One UPDATE per label rather than one per row
+                for label, ids in ids_by_label.items():
+                    for i in range(0, len(ids), MAX_IDS_PER_UPDATE):
+                        db.execute(
+                            update(ChatMessage)
+                            .where(ChatMessage.id.in_(ids[i:i + MAX_IDS_PER_UPDATE]))
+                            .values(sentiment=label)
+                        )
+                db.commit()
+            updated += len(rows)
+            last_id = upper
+            if progress is not None:
+                progress(BackfillProgress(last_id, max_id, updated, time.perf_counter() - started))
+        return BackfillProgress(last_id, max_id, updated, time.perf_counter() - started)
+
+
+sentiment_scorer = SentimentScorer()
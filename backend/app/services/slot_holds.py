@@ -0,0 +1,244 @@
+"""
+Slot holds: claim a counselor's slot, then confirm it into an appointment
+
+A claim is one statement. It inserts the slot's ``slot_holds`` row, or takes
+over the existing row only if it is a ``held`` row whose ``expires_at`` has
+passed::
+
+    INSERT ... ON CONFLICT (counselor_id, appointment_time)
+    DO UPDATE SET ... WHERE status = 'held' AND expires_at < now
+    RETURNING hold_token
+
+When many users go for the same slot at once, exactly one statement
+returns a row. Everyone else learns that the slot is taken in the same
+round trip, with no retry loop. Confirming converts the hold into an
+``Appointment``, and the partial unique index on active appointments is
+the last line of defence. Holds nobody confirms simply become claimable
+again once expired. ``HoldPurger`` only removes the dead rows.
+"""
+import asyncio
+import logging
+import secrets
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import and_, delete, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.db.base import UPSERT_INSERTS, AsyncSessionLocal
+from app.db.models.appointment import Appointment, SlotHold
+
+logger = logging.getLogger(__name__)
+
+SLOT_COLUMNS = ["counselor_id", "appointment_time"]
+
+
+class SlotUnavailable(Exception):
+    """The slot is held by someone else or already booked"""
+
+
+class HoldNotFound(Exception):
+    """No hold with this token belongs to the caller"""
+
+
+class HoldExpired(Exception):
+    """The hold lapsed before it was confirmed"""
+
+
+class SlotHoldService:
+    def __init__(self, ttl_seconds: int = settings.SLOT_HOLD_TTL_SECONDS):
+        self.ttl = timedelta(seconds=ttl_seconds)
+
+    async def claim(
+        self,
+        db: AsyncSession,
+        counselor_id: str,
+        slot: datetime,
+        session_id: str
+    ) -> SlotHold:
+        """Hold ``slot`` for ``session_id``; the caller commits
+
+        Raises ``SlotUnavailable`` if a live hold or booking has it.
+        """
+        now = datetime.utcnow()
+        hold = SlotHold(
+            counselor_id=counselor_id,
+            appointment_time=slot,
+            session_id=session_id,
+            hold_token=secrets.token_urlsafe(16),
+            status="held",
+            expires_at=now + self.ttl
+        )
+        values = {
+            "counselor_id": hold.counselor_id,
+            "appointment_time": hold.appointment_time,
+            "session_id": hold.session_id,
+            "hold_token": hold.hold_token,
+            "status": hold.status,
+            "expires_at": hold.expires_at
+        }
+        insert_fn = UPSERT_INSERTS.get(db.bind.dialect.name)
+
+        if insert_fn is not None:
+            stmt = insert_fn(SlotHold).values(**values)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=SLOT_COLUMNS,
+                set_={
+                    "session_id": stmt.excluded.session_id,
+                    "hold_token": stmt.excluded.hold_token,
+                    "status": stmt.excluded.status,
+                    "expires_at": stmt.excluded.expires_at,
+                    "appointment_id": None
+                },
+                where=and_(SlotHold.status == "held", SlotHold.expires_at < now)
+            ).returning(SlotHold.id)
+            hold.id = (await db.execute(stmt)).scalar()
+            if hold.id is None:
+                raise SlotUnavailable()
+            return hold
+
+        # Dialects without ON CONFLICT: take over an expired hold, else insert
+        result = await db.execute(
+            update(SlotHold).where(
+                SlotHold.counselor_id == counselor_id,
+                SlotHold.appointment_time == slot,
+                SlotHold.status == "held",
+                SlotHold.expires_at < now
+            ).values(**values, appointment_id=None)
+        )
+        if result.rowcount == 0:
+            try:
+                async with db.begin_nested():
+                    db.add(hold)
+            except IntegrityError:
+                raise SlotUnavailable()
+        return hold
+
+    async def confirm(
+        self,
+        db: AsyncSession,
+        hold_token: str,
+        session_id: str,
+        notes: Optional[str] = None
+    ) -> Tuple[Appointment, bool]:
+        """Turn a live hold into an appointment; the caller commits
+
+        Returns the appointment and whether this call created it: confirming
+        an already confirmed hold returns its existing appointment.
+        """
+        hold = (await db.execute(
+            select(SlotHold).where(
+                SlotHold.hold_token == hold_token,
+                SlotHold.session_id == session_id
+            )
+        )).scalar_one_or_none()
+        if hold is None:
+            raise HoldNotFound()
+        if hold.status == "confirmed":
+            return await db.get(Appointment, hold.appointment_id), False
+        if hold.expires_at < datetime.utcnow():
+            raise HoldExpired()
+
+        appointment = Appointment(
+            session_id=session_id,
+            counselor_id=hold.counselor_id,
+            appointment_time=hold.appointment_time,
+            notes=notes,
+            status="scheduled"
+        )
+        try:
+            async with db.begin_nested():
+                db.add(appointment)
+        except IntegrityError:
+            # Booked outside the hold flow
+            raise SlotUnavailable()
+
+        # Conditional, so a hold taken over after expiry is not confirmed
+        result = await db.execute(
+            update(SlotHold).where(
+                SlotHold.id == hold.id,
+                SlotHold.hold_token == hold_token,
+                SlotHold.status == "held",
+                SlotHold.expires_at >= datetime.utcnow()
+            ).values(status="confirmed", appointment_id=appointment.id)
+        )
+        if result.rowcount != 1:
+            raise HoldExpired()
+        return appointment, True
+
+    async def release(self, db: AsyncSession, hold_token: str, session_id: str) -> bool:
+        """Give up an unconfirmed hold; the caller commits"""
+        result = await db.execute(
+            delete(SlotHold).where(
+                SlotHold.hold_token == hold_token,
+                SlotHold.session_id == session_id,
+                SlotHold.status == "held"
+            )
+        )
+        return result.rowcount > 0
+
+    async def release_appointment(self, db: AsyncSession, appointment_id: int):
+        """Free the slot of a cancelled appointment; the caller commits"""
+        await db.execute(delete(SlotHold).where(SlotHold.appointment_id == appointment_id))
+
+    async def purge_expired(self, db: AsyncSession) -> int:
+        """Delete lapsed holds and holds for slots in the past; the caller commits"""
+        result = await db.execute(
+            delete(SlotHold).where(
+                or_(
+                    and_(SlotHold.status == "held", SlotHold.expires_at < datetime.utcnow()),
+                    SlotHold.appointment_time < datetime.now()
+                )
+            )
+        )
+        return result.rowcount
+
+
+class HoldPurger:
+    """Background task that periodically deletes dead hold rows"""
+
+    def __init__(self, interval: float = settings.SLOT_HOLD_PURGE_SECONDS):
+        self.interval = interval
+        self.purged = 0
+        self.runs = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def purge_once(self) -> int:
+        async with AsyncSessionLocal() as db:
+            purged = await SlotHoldService().purge_expired(db)
+            await db.commit()
+        self.purged += purged
+        self.runs += 1
+        return purged
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.purge_once()
+            except Exception:
+                logger.exception("Slot hold purge failed")
+
+    def stats(self) -> Dict[str, Any]:
+        return {"running": self.running, "runs": self.runs, "holds_purged": self.purged}
+
+
+hold_purger = HoldPurger()
@@ -0,0 +1,110 @@
+"""
+WebSocket payload codecs negotiated per connection
+
+JSON text frames stay the default so existing clients keep working. Clients
+on slow networks can ask for MessagePack binary frames either with the
+``sahara.msgpack`` subprotocol (``Sec-WebSocket-Protocol``) or with
+``?format=msgpack``. MessagePack is optional: without the package installed
+every client gets JSON.
+
+Every client message must be an object. Frames that don't decode to one
+raise ``PayloadError``; the socket handlers answer it with an ``error`` frame
+and keep the connection open.
+
+Compression is negotiated by the server, not here: uvicorn's ``websockets``
+implementation accepts permessage-deflate (``--ws-per-message-deflate``, on
+by default), which compresses either format on the wire.
+"""
+import json
+from typing import Any, Dict, Optional, Tuple, Union
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional dependency
+    msgpack = None
+
+Message = Union[str, bytes]
+
+JSON_SUBPROTOCOL = "sahara.json"
+MSGPACK_SUBPROTOCOL = "sahara.msgpack"
+
+# What a malformed frame raises while decoding (UnicodeDecodeError and
+# json.JSONDecodeError are ValueErrors)
+DECODE_ERRORS: Tuple[type, ...] = (ValueError, TypeError)
+if msgpack is not None:
+    DECODE_ERRORS += (msgpack.UnpackException,)
+
+
+class PayloadError(ValueError):
+    """A client frame that isn't a JSON or MessagePack object"""
+
+
+class JsonCodec:
+    name = "json"
+    subprotocol = JSON_SUBPROTOCOL
+
+    def encode(self, payload: Dict[str, Any]) -> str:
+        return json.dumps(payload)
+
+    def from_json(self, message: str) -> Message:
+        """Re-encode a JSON text message for this codec's clients"""
+        return message
+
+
+class MsgPackCodec:
+    name = "msgpack"
+    subprotocol = MSGPACK_SUBPROTOCOL
+
+    def encode(self, payload: Dict[str, Any]) -> bytes:
+        return msgpack.packb(payload, use_bin_type=True)
+
+    def from_json(self, message: str) -> Message:
+        return self.encode(json.loads(message))
+
+
+json_codec = JsonCodec()
+msgpack_codec = MsgPackCodec() if msgpack is not None else None
+
+
+def negotiate_codec(websocket: WebSocket) -> Tuple[Any, Optional[str]]:
+    """Pick a codec from the handshake; returns it and the subprotocol to accept"""
+    offered = websocket.scope.get("subprotocols") or []
+    if msgpack_codec is not None:
+        if MSGPACK_SUBPROTOCOL in offered:
+            return msgpack_codec, MSGPACK_SUBPROTOCOL
+        if websocket.query_params.get("format") == "msgpack":
+            return msgpack_codec, None
+    if JSON_SUBPROTOCOL in offered:
+        return json_codec, JSON_SUBPROTOCOL
+    return json_codec, None
+
+
+def decode_message(data: Message) -> Dict[str, Any]:
+    """Binary frames are MessagePack, text frames JSON, whatever was negotiated"""
+    if isinstance(data, bytes):
+        if msgpack is None:
+            raise PayloadError("MessagePack frames are not supported")
+        try:
+            payload = msgpack.unpackb(data, raw=False)
+        except DECODE_ERRORS:
+            raise PayloadError("Malformed MessagePack frame")
+    else:
+        try:
+            payload = json.loads(data)
+        except DECODE_ERRORS:
+            raise PayloadError("Malformed JSON frame")
+    if not isinstance(payload, dict):
+        raise PayloadError("Expected an object")
+    return payload
+
+
+async def receive_payload(websocket: WebSocket) -> Dict[str, Any]:
+    """Receive one client message in either format; raises ``PayloadError`` for a bad frame"""
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
+    if message.get("bytes") is not None:
+        return decode_message(message["bytes"])
+    return decode_message(message["text"])
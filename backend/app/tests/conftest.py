@@ -0,0 +1,18 @@
+"""
+Shared test fixtures
+"""
+import pytest_asyncio
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from app.db.base import Base
+
+@pytest_asyncio.fixture
+async def session_factory(tmp_path):
+    """A private database file, so other tests' rows don't interfere"""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+    async with engine.begin() as conn:
+        # As app.db.base sets for new files, so retention can vacuum
+        await conn.execute(text("PRAGMA auto_vacuum = INCREMENTAL"))
+        await conn.run_sync(Base.metadata.create_all)
+    yield async_sessionmaker(engine, expire_on_commit=False)
+    await engine.dispose()
@@ -0,0 +1,314 @@
+"""
+Test counselor availability and booking
+"""
+from datetime import date, datetime, time, timedelta, timezone
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import delete
+from app.db.base import SessionLocal
+from app.db.models.appointment import Appointment, SlotHold
+from app.main import app
+from app.services.availability import AvailabilityIndex, CounselorSchedule, working_slots
+
+client = TestClient(app)
+
+@pytest.fixture
+def auth_token():
+    """Get auth token for testing"""
+    response = client.post("/api/v1/auth/anonymous")
+    return response.json()["access_token"]
+
+def next_weekday(days_ahead=30):
+    """A weekday far enough ahead that other tests leave it alone"""
+    day = date.today() + timedelta(days=days_ahead)
+    while day.weekday() >= 5:
+        day += timedelta(days=1)
+    return day
+
+def clear_day(day):
+    """Remove holds and bookings left on ``day`` by earlier runs"""
+    start = datetime.combine(day, time.min)
+    end = start + timedelta(days=1)
+    with SessionLocal() as db:
+        for model in (SlotHold, Appointment):
+            db.execute(delete(model).where(model.appointment_time >= start, model.appointment_time < end))
+        db.commit()
+
+def test_schedule_free_slots_skip_bookings():
+    """Test that overlapping bookings remove exactly the slots they cover"""
+    monday = datetime(2024, 5, 6)
+    schedule = CounselorSchedule()
+    schedule.add(1, monday.replace(hour=10), monday.replace(hour=11))
+    schedule.add(2, monday.replace(hour=14, minute=30), monday.replace(hour=15, minute=30))
+    
+    free = list(schedule.free_slots(monday, monday + timedelta(days=1)))
+    assert [slot.hour for slot in free] == [9, 11, 16]
+    assert schedule.is_free(monday.replace(hour=11), monday.replace(hour=12))
+    assert not schedule.is_free(monday.replace(hour=15), monday.replace(hour=16))
+    
+    assert schedule.remove(2, monday.replace(hour=14, minute=30))
+    assert [slot.hour for slot in schedule.free_slots(monday, monday + timedelta(days=1))] == [9, 11, 14, 15, 16]
+
+def test_working_slots_skip_weekends():
+    """Test that no slots are generated on Saturday and Sunday"""
+    friday = datetime(2024, 5, 10)
+    slots = list(working_slots(friday, friday + timedelta(days=3)))
+    assert {slot.weekday() for slot in slots} == {4}
+
+def test_earliest_slot_across_specialists():
+    """Test the heap merge across counselors sharing a specialization"""
+    index = AvailabilityIndex([
+        {"counselor_id": "a", "specialization": "Anxiety & Depression", "available": True},
+        {"counselor_id": "b", "specialization": "Anxiety", "available": True},
+        {"counselor_id": "c", "specialization": "Trauma", "available": True}
+    ])
+    monday = datetime(2024, 5, 6)
+    for hour in [9, 10]:
+        index.book("a", hour, monday.replace(hour=hour))
+    index.book("b", 99, monday.replace(hour=9))
+    
+    slots = index.earliest_slots("anxiety", after=monday, limit=3)
+    assert slots == [
+        (monday.replace(hour=10), "b"),
+        (monday.replace(hour=11), "a"),
+        (monday.replace(hour=11), "b")
+    ]
+    assert index.earliest_slots("trauma", after=monday, limit=1) == [(monday.replace(hour=9), "c")]
+    assert index.earliest_slots("unknown", after=monday) == []
+
+def test_booking_updates_availability(auth_token):
+    """Test that booked slots disappear, double booking is refused and cancel frees the slot"""
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    day = next_weekday()
+    slot = datetime.combine(day, time(15))
+    days_ahead = (day - date.today()).days
+    
+    def available():
+        response = client.get(f"/api/v1/appointments/availability/counselor_2?days_ahead={days_ahead}")
+        return response.json()["available_slots"]
+    
+    assert slot.isoformat() in available()
+    booked = client.post(
+        "/api/v1/appointments/book",
+        json={"counselor_id": "counselor_2", "preferred_time": slot.isoformat()},
+        headers=headers
+    )
+    assert booked.status_code == 200
+    assert slot.isoformat() not in available()
+    
+    again = client.post(
+        "/api/v1/appointments/book",
+        json={"counselor_id": "counselor_2", "preferred_time": slot.isoformat()},
+        headers=headers
+    )
+    assert again.status_code == 409
+    
+    client.patch(f"/api/v1/appointments/appointments/{booked.json()['id']}/cancel", headers=headers)
+    assert slot.isoformat() in available()
+
+def test_booking_rejects_unknown_counselor_and_off_hours(auth_token):
+    """Test validation of the requested counselor and slot"""
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    slot = datetime.combine(next_weekday(), time(12))
+    response = client.post(
+        "/api/v1/appointments/book",
+        json={"counselor_id": "counselor_1", "preferred_time": slot.isoformat()},
+        headers=headers
+    )
+    assert response.status_code == 400
+    response = client.post(
+        "/api/v1/appointments/book",
+        json={"counselor_id": "nobody", "preferred_time": slot.replace(hour=9).isoformat()},
+        headers=headers
+    )
+    assert response.status_code == 404
+
+def test_booking_converts_offset_times(auth_token):
+    """Test that a slot sent with a UTC offset books the same local hour"""
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    day = next_weekday(days_ahead=33)
+    clear_day(day)
+    for hour, offset in ((10, timedelta(hours=5, minutes=30)), (14, timedelta(0))):
+        slot = datetime.combine(day, time(hour))
+        sent = slot.astimezone(timezone(offset)).isoformat().replace("+00:00", "Z")
+        response = client.post(
+            "/api/v1/appointments/book",
+            json={"counselor_id": "counselor_3", "preferred_time": sent},
+            headers=headers
+        )
+        assert response.status_code == 200
+        assert response.json()["appointment_time"] == slot.isoformat()
+
+def test_earliest_availability_endpoint():
+    """Test the multi-counselor earliest slot query"""
+    response = client.get("/api/v1/appointments/availability?specialization=Anxiety&limit=2")
+    assert response.status_code == 200
+    slots = response.json()["slots"]
+    assert len(slots) == 2
+    assert {slot["counselor_id"] for slot in slots} == {"counselor_1"}
+    assert slots[0]["slot"] < slots[1]["slot"]
+
+def test_hold_then_confirm_blocks_other_claimants(auth_token):
+    """Test that a held slot is refused to others and confirms into a booking"""
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    other = {"Authorization": f"Bearer {client.post('/api/v1/auth/anonymous').json()['access_token']}"}
+    day = next_weekday(31)
+    clear_day(day)
+    slot = datetime.combine(day, time(10))
+    request = {"counselor_id": "counselor_3", "preferred_time": slot.isoformat()}
+    
+    held = client.post("/api/v1/appointments/appointments/hold", json=request, headers=headers)
+    assert held.status_code == 200
+    token = held.json()["hold_token"]
+    assert client.post("/api/v1/appointments/appointments/hold", json=request, headers=other).status_code == 409
+    assert client.post("/api/v1/appointments/book", json=request, headers=other).status_code == 409
+    # Only the holder can confirm
+    assert client.post(f"/api/v1/appointments/appointments/holds/{token}/confirm", headers=other).status_code == 404
+    
+    confirmed = client.post(
+        f"/api/v1/appointments/appointments/holds/{token}/confirm",
+        json={"notes": "first session"},
+        headers=headers
+    )
+    assert confirmed.status_code == 200
+    assert confirmed.json()["notes"] == "first session"
+    # Retried confirm returns the same appointment
+    retried = client.post(f"/api/v1/appointments/appointments/holds/{token}/confirm", headers=headers)
+    assert retried.json()["id"] == confirmed.json()["id"]
+    assert client.delete(f"/api/v1/appointments/appointments/holds/{token}", headers=headers).status_code == 404
+
+def test_retried_confirm_books_slot_once(auth_token):
+    """Test that confirming a hold twice and then cancelling frees the slot"""
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    day = next_weekday(33)
+    clear_day(day)
+    slot = datetime.combine(day, time(14))
+    days_ahead = (day - date.today()).days
+    
+    def available():
+        response = client.get(f"/api/v1/appointments/availability/counselor_1?days_ahead={days_ahead}")
+        return response.json()["available_slots"]
+    
+    request = {"counselor_id": "counselor_1", "preferred_time": slot.isoformat()}
+    token = client.post("/api/v1/appointments/appointments/hold", json=request, headers=headers).json()["hold_token"]
+    first = client.post(f"/api/v1/appointments/appointments/holds/{token}/confirm", headers=headers)
+    second = client.post(f"/api/v1/appointments/appointments/holds/{token}/confirm", headers=headers)
+    assert first.json()["id"] == second.json()["id"]
+    assert slot.isoformat() not in available()
+    
+    client.patch(f"/api/v1/appointments/appointments/{first.json()['id']}/cancel", headers=headers)
+    assert slot.isoformat() in available()
+
+def test_expired_hold_can_be_reclaimed(auth_token, monkeypatch):
+    """Test that a lapsed hold goes to the next claimant and can't be confirmed"""
+    from app.api import appointments
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    other = {"Authorization": f"Bearer {client.post('/api/v1/auth/anonymous').json()['access_token']}"}
+    day = next_weekday(32)
+    clear_day(day)
+    slot = datetime.combine(day, time(11))
+    request = {"counselor_id": "counselor_3", "preferred_time": slot.isoformat()}
+    
+    monkeypatch.setattr(appointments.slot_holds, "ttl", timedelta(seconds=-1))
+    stale = client.post("/api/v1/appointments/appointments/hold", json=request, headers=headers).json()["hold_token"]
+    monkeypatch.undo()
+    
+    fresh = client.post("/api/v1/appointments/appointments/hold", json=request, headers=other)
+    assert fresh.status_code == 200
+    assert client.post(f"/api/v1/appointments/appointments/holds/{stale}/confirm", headers=headers).status_code == 404
+    
+    released = client.delete(f"/api/v1/appointments/appointments/holds/{fresh.json()['hold_token']}", headers=other)
+    assert released.status_code == 200
+    assert client.post("/api/v1/appointments/book", json=request, headers=headers).status_code == 200
+
+def test_bookings_from_other_workers_show_up(auth_token, monkeypatch):
+    """Test that the index is rebuilt after a conflict and once it is too old"""
+    from app.services.availability import availability_index
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    day = next_weekday(36)
+    clear_day(day)
+    days_ahead = (day - date.today()).days
+    
+    def available():
+        response = client.get(f"/api/v1/appointments/availability/counselor_2?days_ahead={days_ahead}")
+        return response.json()["available_slots"]
+    
+    def book_elsewhere(slot):
+        # Written by another worker: this process's index doesn't know
+        with SessionLocal() as db:
+            db.add(Appointment(session_id="elsewhere", counselor_id="counselor_2", appointment_time=slot, status="scheduled"))
+            db.commit()
+    
+    taken = datetime.combine(day, time(16))
+    assert taken.isoformat() in available()
+    book_elsewhere(taken)
+    assert taken.isoformat() in available()
+    request = {"counselor_id": "counselor_2", "preferred_time": taken.isoformat()}
+    assert client.post("/api/v1/appointments/book", json=request, headers=headers).status_code == 409
+    assert taken.isoformat() not in available()
+    
+    aged = datetime.combine(day, time(9))
+    book_elsewhere(aged)
+    assert aged.isoformat() in available()
+    monkeypatch.setattr(availability_index, "loaded_at", availability_index.loaded_at - availability_index.max_age)
+    assert aged.isoformat() not in available()
+
+@pytest.mark.asyncio
+async def test_reload_skips_past_appointments(session_factory):
+    """Test that only appointments that haven't ended are loaded"""
+    now = datetime.now().replace(minute=0, second=0, microsecond=0)
+    async with session_factory() as db:
+        db.add_all(
+            Appointment(session_id="s", counselor_id="counselor_1", appointment_time=start, status="scheduled")
+            for start in (now - timedelta(days=30), now - timedelta(hours=2), now, now + timedelta(days=1))
+        )
+        await db.commit()
+    
+    index = AvailabilityIndex()
+    async with session_factory() as db:
+        await index.reload(db)
+    assert index.schedule("counselor_1").starts == [now, now + timedelta(days=1)]
+
+@pytest.mark.asyncio
+async def test_concurrent_claims_have_one_winner():
+    """Test that racing claims on one slot resolve to exactly one hold"""
+    import asyncio
+    from app.db.base import AsyncSessionLocal
+    from app.services.slot_holds import SlotHoldService, SlotUnavailable
+    holds = SlotHoldService()
+    day = next_weekday(33)
+    clear_day(day)
+    slot = datetime.combine(day, time(14))
+    
+    async def claim(session_id):
+        async with AsyncSessionLocal() as db:
+            try:
+                await holds.claim(db, "counselor_1", slot, session_id)
+            except SlotUnavailable:
+                return False
+            await db.commit()
+            return True
+    
+    results = await asyncio.gather(*(claim(f"racer-{i}") for i in range(10)))
+    assert results.count(True) == 1
+
+@pytest.mark.asyncio
+async def test_purge_removes_expired_holds():
+    """Test that the purger deletes lapsed holds but keeps live ones"""
+    from sqlalchemy import select
+    from app.db.base import AsyncSessionLocal
+    from app.db.models.appointment import SlotHold
+    from app.services.slot_holds import HoldPurger, SlotHoldService
+    day = next_weekday(34)
+    clear_day(day)
+    async with AsyncSessionLocal() as db:
+        lapsed = await SlotHoldService(ttl_seconds=-1).claim(db, "counselor_2", datetime.combine(day, time(9)), "a")
+        live = await SlotHoldService().claim(db, "counselor_2", datetime.combine(day, time(10)), "b")
+        await db.commit()
+    
+    purger = HoldPurger()
+    assert await purger.purge_once() >= 1
+    async with AsyncSessionLocal() as db:
+        tokens = set((await db.execute(select(SlotHold.hold_token))).scalars())
+    assert lapsed.hold_token not in tokens
+    assert live.hold_token in tokens
@@ -1,9 +1,15 @@
 """
 Test authentication endpoints
 """
+import asyncio
+import time
 import pytest
 from fastapi.testclient import TestClient
 from app.main import app
+from app.core.security import (
+    PasswordHasher, PasswordHashingBusy, TokenCache, create_access_token,
+    token_cache, verify_token_cached
+)
 
 client = TestClient(app)
 
@@ -40,4 +46,61 @@ def test_verify_invalid_token():
         "/api/v1/auth/verify",
         headers={"Authorization": "Bearer invalid_token"}
     )
-    assert response.status_code == 401
\ No newline at end of file
+    assert response.status_code == 401
+
+def test_verified_tokens_are_cached():
+    """Test that repeated requests with one token hit the decoded-token cache"""
+    token = client.post("/api/v1/auth/anonymous").json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    
+    client.get("/api/v1/auth/verify", headers=headers)
+    hits = token_cache.hits
+    response = client.get("/api/v1/auth/verify", headers=headers)
+    
+    assert response.status_code == 200
+    assert token_cache.hits == hits + 1
+
+def test_token_cache_respects_expiry_and_size():
+    """Test that cached subjects never outlive exp and the LRU stays bounded"""
+    cache = TokenCache(max_size=2)
+    cache.put("expired", "anon:a", time.time() - 1)
+    assert cache.get("expired") is None
+    
+    cache.put("t1", "anon:1", time.time() + 60)
+    cache.put("t2", "anon:2", time.time() + 60)
+    cache.get("t1")
+    cache.put("t3", "anon:3", time.time() + 60)
+    assert cache.get("t2") is None
+    assert cache.get("t1") == "anon:1"
+    assert cache.stats()["evictions"] == 1
+
+def test_cached_verification_rejects_bad_tokens():
+    """Test that invalid tokens are never cached"""
+    assert verify_token_cached("invalid_token") is None
+    assert verify_token_cached(create_access_token("anon:x")) == "anon:x"
+
+@pytest.mark.asyncio
+async def test_password_hashing_runs_in_pool():
+    """Test async bcrypt hashing and verification in the process pool"""
+    hasher = PasswordHasher(max_workers=1, max_pending=4)
+    try:
+        hashed = await hasher.hash("counselor-password")
+        assert await hasher.verify("counselor-password", hashed) is True
+        assert await hasher.verify("wrong-password", hashed) is False
+        assert hasher.stats()["completed"] == 3
+    finally:
+        hasher.shutdown()
+
+@pytest.mark.asyncio
+async def test_password_hashing_rejects_when_saturated():
+    """Test that calls beyond the pending cap fail fast"""
+    hasher = PasswordHasher(max_workers=1, max_pending=1)
+    try:
+        first = asyncio.ensure_future(hasher.hash("one"))
+        await asyncio.sleep(0)
+        with pytest.raises(PasswordHashingBusy):
+            await hasher.hash("two")
+        await first
+        assert hasher.stats()["rejected"] == 1
+    finally:
+        hasher.shutdown()
\ No newline at end of file
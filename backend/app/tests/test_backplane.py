@@ -0,0 +1,161 @@
+"""
+Test cross-worker WebSocket delivery over the Unix socket backplane
+"""
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import time
+import pytest
+from app.services.backplane import InProcessBackplane, UnixSocketBackplane
+from app.services.connection_manager import ConnectionManager
+
+WORKERS = 3
+MESSAGES = 2000
+
+def _subscriber_worker(path, ready, results):
+    """Worker process: count room messages until all have arrived"""
+    async def run():
+        received = []
+        first_at = []
+        done = asyncio.Event()
+
+        def handler(channel, message):
+            if not first_at:
+                first_at.append(time.perf_counter())
+            received.append(message)
+            if len(received) == MESSAGES:
+                done.set()
+
+        backplane = UnixSocketBackplane(path)
+        backplane.attach(handler)
+        await backplane.start()
+        ready.put(os.getpid())
+        try:
+            await asyncio.wait_for(done.wait(), 30)
+        finally:
+            await backplane.stop()
+        elapsed = time.perf_counter() - first_at[0]
+        results.put((len(received), received[0], received[-1], elapsed))
+
+    asyncio.run(run())
+
+def test_messages_reach_every_worker_process():
+    """Test that one worker's publishes are delivered in every other worker"""
+    path = os.path.join(tempfile.mkdtemp(), "backplane.sock")
+    context = multiprocessing.get_context("spawn")
+    ready, results = context.Queue(), context.Queue()
+
+    async def publish_from_first_worker():
+        local = []
+        publisher = UnixSocketBackplane(path)
+        publisher.attach(lambda channel, message: local.append(message))
+        await publisher.start()
+        assert publisher.stats()["hosting_broker"] is True
+
+        workers = [
+            context.Process(target=_subscriber_worker, args=(path, ready, results))
+            for _ in range(WORKERS)
+        ]
+        for worker in workers:
+            worker.start()
+        try:
+            for _ in range(WORKERS):
+                await asyncio.get_running_loop().run_in_executor(None, ready.get, True, 30)
+
+            for i in range(MESSAGES):
+                await publisher.publish("room:general", f"message {i}")
+            outcomes = [
+                await asyncio.get_running_loop().run_in_executor(None, results.get, True, 30)
+                for _ in range(WORKERS)
+            ]
+        finally:
+            for worker in workers:
+                worker.join(10)
+            await publisher.stop()
+        return local, outcomes
+
+    local, outcomes = asyncio.run(publish_from_first_worker())
+
+    assert len(outcomes) == WORKERS
+    for count, first, last, _ in outcomes:
+        assert count == MESSAGES
+        assert (first, last) == ("message 0", f"message {MESSAGES - 1}")
+    # The publishing worker's own sockets are served through the backplane too
+    assert len(local) == MESSAGES
+
+@pytest.mark.asyncio
+async def test_publish_survives_broker_restart():
+    """Test that publishes during a reconnect are held and sent afterwards"""
+    path = os.path.join(tempfile.mkdtemp(), "backplane.sock")
+    host, worker = UnixSocketBackplane(path), UnixSocketBackplane(path, max_pending=1)
+    received = []
+    worker.attach(lambda channel, message: received.append(message))
+    await host.start()
+    await worker.start()
+    # Let the broker register the worker's connection
+    await asyncio.sleep(0.05)
+    try:
+        class BrokenWriter:
+            def write(self, data):
+                pass
+
+            async def drain(self):
+                raise ConnectionResetError("broker gone")
+
+        writer, worker._writer = worker._writer, BrokenWriter()
+        await worker.publish("room:general", "held")
+        # Beyond max_pending, only this worker's sockets get it
+        await worker.publish("room:general", "local only")
+        assert received == ["local only"]
+        worker._writer = writer
+
+        # The host exits; the worker takes over the broker and flushes
+        await host.stop()
+        for _ in range(200):
+            if "held" in received:
+                break
+            await asyncio.sleep(0.01)
+        await worker.publish("room:general", "after")
+        for _ in range(200):
+            if "after" in received:
+                break
+            await asyncio.sleep(0.01)
+        assert received == ["local only", "held", "after"]
+        stats = worker.stats()
+        assert stats["hosting_broker"] is True
+        assert (stats["publish_errors"], stats["delivered_locally"], stats["pending"]) == (1, 1, 0)
+    finally:
+        await worker.stop()
+        await host.stop()
+
+@pytest.mark.asyncio
+async def test_manager_delivers_rooms_through_backplane():
+    """Test that room publishes route through the backplane to local members"""
+    class RecordingSocket:
+        def __init__(self):
+            self.sent = []
+
+        async def accept(self):
+            pass
+
+        async def send_text(self, message):
+            self.sent.append(message)
+
+    backplane = InProcessBackplane()
+    manager = ConnectionManager(backplane=backplane)
+    member, outsider = RecordingSocket(), RecordingSocket()
+    await manager.connect(member)
+    await manager.connect(outsider)
+    manager.join(member, "general")
+
+    await manager.publish("general", "hi room")
+    await asyncio.sleep(0.01)
+
+    assert member.sent == ["hi room"]
+    assert outsider.sent == []
+    assert backplane.stats()["published"] == 1
+
+    manager.disconnect(member)
+    manager.disconnect(outsider)
+    await asyncio.sleep(0.01)
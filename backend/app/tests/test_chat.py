@@ -1,8 +1,11 @@
 """
 Test chat endpoints and chatbot service
 """
+import asyncio
+import uuid
 import pytest
 from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
 from app.main import app
 from app.services.chatbot import ChatbotService
 
@@ -45,6 +48,67 @@ def test_chat_history(auth_token):
     assert response.status_code == 200
     assert isinstance(response.json(), list)
 
+def test_chat_history_keyset_pagination(auth_token):
+    """Test walking chat history pages with opaque cursors"""
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    for i in range(5):
+        client.post("/api/v1/chat/ai", json={"message": f"message {i}"}, headers=headers)
+    
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/api/v1/chat/history", params=params, headers=headers)
+        assert response.status_code == 200
+        seen.extend(item["message"] for item in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    
+    assert seen == [f"message {i}" for i in reversed(range(5))]
+
+def test_chat_history_pages_legacy_timestamps(auth_token):
+    """Test that CURRENT_TIMESTAMP-era rows page to the end once normalized"""
+    from sqlalchemy import text
+    from app.cli import main as cli_main
+    from app.core.security import verify_token_cached
+    from app.db.base import engine
+    
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    with engine.begin() as conn:
+        for i in range(3):
+            conn.execute(
+                text(
+                    "INSERT INTO chat_messages (session_id, message, response, risk_detected, created_at) "
+                    "VALUES (:subject, :message, '', 0, :created_at)"
+                ),
+                {"subject": verify_token_cached(auth_token), "message": f"m{i}", "created_at": f"2024-01-01 10:00:0{i}"}
+            )
+    assert cli_main(["normalize-timestamps"]) == 0
+    
+    seen = []
+    cursor = None
+    for _ in range(5):
+        params = {"limit": 1, **({"cursor": cursor} if cursor else {})}
+        response = client.get("/api/v1/chat/history", params=params, headers=headers)
+        seen.extend(item["message"] for item in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert seen == ["m2", "m1", "m0"]
+    assert cli_main(["normalize-timestamps"]) == 0
+
+def test_chat_history_rejects_bad_cursor(auth_token):
+    """Test that a malformed cursor is a client error"""
+    response = client.get(
+        "/api/v1/chat/history",
+        params={"cursor": "not-a-cursor"},
+        headers={"Authorization": f"Bearer {auth_token}"}
+    )
+    assert response.status_code == 400
+
 def test_chatbot_risk_detection():
     """Test chatbot risk detection"""
     chatbot = ChatbotService()
@@ -72,4 +136,170 @@ def test_peer_chat(auth_token):
     
     data = response.json()
     assert data["status"] == "sent"
-    assert "message_id" in data
\ No newline at end of file
+    assert "message_id" in data
+
+def test_peer_websocket_push_and_catch_up(auth_token):
+    """Test room push to subscribers and replay from the last seen id"""
+    room = f"room-{uuid.uuid4()}"
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    
+    def receive_new(websocket, seen):
+        # Replay and push can overlap around the join; skip repeated ids
+        while True:
+            message = websocket.receive_json()
+            if message["id"] not in seen:
+                seen.add(message["id"])
+                return message
+    
+    seen = set()
+    with client.websocket_connect(f"/ws/peer/{room}?token={auth_token}") as subscriber:
+        sent = client.post(
+            "/api/v1/chat/peer",
+            json={"room_id": room, "message": "first"},
+            headers=headers
+        ).json()
+        pushed = receive_new(subscriber, seen)
+        assert pushed["id"] == sent["message_id"]
+        assert pushed["message"] == "first"
+        
+        subscriber.send_json({"message": "second"})
+        assert receive_new(subscriber, seen)["message"] == "second"
+    
+    with client.websocket_connect(
+        f"/ws/peer/{room}?token={auth_token}&last_id={sent['message_id']}"
+    ) as late_joiner:
+        assert late_joiner.receive_json()["message"] == "second"
+
+def test_peer_websocket_requires_token():
+    """Test that unauthenticated room subscriptions are refused"""
+    with pytest.raises(WebSocketDisconnect):
+        with client.websocket_connect("/ws/peer/general?token=invalid") as websocket:
+            websocket.receive_text()
+
+def test_chat_websocket_streams_response(auth_token):
+    """Test that /ws/chat streams chunks that add up to the final reply"""
+    with client.websocket_connect(f"/ws/chat?token={auth_token}") as websocket:
+        websocket.send_json({"content": "I want to kill myself", "timestamp": "t1"})
+        start = websocket.receive_json()
+        assert start["type"] == "start"
+        assert start["risk_detected"] is True
+        assert start["escalated"] is True
+        assert start["resources"]
+        
+        chunks = []
+        frame = websocket.receive_json()
+        while frame["type"] == "chunk":
+            chunks.append(frame["content"])
+            frame = websocket.receive_json()
+        assert frame["type"] == "done"
+        assert frame["timestamp"] == "t1"
+        assert len(chunks) > 1
+        assert "".join(chunks) == frame["content"]
+        assert "988" in frame["content"]
+    
+    history = client.get(
+        "/api/v1/chat/history",
+        headers={"Authorization": f"Bearer {auth_token}"}
+    ).json()
+    assert history[0]["message"] == "I want to kill myself"
+    assert history[0]["risk_detected"] is True
+
+def test_websockets_survive_malformed_frames(auth_token):
+    """Test that bad frames get an error frame and the socket keeps working"""
+    with client.websocket_connect(f"/ws/chat?token={auth_token}") as websocket:
+        for frame in ["{not json", "[1, 2]", "42"]:
+            websocket.send_text(frame)
+            assert websocket.receive_json()["type"] == "error"
+        websocket.send_bytes(b"\xc1")
+        assert websocket.receive_json()["type"] == "error"
+        websocket.send_json({"content": "I feel anxious"})
+        assert websocket.receive_json()["type"] == "start"
+    
+    room = f"room-{uuid.uuid4()}"
+    with client.websocket_connect(f"/ws/peer/{room}?token={auth_token}") as websocket:
+        websocket.send_text('"just a string"')
+        assert websocket.receive_json()["type"] == "error"
+        websocket.send_json({"message": "still here"})
+        assert websocket.receive_json()["message"] == "still here"
+
+def test_chat_websocket_requires_token():
+    """Test that unauthenticated chat sockets are refused"""
+    with pytest.raises(WebSocketDisconnect):
+        with client.websocket_connect("/ws/chat") as websocket:
+            websocket.receive_text()
+
+@pytest.mark.asyncio
+async def test_chat_stream_cancelled_on_disconnect(monkeypatch):
+    """Test that closing a session stops generation and stores the partial turn"""
+    from app.services import chat_stream
+    
+    class SlowChatbot(ChatbotService):
+        async def stream_response(self, message, matches=None, chunk_words=3, category=None):
+            for word in ["one ", "two ", "three "]:
+                yield word
+                await asyncio.sleep(0.2)
+    
+    class FakeWebSocket:
+        async def accept(self):
+            pass
+        
+        async def send_text(self, message):
+            pass
+    
+    stored = []
+    async def fake_persist(record, durable):
+        stored.append(record)
+    
+    monkeypatch.setattr(chat_stream, "persist_turn", fake_persist)
+    
+    websocket = FakeWebSocket()
+    await chat_stream.manager.connect(websocket)
+    session = chat_stream.ChatStreamSession(websocket, "subject", chatbot=SlowChatbot())
+    session.start()
+    await session.submit({"content": "hello"})
+    await asyncio.sleep(0.1)
+    await session.close()
+    chat_stream.manager.disconnect(websocket)
+    await asyncio.sleep(0.01)
+    
+    assert [record.response for record in stored] == ["one "]
+
+def test_chat_websocket_msgpack_subprotocol(auth_token):
+    """Test that clients negotiating MessagePack get binary frames"""
+    msgpack = pytest.importorskip("msgpack")
+    with client.websocket_connect(
+        f"/ws/chat?token={auth_token}",
+        subprotocols=["sahara.msgpack"]
+    ) as websocket:
+        assert websocket.accepted_subprotocol == "sahara.msgpack"
+        websocket.send_bytes(msgpack.packb({"content": "I feel anxious"}))
+        start = msgpack.unpackb(websocket.receive_bytes())
+        assert start["type"] == "start"
+        assert start["risk_detected"] is False
+
+def test_peer_websocket_mixed_codecs(auth_token):
+    """Test that one room message reaches JSON and MessagePack subscribers"""
+    msgpack = pytest.importorskip("msgpack")
+    room = f"room-{uuid.uuid4()}"
+    url = f"/ws/peer/{room}?token={auth_token}"
+    with client.websocket_connect(url) as json_subscriber:
+        with client.websocket_connect(url + "&format=msgpack") as binary_subscriber:
+            binary_subscriber.send_bytes(msgpack.packb({"message": "hello both"}))
+            assert msgpack.unpackb(binary_subscriber.receive_bytes())["message"] == "hello both"
+            assert json_subscriber.receive_json()["message"] == "hello both"
+
+def test_chat_history_fast_json_matches_default(auth_token, monkeypatch):
+    """Test that the pre-rendered list response keeps body and cursor header"""
+    from app.core.config import settings
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    for i in range(3):
+        client.post("/api/v1/chat/ai", json={"message": f"fast {i}"}, headers=headers)
+    
+    default = client.get("/api/v1/chat/history", params={"limit": 2}, headers=headers)
+    monkeypatch.setattr(settings, "FAST_JSON_RESPONSES", True)
+    fast = client.get("/api/v1/chat/history", params={"limit": 2}, headers=headers)
+    
+    assert fast.status_code == 200
+    assert fast.json() == default.json()
+    assert fast.headers["X-Next-Cursor"] == default.headers["X-Next-Cursor"]
+    assert fast.headers["content-type"] == "application/json"
@@ -0,0 +1,108 @@
+"""
+Test WebSocket fan-out in the connection manager
+"""
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.services.connection_manager import ConnectionManager
+
+client = TestClient(app)
+
+class FakeWebSocket:
+    """Records sent messages; ``delay`` simulates a slow mobile client"""
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.sent = []
+        self.closed_with = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.sent.append(message)
+
+    async def send_bytes(self, message):
+        await self.send_text(message)
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+def test_websocket_chat_roundtrip():
+    """Test that replies on /ws/chat go through the manager's writer"""
+    token = client.post("/api/v1/auth/anonymous").json()["access_token"]
+    with client.websocket_connect(f"/ws/chat?token={token}") as websocket:
+        websocket.send_text('{"content": "hello"}')
+        assert websocket.receive_json()["type"] == "start"
+
+@pytest.mark.asyncio
+async def test_slow_client_does_not_delay_others():
+    """Test that broadcast returns immediately and fast clients are served first"""
+    manager = ConnectionManager(queue_size=10)
+    fast = [FakeWebSocket() for _ in range(20)]
+    slow = FakeWebSocket(delay=0.5)
+    for websocket in fast + [slow]:
+        await manager.connect(websocket)
+
+    await manager.broadcast("hello")
+    await asyncio.sleep(0.05)
+
+    assert all(websocket.sent == ["hello"] for websocket in fast)
+    assert slow.sent == []
+
+    for websocket in fast + [slow]:
+        manager.disconnect(websocket)
+    await asyncio.sleep(0.01)
+    assert manager.stats()["connections"] == 0
+
+@pytest.mark.asyncio
+async def test_slow_consumer_policies():
+    """Test drop-oldest and disconnect handling of full client queues"""
+    dropping = ConnectionManager(queue_size=2, slow_consumer_policy="drop_oldest")
+    stuck = FakeWebSocket(delay=10)
+    await dropping.connect(stuck)
+    for i in range(5):
+        await dropping.broadcast(f"m{i}")
+    assert dropping.stats()["messages_dropped"] >= 2
+    dropping.disconnect(stuck)
+    await asyncio.sleep(0.01)
+
+    evicting = ConnectionManager(queue_size=1, slow_consumer_policy="disconnect")
+    stuck = FakeWebSocket(delay=10)
+    await evicting.connect(stuck)
+    for i in range(5):
+        await evicting.broadcast(f"m{i}")
+    await asyncio.sleep(0)
+
+    assert evicting.stats()["clients_evicted"] == 1
+    assert evicting.stats()["connections"] == 0
+    await asyncio.sleep(0.01)
+    assert stuck.closed_with == 1013
+
+@pytest.mark.asyncio
+async def test_direct_replies_never_block_on_a_stuck_client():
+    """Test that replies to a full or dead client return at once"""
+    evicting = ConnectionManager(queue_size=1, slow_consumer_policy="disconnect")
+    stuck = FakeWebSocket(delay=10)
+    await evicting.connect(stuck)
+    for i in range(5):
+        await asyncio.wait_for(evicting.send_payload({"type": "chunk", "i": i}, stuck), 0.1)
+    assert evicting.stats()["clients_evicted"] == 1
+    assert evicting.stats()["connections"] == 0
+    await asyncio.wait_for(evicting.send_personal_message("late", stuck), 0.1)
+    
+    dropping = ConnectionManager(queue_size=1, slow_consumer_policy="drop_oldest")
+    stuck = FakeWebSocket(delay=10)
+    client = dropping.register(stuck)
+    for i in range(5):
+        await asyncio.wait_for(dropping.send_personal_message(f"m{i}", stuck), 0.1)
+    assert dropping.stats()["messages_dropped"] >= 3
+    
+    # A writer that died without unregistering the socket
+    client.writer.cancel()
+    await asyncio.gather(client.writer, return_exceptions=True)
+    await asyncio.wait_for(dropping.send_personal_message("after", stuck), 0.1)
+    assert dropping.stats()["connections"] == 0
+    await asyncio.sleep(0.01)
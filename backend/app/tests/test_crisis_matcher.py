@@ -0,0 +1,73 @@
+"""
+Test the single-pass crisis keyword matcher
+"""
+import pytest
+from app.services.crisis_matcher import CHATBOT_KEYWORDS, ESCALATION_TRIGGERS, CrisisMatcher, crisis_matcher
+from app.services.chatbot import ChatbotService
+from app.services.risk_escalation import RiskEscalationService
+
+def test_scan_reports_categories_and_offsets():
+    """Test that one scan returns every category hit with source offsets"""
+    text = "I feel hopeless and want to die"
+    result = crisis_matcher.scan(text)
+
+    assert result.has("crisis")
+    assert result.has("depression")
+    assert result.has("crisis_language")
+    assert result.has("suicide_ideation")
+
+    for match in result.matches:
+        assert text[match.start:match.end].casefold() == match.keyword
+
+def test_scan_respects_word_boundaries():
+    """Test that keywords must start a word, and end one unless prefixes are on"""
+    assert not crisis_matcher.scan("Someone spills coffee on the floor").has("substance_abuse")
+    assert crisis_matcher.scan("I took too many pills").has("substance_abuse")
+
+    whole_words = CrisisMatcher({"substance_abuse": ["pills"]})
+    assert not whole_words.scan("the pillsbury box").has("substance_abuse")
+    assert whole_words.scan("some pills").has("substance_abuse")
+
+def substring_categories(text):
+    """The matching this replaced: plain substring search per keyword"""
+    lowered = text.lower()
+    return {
+        category
+        for category, keywords in {**CHATBOT_KEYWORDS, **ESCALATION_TRIGGERS}.items()
+        if any(keyword in lowered for keyword in keywords)
+    }
+
+@pytest.mark.parametrize("text", [
+    "The hopelessness is crushing me",
+    "I keep thinking about suicides in my family",
+    "I've been self-harming again",
+    "I was panicking all night",
+    "Overdoses scare me but I've thought about it",
+    "Cutting is the only thing that helps",
+    "I feel so empty and sad lately, saddest I've been",
+    "Stop worrying, he said, but the depression keeps coming back",
+    "I'm taking pills, too many of them, every day",
+    "Sometimes I think everyone is better off dead without me",
+    "My anxiety and nervousness are getting worse",
+    "I just had a normal day at school today",
+])
+def test_crisis_terms_match_like_substring_search(text):
+    """Test that inflected crisis terms still match, with substring search as the oracle"""
+    assert crisis_matcher.scan(text).categories == substring_categories(text)
+
+def test_scan_casefolds_unicode():
+    """Test casefolded matching with offsets mapped back to the original text"""
+    matcher = CrisisMatcher({"test": ["strasse"]})
+    text = "Die STRASSE und die Straße"
+    result = matcher.scan(text)
+
+    assert [text[m.start:m.end] for m in result.matches] == ["STRASSE", "Straße"]
+
+def test_services_share_a_single_scan():
+    """Test chatbot and escalation service results from one precomputed scan"""
+    message = "I want to kill myself"
+    matches = crisis_matcher.scan(message)
+
+    response, risk = ChatbotService().get_response(message, matches)
+    assert risk is True
+    assert RiskEscalationService().assess_risk_level(message, matches=matches) == "high"
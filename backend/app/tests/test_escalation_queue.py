@@ -0,0 +1,143 @@
+"""
+Test the durable risk escalation queue and its worker pool
+"""
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event, select
+from app.main import app
+from app.core.security import verify_token_cached
+from app.db.base import AsyncSessionLocal
+from app.db.models.escalation import Escalation
+from app.services.escalation_queue import PRIORITIES, EscalationQueue, EscalationWorkerPool
+
+client = TestClient(app)
+
+async def enqueue(queue, priority, session_id="anon:test"):
+    return await queue.enqueue(session_id, "high", priority, "I need help", ["Provide crisis resources"])
+
+@pytest.mark.asyncio
+async def test_claims_follow_priority_then_age(session_factory):
+    """Test that urgent items are claimed before older high and normal ones"""
+    queue = EscalationQueue(session_factory)
+    normal = await enqueue(queue, "normal")
+    high = await enqueue(queue, "high")
+    urgent = await enqueue(queue, "urgent")
+    later_urgent = await enqueue(queue, "urgent")
+    
+    claimed = [(await queue.claim()).id for _ in range(4)]
+    assert claimed == [urgent, later_urgent, high, normal]
+    assert await queue.claim() is None
+    assert (await queue.backlog())["urgent"]["depth"] == 2
+
+@pytest.mark.asyncio
+async def test_claim_walks_the_claim_index(session_factory):
+    """Test that the claim reads the claim index in order instead of sorting"""
+    queue = EscalationQueue(session_factory)
+    await enqueue(queue, "high")
+    engine = session_factory.kw["bind"].sync_engine
+    claims = []
+    
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("UPDATE escalations SET status"):
+            claims.append((statement, parameters))
+    
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        assert await queue.claim() is not None
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+    
+    statement, parameters = claims[0]
+    async with session_factory() as db:
+        raw = await (await db.connection()).get_raw_connection()
+        cursor = await raw.driver_connection.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+        plan = " / ".join(row[3] for row in await cursor.fetchall())
+    assert "USING INDEX ix_escalations_claim" in plan
+    assert "TEMP B-TREE" not in plan
+
+@pytest.mark.asyncio
+async def test_expired_lease_is_redelivered(session_factory):
+    """Test at-least-once delivery when a worker never acknowledges"""
+    queue = EscalationQueue(session_factory, visibility_timeout=0)
+    item_id = await enqueue(queue, "high")
+    
+    first = await queue.claim()
+    second = await queue.claim()
+    assert first.id == second.id == item_id
+    assert second.attempts == 2
+    # The first worker's lease is gone, so its acknowledgement is ignored
+    assert not await queue.complete(first, [])
+    assert await queue.complete(second, ["done"])
+    assert await queue.claim() is None
+
+@pytest.mark.asyncio
+async def test_failures_retry_then_park(session_factory):
+    """Test that failed items come back after a delay and are parked after max attempts"""
+    queue = EscalationQueue(session_factory, max_attempts=2, retry_delay=0)
+    item_id = await enqueue(queue, "normal")
+    
+    await queue.fail(await queue.claim(), "smtp down")
+    retry = await queue.claim()
+    assert retry.id == item_id
+    await queue.fail(retry, "smtp down")
+    assert await queue.claim() is None
+    
+    async with session_factory() as db:
+        row = await db.get(Escalation, item_id)
+    assert row.status == "failed"
+    assert row.last_error == "smtp down"
+    assert queue.stats()["failed"] == 1
+
+@pytest.mark.asyncio
+async def test_urgent_items_bypass_busy_workers(session_factory):
+    """Test that an urgent item is handled while every general worker is stuck"""
+    queue = EscalationQueue(session_factory)
+    release = asyncio.Event()
+    handled = []
+    
+    async def notify(item):
+        if item.priority == PRIORITIES["normal"]:
+            await release.wait()
+        handled.append(item.priority)
+    
+    pool = EscalationWorkerPool(queue, notify, workers=1, urgent_workers=1, poll_interval=0.01)
+    await pool.start()
+    try:
+        for _ in range(3):
+            await enqueue(queue, "normal")
+        await asyncio.sleep(0.05)
+        await enqueue(queue, "urgent")
+        for _ in range(100):
+            if handled:
+                break
+            await asyncio.sleep(0.01)
+        assert handled == [PRIORITIES["urgent"]]
+        
+        release.set()
+        for _ in range(100):
+            if pool.processed == 4:
+                break
+            await asyncio.sleep(0.01)
+        assert sorted(handled) == [0, 2, 2, 2]
+        stats = await pool.stats()
+        assert stats["processed"] == 4
+        assert stats["backlog"]["normal"]["depth"] == 0
+    finally:
+        await pool.stop()
+
+@pytest.mark.asyncio
+async def test_chat_turn_is_escalated():
+    """Test that a high-risk /chat/ai message is queued and reported as escalated"""
+    token = client.post("/api/v1/auth/anonymous").json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    
+    calm = client.post("/api/v1/chat/ai", json={"message": "Hello there"}, headers=headers)
+    assert calm.json()["escalated"] is False
+    response = client.post("/api/v1/chat/ai", json={"message": "I want to kill myself"}, headers=headers)
+    assert response.json()["escalated"] is True
+    
+    subject = verify_token_cached(token)
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(select(Escalation).where(Escalation.session_id == subject))).scalars().all()
+    assert [(row.priority, row.status) for row in rows] == [(PRIORITIES["urgent"], "pending")]
@@ -0,0 +1,115 @@
+"""
+Test the chatbot inference backends and micro-batching scheduler
+"""
+import asyncio
+import pytest
+from app.services.chatbot import ChatbotService
+from app.services.inference import (
+    InferenceBackend, InferenceUnavailable, MicroBatcher, NumpyClassifierBackend, chat_inference
+)
+
+class RecordingBackend(InferenceBackend):
+    """Labels every message with a fixed category and remembers batch sizes"""
+    name = "recording"
+    
+    def __init__(self, label="general", delay=0.0):
+        self.label = label
+        self.delay = delay
+        self.batches = []
+    
+    async def run_batch(self, texts):
+        self.batches.append(len(texts))
+        await asyncio.sleep(self.delay)
+        return [f"{self.label}:{text}" if self.label == "echo" else self.label for text in texts]
+
+def test_keyword_model_matches_categories(tmp_path):
+    """Test the keyword-derived model, batched, and a save/load round trip"""
+    model = NumpyClassifierBackend.from_keywords()
+    texts = ["I feel so anxious about exams", "I've been really sad lately", "What a nice day", ""]
+    assert model.predict_batch(texts) == ["anxiety", "depression", "general", "general"]
+    
+    path = tmp_path / "model.npz"
+    model.save(path)
+    assert NumpyClassifierBackend.load(path).predict_batch(texts) == model.predict_batch(texts)
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_a_batch():
+    """Test that concurrent predictions are answered in order from one batch"""
+    backend = RecordingBackend("echo")
+    batcher = MicroBatcher(max_batch=8, max_wait_ms=20, max_queue=64, timeout=1)
+    await batcher.start(backend)
+    try:
+        results = await asyncio.gather(*(batcher.predict(f"m{i}") for i in range(12)))
+    finally:
+        await batcher.stop()
+    assert results == [f"echo:m{i}" for i in range(12)]
+    assert backend.batches == [8, 4]
+    assert batcher.stats()["avg_batch_size"] == 6
+
+@pytest.mark.asyncio
+async def test_overload_and_timeout_raise_unavailable():
+    """Test that a full queue or a slow backend makes predict give up"""
+    batcher = MicroBatcher(max_batch=1, max_wait_ms=0, max_queue=1, timeout=0.05)
+    await batcher.start(RecordingBackend(delay=0.2))
+    try:
+        first = asyncio.ensure_future(batcher.predict("a"))
+        await asyncio.sleep(0.01)
+        second = asyncio.ensure_future(batcher.predict("b"))
+        with pytest.raises(InferenceUnavailable):
+            await batcher.predict("c")
+        for pending in (first, second):
+            with pytest.raises(InferenceUnavailable):
+                await pending
+    finally:
+        await batcher.stop()
+    fallbacks = batcher.stats()["fallbacks"]
+    assert fallbacks["overloaded"] == 1
+    assert fallbacks["timeouts"] == 2
+
+@pytest.mark.asyncio
+async def test_chatbot_keeps_crisis_and_falls_back():
+    """Test that the model can't downgrade a crisis and errors use keywords"""
+    chatbot = ChatbotService()
+    await chat_inference.start(RecordingBackend("depression"))
+    try:
+        assert await chatbot.classify("I want to kill myself") == "crisis"
+        assert await chatbot.classify("Nothing much today") == "depression"
+        chat_inference.backend.label = "not-a-category"
+        assert await chatbot.classify("I feel anxious") == "anxiety"
+    finally:
+        await chat_inference.stop()
+    assert await chatbot.classify("Nothing much today") == "general"
+
+@pytest.mark.asyncio
+async def test_model_crisis_label_flags_rest_and_stream_turns(monkeypatch):
+    """Test that /chat/ai and /ws/chat flag and escalate when only the model sees a crisis"""
+    import uuid
+    from app.api.chat import ChatRequest, chat_with_ai
+    from app.db.base import AsyncSessionLocal
+    from app.services import chat_stream
+    
+    async def fake_persist(record, durable):
+        pass
+    
+    monkeypatch.setattr(chat_stream, "persist_turn", fake_persist)
+    chatbot = ChatbotService()
+    session = chat_stream.ChatStreamSession(None, f"anon:{uuid.uuid4()}", chatbot=chatbot)
+    sent = []
+    async def capture(payload):
+        sent.append(payload)
+    session._send = capture
+    
+    message = "Nothing much today"
+    await chat_inference.start(RecordingBackend("crisis"))
+    try:
+        async with AsyncSessionLocal() as db:
+            reply = await chat_with_ai(ChatRequest(message=message), subject=f"anon:{uuid.uuid4()}", db=db)
+        await session._turn(message, None)
+    finally:
+        await chat_inference.stop()
+    
+    assert reply.risk_detected and reply.escalated and "988" in reply.response
+    start, done = sent[0], sent[-1]
+    assert start["risk_detected"] and done["risk_detected"]
+    assert start["risk_level"] == "high" and start["escalated"] and done["escalated"]
+    assert "988" in done["content"]
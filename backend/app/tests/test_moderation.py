@@ -0,0 +1,203 @@
+"""
+Test peer chat moderation: the send-time fast path and the batched workers
+"""
+import asyncio
+import json
+import uuid
+from datetime import datetime, timedelta
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+from app.main import app
+from app.db.base import SessionLocal
+from app.db.models.chat import PeerChat
+from app.db.models.escalation import Escalation
+from app.services import moderation
+from app.services.inference import NumpyClassifierBackend
+from app.services.moderation import ModerationClassifier, PeerModerator, create_moderation_classifier
+
+client = TestClient(app)
+
+@pytest.fixture
+def published(monkeypatch):
+    """Room events published by the moderator"""
+    events = []
+    
+    async def publish(room_id, message):
+        events.append((room_id, json.loads(message)))
+    
+    monkeypatch.setattr(moderation.manager, "publish", publish)
+    return events
+
+async def store(session_factory, *texts, created_at=None):
+    async with session_factory() as db:
+        rows = [
+            PeerChat(room_id="room", session_id="anon:test", message=text, created_at=created_at or datetime.utcnow())
+            for text in texts
+        ]
+        db.add_all(rows)
+        await db.commit()
+    return [row.id for row in rows]
+
+async def flags(session_factory):
+    async with session_factory() as db:
+        result = await db.execute(select(PeerChat.message, PeerChat.is_moderated, PeerChat.is_flagged).order_by(PeerChat.id))
+        return {message: (moderated, flagged) for message, moderated, flagged in result.all()}
+
+def test_unsafe_message_is_blocked_on_send():
+    """Test that obviously unsafe messages are stored flagged and never listed"""
+    token = client.post("/api/v1/auth/anonymous").json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    room = f"room-{uuid.uuid4().hex[:8]}"
+    
+    blocked = client.post("/api/v1/chat/peer", json={"room_id": room, "message": "Just go die"}, headers=headers)
+    assert blocked.json()["status"] == "flagged"
+    sent = client.post("/api/v1/chat/peer", json={"room_id": room, "message": "Hang in there"}, headers=headers)
+    assert sent.json()["status"] == "sent"
+    
+    listed = client.get(f"/api/v1/chat/peer/{room}", headers=headers).json()
+    assert [message["message"] for message in listed] == ["Hang in there"]
+
+def test_blocked_crisis_message_is_escalated():
+    """Test that a blocked method-seeking message reaches the escalation queue"""
+    token = client.post("/api/v1/auth/anonymous").json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    room = f"room-{uuid.uuid4().hex[:8]}"
+    
+    response = client.post(
+        "/api/v1/chat/peer", json={"room_id": room, "message": "what is a lethal dose of my meds"}, headers=headers
+    ).json()
+    assert response["status"] == "flagged"
+    assert response["escalated"] is True
+    assert response["resources"]
+    
+    with SessionLocal() as db:
+        stored = db.get(PeerChat, response["message_id"])
+        assert stored.is_flagged and stored.escalated
+        escalation = db.query(Escalation).filter(Escalation.session_id == stored.session_id).one()
+        assert (escalation.risk_level, escalation.priority) == ("high", 0)
+    
+    # Abuse aimed at someone else is blocked without an escalation
+    incitement = client.post("/api/v1/chat/peer", json={"room_id": room, "message": "just go die"}, headers=headers).json()
+    assert (incitement["status"], incitement["escalated"], incitement["resources"]) == ("flagged", False, [])
+
+def test_blocked_sender_is_told_over_websocket():
+    """Test that /ws/peer answers a blocked message with a flagged frame"""
+    token = client.post("/api/v1/auth/anonymous").json()["access_token"]
+    room = f"room-{uuid.uuid4().hex[:8]}"
+    
+    with client.websocket_connect(f"/ws/peer/{room}?token={token}") as websocket:
+        websocket.send_json({"message": "how to kill myself"})
+        notice = websocket.receive_json()
+        assert notice["type"] == "flagged"
+        assert notice["escalated"] is True
+        assert notice["resources"]
+        
+        websocket.send_json({"message": "Hang in there"})
+        assert websocket.receive_json()["message"] == "Hang in there"
+
+@pytest.mark.asyncio
+async def test_workers_settle_queued_messages_in_batches(session_factory, published):
+    """Test that queued ids are moderated together and flagged ones are retracted"""
+    moderator = PeerModerator(session_factory, workers=1, batch_size=16, max_wait_ms=50, sweep_interval=60)
+    ids = await store(
+        session_factory,
+        "Does anyone else feel so stupid after exams?",
+        "Shut up, you loser",
+        "DM me for a promo code",
+        "Breathing exercises help me"
+    )
+    await moderator.start()
+    try:
+        for message_id in ids:
+            moderator.submit(message_id)
+        while moderator.moderated < len(ids):
+            await asyncio.sleep(0.01)
+    finally:
+        await moderator.stop()
+    
+    assert await flags(session_factory) == {
+        "Does anyone else feel so stupid after exams?": (True, False),
+        "Shut up, you loser": (True, True),
+        "DM me for a promo code": (True, True),
+        "Breathing exercises help me": (True, False)
+    }
+    assert published == [
+        ("room", {"type": "peer_message_removed", "id": ids[1]}),
+        ("room", {"type": "peer_message_removed", "id": ids[2]})
+    ]
+    stats = moderator.stats()
+    assert stats["batches"] == 1
+    assert stats["flagged"] == 2
+    assert stats["lag_ms"]["max"] > 0
+    # Already settled rows are skipped
+    assert await moderator.moderate(ids) == []
+
+class KeywordClassifier(ModerationClassifier):
+    name = "keyword"
+    
+    def __init__(self, fail=False):
+        self.fail = fail
+    
+    async def unsafe_probabilities(self, texts):
+        if self.fail:
+            raise RuntimeError("model unavailable")
+        return [0.9 if "scam" in text else 0.1 for text in texts]
+
+@pytest.mark.asyncio
+async def test_classifier_flags_what_the_matcher_misses(session_factory, published):
+    """Test the optional classifier, and that its failures don't block moderation"""
+    ids = await store(session_factory, "Great scam opportunity", "Thanks everyone")
+    moderator = PeerModerator(session_factory, classifier=KeywordClassifier())
+    assert await moderator.moderate(ids) == [ids[0]]
+    
+    more = await store(session_factory, "Another scam", "Click here")
+    failing = PeerModerator(session_factory, classifier=KeywordClassifier(fail=True))
+    assert await failing.moderate(more) == [more[1]]
+    assert failing.stats()["classifier_errors"] == 1
+    assert (await flags(session_factory))["Another scam"] == (True, False)
+
+@pytest.mark.asyncio
+async def test_numpy_classifier_from_settings(session_factory, published, tmp_path):
+    """Test the shipped classifier loaded from a model file, as the settings select it"""
+    path = tmp_path / "moderation.npz"
+    NumpyClassifierBackend.from_keywords({"unsafe": ["meet me alone", "send me money"]}).save(path)
+    classifier = create_moderation_classifier("numpy", str(path))
+    unsafe, clean = await classifier.unsafe_probabilities(["Please send me money", "Thanks everyone"])
+    assert unsafe > 0.5 > clean
+    
+    ids = await store(session_factory, "Please send me money", "Thanks everyone")
+    moderator = PeerModerator(session_factory, threshold=0.5)
+    await moderator.start(classifier)
+    await moderator.stop()
+    assert moderator.classifier is classifier
+    assert await moderator.moderate(ids) == [ids[0]]
+    
+    assert create_moderation_classifier("none") is None
+    with pytest.raises(ValueError):
+        create_moderation_classifier("numpy")
+    NumpyClassifierBackend.from_keywords({"spam": ["buy now"]}).save(path)
+    with pytest.raises(ValueError):
+        create_moderation_classifier("numpy", str(path))
+
+@pytest.mark.asyncio
+async def test_sweep_requeues_leftovers(session_factory, published):
+    """Test that messages that never made it into the queue are moderated later"""
+    old = datetime.utcnow() - timedelta(minutes=5)
+    ids = await store(session_factory, "you're pathetic", "Good morning", created_at=old)
+    recent = await store(session_factory, "Just posted")
+    moderator = PeerModerator(session_factory, workers=1, max_queue=1, sweep_interval=60)
+    await moderator.start()
+    try:
+        # The queue is full, so this id overflows
+        moderator.submit(recent[0])
+        moderator.submit(recent[0])
+        while moderator.moderated < 3:
+            await asyncio.sleep(0.01)
+    finally:
+        await moderator.stop()
+    stats = moderator.stats()
+    assert stats["swept"] == 2
+    assert stats["overflowed"] == 1
+    assert (await flags(session_factory))["you're pathetic"] == (True, True)
+    assert stats["lag_ms"]["max"] >= 5 * 60 * 1000
@@ -0,0 +1,147 @@
+"""
+Test the remote model backend against a local stub model server
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+import pytest
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from app.services.chatbot import ChatbotService
+from app.services.inference import InferenceUnavailable, MicroBatcher, chat_inference
+from app.services.remote_inference import MIN_HEDGE_SAMPLES, CircuitBreaker, RemoteModelBackend
+
+stub = FastAPI()
+stub.state.delays = deque()  # seconds to stall, one per request
+stub.state.failing = False
+stub.state.label = "anxiety"
+stub.state.requests = 0
+stub.state.client_ports = set()
+
+@stub.post("/classify")
+async def classify(request: Request):
+    stub.state.requests += 1
+    stub.state.client_ports.add(request.client.port)
+    if stub.state.delays:
+        await asyncio.sleep(stub.state.delays.popleft())
+    if stub.state.failing:
+        return JSONResponse({"detail": "model crashed"}, status_code=500)
+    messages = (await request.json())["messages"]
+    return {"labels": [stub.state.label] * len(messages)}
+
+@pytest.fixture(scope="module")
+def stub_url():
+    """Serve the stub with uvicorn on a free port in a background thread"""
+    server = uvicorn.Server(uvicorn.Config(stub, host="127.0.0.1", port=0, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    yield f"http://127.0.0.1:{port}/classify"
+    server.should_exit = True
+    thread.join(5)
+
+@pytest.fixture(autouse=True)
+def reset_stub():
+    stub.state.delays.clear()
+    stub.state.failing = False
+    stub.state.label = "anxiety"
+    stub.state.requests = 0
+    stub.state.client_ports.clear()
+
+@pytest.mark.asyncio
+async def test_calls_reuse_pooled_connections(stub_url):
+    """Test that sequential calls share one kept-alive connection"""
+    backend = RemoteModelBackend(stub_url, timeout=2, hedge_percentile=0)
+    await backend.start()
+    try:
+        for _ in range(5):
+            assert await backend.run_batch(["a", "b"]) == ["anxiety", "anxiety"]
+    finally:
+        await backend.close()
+    assert stub.state.requests == 5
+    assert len(stub.state.client_ports) == 1
+
+@pytest.mark.asyncio
+async def test_slow_call_is_hedged(stub_url):
+    """Test that a call slower than the latency percentile is raced by a second one"""
+    backend = RemoteModelBackend(stub_url, timeout=2, hedge_percentile=95)
+    await backend.start()
+    try:
+        for _ in range(MIN_HEDGE_SAMPLES):
+            await backend.run_batch(["warm up"])
+        stub.state.delays.extend([1.0, 0.0])
+        started = time.perf_counter()
+        assert await backend.run_batch(["hello"]) == ["anxiety"]
+        assert time.perf_counter() - started < 0.5
+    finally:
+        await backend.close()
+    stats = backend.stats()
+    assert stats["hedged"] == 1
+    assert stats["hedge_wins"] == 1
+
+@pytest.mark.asyncio
+async def test_breaker_opens_and_recovers(stub_url):
+    """Test that repeated failures stop calls until a probe succeeds"""
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.2)
+    backend = RemoteModelBackend(stub_url, timeout=0.1, hedge_percentile=0, breaker=breaker)
+    await backend.start()
+    try:
+        stub.state.failing = True
+        with pytest.raises(InferenceUnavailable):
+            await backend.run_batch(["a"])
+        # A timeout counts as a failure too
+        stub.state.delays.append(0.5)
+        with pytest.raises(InferenceUnavailable):
+            await backend.run_batch(["a"])
+        assert breaker.state == "open"
+        
+        requests = stub.state.requests
+        with pytest.raises(InferenceUnavailable, match="circuit open"):
+            await backend.run_batch(["a"])
+        assert stub.state.requests == requests
+        
+        stub.state.failing = False
+        await asyncio.sleep(0.25)
+        assert await backend.run_batch(["a"]) == ["anxiety"]
+        assert breaker.state == "closed"
+    finally:
+        await backend.close()
+
+@pytest.mark.asyncio
+async def test_chatbot_falls_back_when_upstream_fails(stub_url):
+    """Test that chat replies use keywords while the model server is down"""
+    chatbot = ChatbotService()
+    backend = RemoteModelBackend(stub_url, timeout=0.5, hedge_percentile=0, breaker=CircuitBreaker(1, 60))
+    await chat_inference.start(backend)
+    try:
+        stub.state.label = "depression"
+        assert await chatbot.classify("Nothing much today") == "depression"
+        stub.state.failing = True
+        assert await chatbot.classify("Nothing much today") == "general"
+        assert await chatbot.classify("I'm so worried") == "anxiety"
+        assert backend.stats()["breaker"]["state"] == "open"
+        assert chat_inference.stats()["fallbacks"]["refused_by_backend"] == 2
+    finally:
+        await chat_inference.stop()
+
+@pytest.mark.asyncio
+async def test_batches_run_concurrently_over_the_pool(stub_url):
+    """Test that the batcher keeps several remote calls in flight"""
+    backend = RemoteModelBackend(stub_url, max_connections=8, timeout=2, hedge_percentile=0)
+    batcher = MicroBatcher(max_batch=1, max_wait_ms=0, timeout=2)
+    await batcher.start(backend)
+    try:
+        stub.state.delays.extend([0.3] * 8)
+        started = time.perf_counter()
+        labels = await asyncio.gather(*(batcher.predict(f"message {i}") for i in range(8)))
+        assert labels == ["anxiety"] * 8
+        # One at a time this would take 2.4s
+        assert time.perf_counter() - started < 1.0
+    finally:
+        await batcher.stop()
+    assert len(stub.state.client_ports) > 2
+    assert batcher.stats()["max_concurrency"] == 8
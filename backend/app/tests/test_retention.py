@@ -0,0 +1,136 @@
+"""
+Test retention policies, batched purges and incremental vacuum
+"""
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import func, select
+from app.db.models.chat import ChatMessage, PeerChat
+from app.db.models.escalation import Escalation
+from app.db.models.screening import Screening
+from app.db.models.user import AnonymousUser
+from app.services.retention import RetentionJob, RetentionPolicy, RetentionService, default_policies
+
+def policies(days=30):
+    return [
+        RetentionPolicy(ChatMessage, ChatMessage.created_at, days, True),
+        RetentionPolicy(PeerChat, PeerChat.created_at, days, True),
+        RetentionPolicy(AnonymousUser, AnonymousUser.last_active, days, False),
+    ]
+
+async def seed(session_factory):
+    now = datetime.utcnow()
+    old = now - timedelta(days=90)
+    async with session_factory() as db:
+        # 250 old chat messages, then 50 new ones. Id 150 was written out of
+        # order, right where the binary search looks first
+        db.add_all(
+            ChatMessage(session_id="s", message="x" * 500, created_at=now if i == 149 else old)
+            for i in range(250)
+        )
+        db.add_all(ChatMessage(session_id="s", message="recent", created_at=now) for _ in range(50))
+        db.add_all(PeerChat(room_id="r", session_id="s", message="hi", created_at=old) for _ in range(10))
+        # Session activity is unrelated to the id
+        db.add_all(
+            AnonymousUser(session_id=f"user-{i}", last_active=old if i % 2 else now) for i in range(40)
+        )
+        await db.commit()
+
+async def count(session_factory, model):
+    async with session_factory() as db:
+        return await db.scalar(select(func.count()).select_from(model))
+
+@pytest.mark.asyncio
+async def test_dry_run_counts_without_deleting(session_factory):
+    """Test that a dry run reports what a real run would delete"""
+    await seed(session_factory)
+    service = RetentionService(policies(), session_factory, batch_size=100, batch_pause_ms=0)
+    report = await service.run(dry_run=True)
+    assert {table: result["rows"] for table, result in report["tables"].items()} == {
+        "chat_messages": 249, "peer_chats": 10, "anonymous_users": 20
+    }
+    assert report["vacuum"] is None
+    assert await count(session_factory, ChatMessage) == 300
+
+@pytest.mark.asyncio
+async def test_purge_deletes_expired_rows_in_batches(session_factory):
+    """Test the id-range batches, the out-of-order row and the vacuum report"""
+    await seed(session_factory)
+    service = RetentionService(policies(), session_factory, batch_size=100, batch_pause_ms=0)
+    report = await service.run()
+    
+    chat = report["tables"]["chat_messages"]
+    # Ranges stop after the last expired rows instead of walking the new ones
+    assert (chat["rows"], chat["batches"]) == (249, 3)
+    assert report["tables"]["anonymous_users"]["batches"] == 1
+    assert report["rows"] == 249 + 10 + 20
+    assert report["vacuum"]["enabled"] and report["vacuum"]["pages_reclaimed"] > 0
+    
+    async with session_factory() as db:
+        kept = (await db.execute(select(ChatMessage.message))).scalars().all()
+        users = (await db.execute(select(AnonymousUser.session_id).order_by(AnonymousUser.id))).scalars().all()
+    assert kept == ["x" * 500] + ["recent"] * 50
+    assert users == [f"user-{i}" for i in range(0, 40, 2)]
+    assert await count(session_factory, PeerChat) == 0
+    
+    # Nothing left to do
+    assert (await service.run())["rows"] == 0
+
+@pytest.mark.asyncio
+async def test_job_skips_disabled_policies(session_factory):
+    """Test that tables without a retention period are kept and not reported"""
+    await seed(session_factory)
+    service = RetentionService(
+        [RetentionPolicy(PeerChat, PeerChat.created_at, 30, True), *policies(days=0)[::2]],
+        session_factory,
+        batch_pause_ms=0
+    )
+    job = RetentionJob(service)
+    report = await job.run_once()
+    assert list(report["tables"]) == ["peer_chats"]
+    assert await count(session_factory, ChatMessage) == 300
+    stats = job.stats()
+    assert stats["rows_purged"] == 10
+    assert stats["policies"] == {"peer_chats": 30, "chat_messages": 0, "anonymous_users": 0}
+    
+    assert not RetentionJob(RetentionService(policies(days=0), session_factory)).enabled
+
+@pytest.mark.asyncio
+async def test_settled_escalations_and_screenings_are_purged(session_factory):
+    """Test that only handled escalations go, and purged screenings reset their caches"""
+    old = datetime.utcnow() - timedelta(days=90)
+    async with session_factory() as db:
+        db.add_all(
+            Escalation(session_id="s", risk_level="high", priority=0, content_summary="quoted text",
+                       status=status, enqueued_at=old, visible_at=old)
+            for status in ("done", "pending", "failed", "done")
+        )
+        db.add_all(Screening(session_id="s", screening_type="PHQ9", score=5, completed_at=old) for _ in range(3))
+        db.add(Screening(session_id="s", screening_type="PHQ9", score=5))
+        await db.commit()
+    
+    resets = []
+    defaults = {policy.table: policy for policy in default_policies()}
+    assert {"escalations", "screenings"} <= set(defaults)
+    service = RetentionService(
+        [
+            defaults["escalations"]._replace(days=30),
+            defaults["screenings"]._replace(days=30, on_purge=lambda: resets.append(True)),
+        ],
+        session_factory,
+        batch_pause_ms=0
+    )
+    report = await service.run(dry_run=True)
+    assert report["rows"] == 2 + 3 and not resets
+    
+    report = await service.run()
+    assert {table: result["rows"] for table, result in report["tables"].items()} == {
+        "escalations": 2, "screenings": 3
+    }
+    assert resets == [True]
+    async with session_factory() as db:
+        statuses = (await db.execute(select(Escalation.status).order_by(Escalation.id))).scalars().all()
+    assert statuses == ["pending", "failed"]
+    assert await count(session_factory, Screening) == 1
+    
+    await service.run()
+    assert resets == [True]
@@ -0,0 +1,77 @@
+"""
+Test the per-session sliding-window risk state
+"""
+from datetime import datetime, timedelta
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.db.models.escalation import Escalation
+from app.services.risk_state import RiskStateStore, SessionRiskState
+
+client = TestClient(app)
+
+def test_counts_slide_with_the_window():
+    """Test that assessments older than the window stop counting"""
+    state = SessionRiskState(history=8, window=60)
+    state.record("moderate", at=0)
+    state.record("moderate", at=30)
+    state.record("high", at=50)
+    assert state.count("moderate", now=55) == 2
+    assert state.count("moderate", now=75) == 1
+    assert state.count("high", now=75) == 1
+    assert state.count("moderate", now=200) == 0
+
+def test_ring_buffer_keeps_latest_history():
+    """Test that a full buffer overwrites its oldest entries"""
+    state = SessionRiskState(history=3, window=1000)
+    for at, level in enumerate(["moderate", "moderate", "high", "high"]):
+        state.record(level, at=at)
+    assert state.size == 3
+    assert state.count("moderate", now=5) == 1
+    assert state.count("high", now=5) == 2
+
+def test_low_levels_keep_moderate_history():
+    """Test that ordinary chat doesn't push moderate assessments out of the buffer"""
+    state = SessionRiskState(history=3, window=1000)
+    state.record("moderate", at=0)
+    state.record("moderate", at=1)
+    for at in range(2, 40):
+        state.record("low" if at % 2 else "minimal", at=at)
+    assert state.size == 2
+    assert state.count("moderate", now=40) == 2
+
+@pytest.mark.asyncio
+async def test_lru_eviction_and_rehydration(session_factory):
+    """Test that evicted sessions are rebuilt from stored escalations"""
+    now = datetime.utcnow()
+    async with session_factory() as db:
+        db.add_all([
+            Escalation(session_id="anon:a", risk_level="moderate", priority=2, enqueued_at=now - timedelta(minutes=m))
+            for m in (1, 2)
+        ] + [
+            # Outside the window
+            Escalation(session_id="anon:a", risk_level="moderate", priority=2, enqueued_at=now - timedelta(days=2))
+        ])
+        await db.commit()
+    
+    store = RiskStateStore(session_factory, max_sessions=2, history=8, window_seconds=86400)
+    assert (await store.get("anon:a")).count("moderate") == 2
+    (await store.get("anon:b")).record("low")
+    await store.get("anon:a")
+    await store.get("anon:c")
+    # anon:b was least recently used
+    assert set(store._states) == {"anon:a", "anon:c"}
+    assert store.stats()["evictions"] == 1
+    assert (await store.get("anon:b")).count("low") == 0
+    assert store.stats()["hits"] == 1
+
+def test_repeated_moderate_risk_escalates():
+    """Test that the third moderate assessment in a day escalates the next one"""
+    token = client.post("/api/v1/auth/anonymous").json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    
+    escalated = [
+        client.post("/api/v1/chat/ai", json={"message": "I feel hopeless"}, headers=headers).json()["escalated"]
+        for _ in range(4)
+    ]
+    assert escalated == [False, False, False, True]
@@ -0,0 +1,70 @@
+"""
+Test the latest-screening score cache used by chat risk assessment
+"""
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.db.models.screening import Screening
+from app.services.screening_scores import ScreeningScoreCache
+
+client = TestClient(app)
+
+@pytest.mark.asyncio
+async def test_loads_latest_score_per_type_once(session_factory):
+    """Test that a miss loads the newest score per type and later reads hit"""
+    async with session_factory() as db:
+        db.add_all([
+            Screening(session_id="anon:a", screening_type="PHQ9", score=20),
+            Screening(session_id="anon:a", screening_type="PHQ9", score=4),
+            Screening(session_id="anon:a", screening_type="GAD7", score=16),
+            Screening(session_id="anon:b", screening_type="GHQ", score=12)
+        ])
+        await db.commit()
+    
+    cache = ScreeningScoreCache(session_factory)
+    assert await cache.get("anon:a") == {"PHQ9": 4, "GAD7": 16}
+    assert await cache.get("anon:a") == {"PHQ9": 4, "GAD7": 16}
+    # Sessions without screenings are cached as empty
+    assert await cache.get("anon:none") == {}
+    assert await cache.get("anon:none") == {}
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["misses"] == 2
+
+@pytest.mark.asyncio
+async def test_write_through_and_expiry(session_factory):
+    """Test write-through ordering, partial entries and TTL reloads"""
+    cache = ScreeningScoreCache(session_factory, ttl_seconds=60)
+    async with session_factory() as db:
+        stored = Screening(session_id="anon:a", screening_type="GAD7", score=9)
+        db.add(stored)
+        await db.commit()
+    
+    # Not loaded yet: the write-through is kept and merged with the load
+    cache.record("anon:a", "PHQ9", 100, 18)
+    assert await cache.get("anon:a") == {"PHQ9": 18, "GAD7": 9}
+    # An older screening never replaces a newer one
+    cache.record("anon:a", "PHQ9", 99, 2)
+    assert await cache.get("anon:a") == {"PHQ9": 18, "GAD7": 9}
+    
+    cache.invalidate("anon:a")
+    cache.ttl = 0
+    assert await cache.get("anon:a") == {"GAD7": 9}
+    await cache.get("anon:a")
+    assert cache.stats()["expired"] == 1
+
+def test_screening_scores_raise_chat_risk():
+    """Test that a severe PHQ-9 turns a moderate message into an escalation"""
+    token = client.post("/api/v1/auth/anonymous").json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    
+    before = client.post("/api/v1/chat/ai", json={"message": "I feel hopeless"}, headers=headers)
+    assert before.json()["escalated"] is False
+    
+    submitted = client.post(
+        "/api/v1/screenings/submit",
+        json={"screening_type": "PHQ9", "responses": {f"q{i}": 3 for i in range(1, 10)}},
+        headers=headers
+    )
+    assert submitted.json()["score"] == 27
+    after = client.post("/api/v1/chat/ai", json={"message": "I feel hopeless"}, headers=headers)
+    assert after.json()["escalated"] is True
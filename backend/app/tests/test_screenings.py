@@ -1,10 +1,17 @@
 """
 Test screening endpoints and scoring service
 """
+import csv
+import json
 import pytest
+from datetime import date, timedelta
 from fastapi.testclient import TestClient
 from app.main import app
+from app.core.config import settings
+from app.core.security import verify_token
+from app.services.screening_export import hash_session
 from app.services.screening_service import ScreeningService
+from app.cli import main as cli_main
 
 client = TestClient(app)
 
@@ -95,4 +102,169 @@ def test_anonymized_insights():
     
     data = response.json()
     assert "total_screenings" in data
-    assert "risk_distribution" in data
\ No newline at end of file
+    assert "risk_distribution" in data
+
+def test_insights_follow_submissions_and_date_range(auth_token):
+    """Test that insights counters are updated on submit and filtered by date"""
+    before = client.get("/api/v1/screenings/insights").json()["total_screenings"]
+    
+    client.post(
+        "/api/v1/screenings/submit",
+        json={"screening_type": "GAD7", "responses": {f"q{i}": 3 for i in range(1, 8)}},
+        headers={"Authorization": f"Bearer {auth_token}"}
+    )
+    
+    data = client.get("/api/v1/screenings/insights").json()
+    assert data["total_screenings"] == before + 1
+    assert any(
+        bucket["screening_type"] == "GAD7" and bucket["risk_level"] == "severe"
+        for bucket in data["risk_distribution"]
+    )
+    
+    future = (date.today() + timedelta(days=2)).isoformat()
+    response = client.get(f"/api/v1/screenings/insights?start_date={future}")
+    assert response.json()["total_screenings"] == 0
+
+def test_rebuild_rollups_matches_screenings():
+    """Test that the rebuild command reproduces the live counters"""
+    live = client.get("/api/v1/screenings/insights").json()["total_screenings"]
+    
+    assert cli_main(["rebuild-rollups"]) == 0
+    assert client.get("/api/v1/screenings/insights").json()["total_screenings"] == live
+
+def test_export_requires_configured_api_key(monkeypatch):
+    """Test that export is off by default and checks the API key when on"""
+    assert client.get("/api/v1/screenings/export").status_code == 403
+    
+    monkeypatch.setattr(settings, "EXPORT_API_KEY", "institution-key")
+    assert client.get("/api/v1/screenings/export").status_code == 401
+    response = client.get("/api/v1/screenings/export", headers={"X-API-Key": "wrong"})
+    assert response.status_code == 401
+
+def test_export_streams_anonymized_rows(auth_token, monkeypatch):
+    """Test NDJSON and CSV exports with type filter and hashed session ids"""
+    monkeypatch.setattr(settings, "EXPORT_API_KEY", "institution-key")
+    headers = {"X-API-Key": "institution-key"}
+    client.post(
+        "/api/v1/screenings/submit",
+        json={"screening_type": "GHQ", "responses": {f"q{i}": 1 for i in range(1, 7)}},
+        headers={"Authorization": f"Bearer {auth_token}"}
+    )
+    session_hash = hash_session(verify_token(auth_token))
+    
+    response = client.get(
+        "/api/v1/screenings/export",
+        params={"screening_type": "GHQ", "include_responses": True},
+        headers=headers
+    )
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert {row["screening_type"] for row in rows} == {"GHQ"}
+    mine = [row for row in rows if row["session_hash"] == session_hash]
+    assert mine and mine[-1]["responses"]["q1"] == 1
+    assert verify_token(auth_token) not in response.text
+    
+    response = client.get(
+        "/api/v1/screenings/export",
+        params={"format": "csv", "screening_type": "GHQ"},
+        headers=headers
+    )
+    rows = list(csv.DictReader(response.text.splitlines()))
+    assert list(rows[0]) == ["session_hash", "screening_type", "score", "risk_level", "completed_at"]
+    assert any(row["session_hash"] == session_hash for row in rows)
+    
+    future = (date.today() + timedelta(days=2)).isoformat()
+    response = client.get("/api/v1/screenings/export", params={"start_date": future}, headers=headers)
+    assert response.text == ""
+
+def test_export_cli_matches_endpoint(tmp_path, monkeypatch):
+    """Test that the CLI writes the same rows as the endpoint"""
+    monkeypatch.setattr(settings, "EXPORT_API_KEY", "institution-key")
+    output = tmp_path / "screenings.ndjson"
+    
+    assert cli_main(["export-screenings", "--output", str(output), "--batch-size", "2"]) == 0
+    streamed = client.get("/api/v1/screenings/export", headers={"X-API-Key": "institution-key"})
+    assert output.read_text() == streamed.text
+
+def test_columnar_analytics_queries():
+    """Test quantiles, histograms, item distributions and weekly trends"""
+    from collections import namedtuple
+    from datetime import datetime
+    from app.services.screening_analytics import ScreeningAnalytics
+    
+    Row = namedtuple("Row", "id screening_type score risk_level completed_at responses")
+    monday = datetime(2024, 5, 6, 9, 30)
+    analytics = ScreeningAnalytics()
+    analytics.append_rows([
+        Row(1, "GAD7", 3, "minimal", monday, {"q1": 0, "q2": "Several days"}),
+        Row(2, "GAD7", 12, "moderate", monday + timedelta(days=6), {"q1": 3, "q2": 1}),
+        Row(3, "GAD7", 18, "severe", monday + timedelta(days=7), {"q1": 3}),
+        Row(4, "PHQ9", 22, "severe", monday, {}),
+        Row(5, "UNKNOWN", 1, "low", monday, {})
+    ])
+    assert analytics.watermark == 5
+    
+    quantiles = analytics.score_quantiles("GAD7", [0.5, 1.0])
+    assert quantiles["count"] == 3
+    assert quantiles["quantiles"] == {"0.5": 12.0, "1.0": 18.0}
+    
+    histogram = analytics.score_histogram("GAD7")
+    assert len(histogram["bins"]) == 22
+    assert histogram["bins"][12]["count"] == 1
+    
+    items = analytics.item_distributions("GAD7")["items"]
+    assert items[0]["counts"] == [1, 0, 0, 2]
+    assert items[1]["counts"] == [0, 2, 0, 0]
+    assert items[2]["answered"] == 0
+    
+    periods = analytics.risk_trends("GAD7", "week")["periods"]
+    assert [p["period_start"] for p in periods] == ["2024-05-06", "2024-05-13"]
+    assert [p["total"] for p in periods] == [2, 1]
+    assert periods[1]["high_risk_rate"] == 1.0
+    
+    assert analytics.score_quantiles("GAD7", [0.5], start_date=date(2024, 5, 13))["count"] == 1
+
+@pytest.mark.asyncio
+async def test_analytics_warm_up_loads_in_background(session_factory):
+    """Test that start() loads existing screenings without a request"""
+    from datetime import datetime
+    from app.db.models.screening import Screening
+    from app.services.screening_analytics import ScreeningAnalytics
+    
+    async with session_factory() as db:
+        db.add_all([
+            Screening(session_id="s", screening_type="PHQ9", score=i, risk_level="mild", completed_at=datetime(2024, 5, 6), responses={})
+            for i in range(25)
+        ])
+        await db.commit()
+    
+    analytics = ScreeningAnalytics(refresh_interval=60, batch_size=10, session_factory=session_factory)
+    await analytics.start()
+    await analytics._warmup
+    assert analytics.stats()["rows"] == 25
+    # A request right after the warm-up doesn't reload
+    async with session_factory() as db:
+        assert await analytics.refresh(db) == 0
+    await analytics.stop()
+
+def test_insights_endpoints_refresh_incrementally(auth_token, monkeypatch):
+    """Test that /insights/* endpoints pick up new screenings by id watermark"""
+    from app.services.screening_analytics import screening_analytics
+    monkeypatch.setattr(screening_analytics, "refresh_interval", 0)
+    
+    before = client.get("/api/v1/screenings/insights/quantiles?screening_type=PHQ9").json()["count"]
+    client.post(
+        "/api/v1/screenings/submit",
+        json={"screening_type": "PHQ9", "responses": {f"q{i}": 2 for i in range(1, 10)}},
+        headers={"Authorization": f"Bearer {auth_token}"}
+    )
+    
+    data = client.get("/api/v1/screenings/insights/quantiles?screening_type=PHQ9&q=0.5").json()
+    assert data["count"] == before + 1
+    histogram = client.get("/api/v1/screenings/insights/histogram?screening_type=PHQ9").json()
+    assert histogram["bins"][18]["count"] >= 1
+    items = client.get("/api/v1/screenings/insights/items?screening_type=PHQ9").json()
+    assert len(items["items"]) == 9
+    trends = client.get("/api/v1/screenings/insights/trends?screening_type=PHQ9&bucket=day").json()
+    assert trends["periods"][-1]["total"] >= 1
+    assert client.get("/api/v1/screenings/insights/trends?screening_type=XYZ").status_code == 422
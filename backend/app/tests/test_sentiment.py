@@ -0,0 +1,79 @@
+"""
+Test sentiment scoring, inline labelling and the backfill job
+"""
+import random
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+from app.db.base import Base, SessionLocal
+from app.db.models.chat import ChatMessage
+from app.core.security import verify_token_cached
+from app.main import app
+from app.services.sentiment import LEXICON, NEGATORS, SentimentBackfill, sentiment_scorer
+
+client = TestClient(app)
+
+def test_labels_and_negation():
+    """Test the labels for plain, negated and empty messages"""
+    assert sentiment_scorer.label("I feel happy and calm today") == "positive"
+    assert sentiment_scorer.label("Everything is awful, I'm so sad") == "negative"
+    assert sentiment_scorer.label("I went to class") == "neutral"
+    assert sentiment_scorer.label("") == "neutral"
+    assert sentiment_scorer.label("I'm not happy at all") == "negative"
+    assert sentiment_scorer.label("I don't feel hopeless anymore") == "positive"
+    # Negation only reaches a few tokens ahead
+    assert sentiment_scorer.label("Not sure why but today I am happy") == "positive"
+
+def test_batch_matches_single_scores():
+    """Test that the vectorized path scores exactly like the per-message one"""
+    rng = random.Random(7)
+    vocabulary = list(LEXICON) + list(NEGATORS) + ["i", "today", "the", "exam", "really"]
+    texts = ["", "Not. Happy", "no no no good"] + [
+        " ".join(rng.choice(vocabulary) for _ in range(rng.randint(0, 20))) for _ in range(500)
+    ]
+    batch = sentiment_scorer.score_batch(texts)
+    assert batch.tolist() == pytest.approx([sentiment_scorer.score(text) for text in texts])
+    assert sentiment_scorer.label_batch(texts) == [sentiment_scorer.label(text) for text in texts]
+    assert sentiment_scorer.label_batch([]) == []
+
+def test_chat_stores_sentiment():
+    """Test that /chat/ai labels the stored message"""
+    token = client.post("/api/v1/auth/anonymous").json()["access_token"]
+    response = client.post(
+        "/api/v1/chat/ai",
+        json={"message": "I feel so lonely and tired"},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 200
+    with SessionLocal() as db:
+        stored = db.scalars(
+            select(ChatMessage.sentiment).where(ChatMessage.session_id == verify_token_cached(token))
+        ).all()
+    assert stored == ["negative"]
+
+def test_backfill_is_resumable(tmp_path):
+    """Test that the backfill scores only unscored rows, in id ranges, and can be resumed"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'backfill.db'}")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(engine)
+    messages = ["I am happy", "I am sad", "Hello there", None] * 25
+    with Session() as db:
+        db.add_all(ChatMessage(session_id="s", message=message) for message in messages)
+        # Already scored rows are left alone
+        db.add(ChatMessage(session_id="s", message="I am happy", sentiment="negative"))
+        db.commit()
+    
+    progress = []
+    with Session() as db:
+        first = SentimentBackfill(chunk_size=30).run(db, end_id=60, progress=progress.append)
+    assert (first.last_id, first.updated) == (60, 60)
+    assert [p.last_id for p in progress] == [30, 60]
+    
+    with Session() as db:
+        rest = SentimentBackfill(chunk_size=30).run(db, start_id=first.last_id)
+        assert (rest.last_id, rest.updated) == (101, 40)
+        assert SentimentBackfill(chunk_size=30).run(db).updated == 0
+        labels = db.scalars(select(ChatMessage.sentiment).order_by(ChatMessage.id)).all()
+    assert labels == ["positive", "negative", "neutral", "neutral"] * 25 + ["negative"]
+    engine.dispose()
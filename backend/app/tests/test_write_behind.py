@@ -0,0 +1,129 @@
+"""
+Test the group-commit write-behind queue for chat persistence
+"""
+import asyncio
+import uuid
+import pytest
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from app.main import app  # noqa: F401 - creates tables
+from app.db.base import AsyncSessionLocal
+from app.db.models.chat import ChatMessage
+from app.db.write_behind import WriteBehindQueue
+
+async def count_messages(session_id):
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(ChatMessage).filter(ChatMessage.session_id == session_id))
+        return len(result.scalars().all())
+
+@pytest.mark.asyncio
+async def test_rows_are_flushed_in_one_batch():
+    """Test that queued rows share a single commit and are flushed on stop"""
+    session_id = f"anon:{uuid.uuid4()}"
+    queue = WriteBehindQueue(batch_size=50, flush_interval=10)
+    await queue.start()
+
+    for i in range(5):
+        await queue.enqueue(ChatMessage(session_id=session_id, message=f"m{i}", response="r"))
+    assert await count_messages(session_id) == 0
+
+    await queue.stop()
+    assert await count_messages(session_id) == 5
+
+    stats = queue.stats()
+    assert stats["batches_flushed"] == 1
+    assert stats["rows_flushed"] == 5
+    assert stats["queue_depth"] == 0
+
+@pytest.mark.asyncio
+async def test_durable_rows_are_committed_before_returning():
+    """Test that durable enqueues skip the flush interval and wait for commit"""
+    session_id = f"anon:{uuid.uuid4()}"
+    queue = WriteBehindQueue(batch_size=50, flush_interval=10)
+    await queue.start()
+
+    row = await queue.enqueue(
+        ChatMessage(session_id=session_id, message="help", response="r", risk_detected=True),
+        durable=True
+    )
+    assert row.id is not None
+    assert await count_messages(session_id) == 1
+
+    await queue.stop()
+
+@pytest.mark.asyncio
+async def test_enqueue_requires_running_queue():
+    """Test that enqueueing without a flush task is rejected"""
+    queue = WriteBehindQueue()
+    with pytest.raises(RuntimeError):
+        await queue.enqueue(ChatMessage(session_id="anon:x", message="m"))
+
+class FlakySessions:
+    """Session factory whose first ``failures`` commits raise"""
+    def __init__(self, failures):
+        self.failures = failures
+
+    def __call__(self):
+        session = AsyncSessionLocal()
+        if self.failures:
+            self.failures -= 1
+
+            async def commit():
+                raise ConnectionError("database went away")
+
+            session.commit = commit
+        return session
+
+@pytest.mark.asyncio
+async def test_failed_flush_is_retried():
+    """Test that a batch whose commit fails is written on a later attempt"""
+    session_id = f"anon:{uuid.uuid4()}"
+    queue = WriteBehindQueue(FlakySessions(2), batch_size=50, flush_interval=10, retry_delay=0.01)
+    await queue.start()
+
+    for i in range(3):
+        await queue.enqueue(ChatMessage(session_id=session_id, message=f"m{i}", response="r"))
+    await queue.enqueue(ChatMessage(session_id=session_id, message="durable", response="r"), durable=True)
+    assert await count_messages(session_id) == 4
+    await queue.stop()
+
+    stats = queue.stats()
+    assert (stats["retries"], stats["rows_flushed"], stats["rows_failed"]) == (2, 4, 0)
+
+@pytest.mark.asyncio
+async def test_bad_row_does_not_drop_its_batch():
+    """Test that only a row that can't be written on its own is dropped"""
+    session_id = f"anon:{uuid.uuid4()}"
+    queue = WriteBehindQueue(batch_size=50, flush_interval=10, max_attempts=2, retry_delay=0.01)
+    await queue.start()
+
+    existing = await queue.enqueue(ChatMessage(session_id=session_id, message="first", response="r"), durable=True)
+    await queue.enqueue(ChatMessage(session_id=session_id, message="good", response="r"))
+    with pytest.raises(IntegrityError):
+        # Same primary key as a stored row
+        await queue.enqueue(ChatMessage(id=existing.id, session_id=session_id, message="bad"), durable=True)
+    await queue.stop()
+
+    assert await count_messages(session_id) == 2
+    assert queue.stats()["rows_failed"] == 1
+
+@pytest.mark.asyncio
+async def test_rows_enqueued_while_stopping_are_written():
+    """Test that enqueues racing stop() are written instead of stranded"""
+    session_id = f"anon:{uuid.uuid4()}"
+    queue = WriteBehindQueue(batch_size=50, flush_interval=10)
+    await queue.start()
+    await queue.enqueue(ChatMessage(session_id=session_id, message="before", response="r"))
+
+    stopping = asyncio.create_task(queue.stop())
+    await asyncio.sleep(0)
+    assert queue.running
+    row = await asyncio.wait_for(
+        queue.enqueue(ChatMessage(session_id=session_id, message="during", response="r"), durable=True),
+        5
+    )
+    assert row.id is not None
+    await stopping
+
+    assert await count_messages(session_id) == 2
+    assert queue.stats()["rows_written_directly"] == 1
@@ -0,0 +1,83 @@
+"""
+Micro-benchmark: per-message keyword scanning cost
+
+Compares the previous approach (lowercase + one ``any(keyword in text)`` scan
+per keyword list, repeated by each service) against a single pass of the
+compiled crisis matcher, on short and long messages and with the shipped
+keyword lists versus a large synthetic keyword set.
+
+Run from the backend directory:
+    python -m benchmarks.bench_crisis_matcher
+"""
+import random
+import string
+import time
+
+from app.services.crisis_matcher import CHATBOT_KEYWORDS, ESCALATION_TRIGGERS, CrisisMatcher
+
+SHORT_MESSAGE = "I've been feeling anxious and a bit hopeless about exams lately"
+FILLER = "today I went to class and talked to my friends about the weekend plans "
+
+
+def legacy_scan(text, keyword_lists):
+    """Per-list substring scans, as ChatbotService + RiskEscalationService did"""
+    hits = set()
+    # Chatbot: detect_risk_level + categorize_message each lowercase and scan
+    for _ in range(2):
+        lowered = text.lower()
+        for category, keywords in keyword_lists.items():
+            if any(keyword in lowered for keyword in keywords):
+                hits.add(category)
+    # Escalation service scans again
+    lowered = text.lower()
+    for category, keywords in keyword_lists.items():
+        if any(keyword in lowered for keyword in keywords):
+            hits.add(category)
+    return hits
+
+
+def synthetic_keywords(count, seed=7):
+    rng = random.Random(seed)
+    lists = {}
+    for index in range(count):
+        word = "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(5, 12)))
+        lists.setdefault(f"synthetic_{index % 20}", []).append(word)
+    return lists
+
+
+def time_per_call(fn, text, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(text)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def run_case(label, keyword_lists, text, iterations):
+    matcher = CrisisMatcher(keyword_lists)
+    legacy_us = time_per_call(lambda t: legacy_scan(t, keyword_lists), text, iterations)
+    matcher_us = time_per_call(matcher.scan, text, iterations)
+    print(
+        f"{label:<42} {len(text):>8} chars  "
+        f"legacy {legacy_us:>10.1f} us  matcher {matcher_us:>10.1f} us  "
+        f"x{legacy_us / matcher_us:>6.2f}"
+    )
+
+
+def main():
+    shipped = {**CHATBOT_KEYWORDS, **ESCALATION_TRIGGERS}
+    large = {**shipped, **synthetic_keywords(5000)}
+    long_message = FILLER * 60 + SHORT_MESSAGE
+    very_long_message = FILLER * 600 + SHORT_MESSAGE
+
+    print(f"shipped keywords: {sum(len(v) for v in shipped.values())}, "
+          f"large set: {sum(len(v) for v in large.values())}")
+    run_case("shipped keywords / short message", shipped, SHORT_MESSAGE, 20000)
+    run_case("shipped keywords / long message", shipped, long_message, 500)
+    run_case("shipped keywords / very long message", shipped, very_long_message, 50)
+    run_case("large keyword set / short message", large, SHORT_MESSAGE, 200)
+    run_case("large keyword set / long message", large, long_message, 20)
+    run_case("large keyword set / very long message", large, very_long_message, 5)
+
+
+if __name__ == "__main__":
+    main()
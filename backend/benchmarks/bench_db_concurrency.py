@@ -0,0 +1,164 @@
+"""
+Concurrency benchmark: sync Session vs AsyncSession inside async routes
+
+Serves two versions of the chat history query from one uvicorn process:
+``/sync/history`` uses the blocking ``SessionLocal`` (how every router worked
+before) and ``/async/history`` uses ``AsyncSessionLocal``. Each endpoint is
+hit by N concurrent clients and requests/sec plus latency percentiles are
+reported. Both endpoints also sleep briefly to stand in for other awaits
+(auth, upstream calls) that a blocked event loop cannot overlap.
+
+Run from the backend directory:
+    python -m benchmarks.bench_db_concurrency --clients 100 200
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DB = os.path.join(tempfile.gettempdir(), "sahara_bench_concurrency.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{BENCH_DB}")
+
+from fastapi import Depends, FastAPI  # noqa: E402
+from sqlalchemy import select  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from app.db.base import Base, SessionLocal, engine, get_async_db, get_db  # noqa: E402
+from app.db.models.chat import ChatMessage  # noqa: E402
+
+app = FastAPI()
+SESSION_ID = "anon:bench"
+
+
+def serialize(messages):
+    return [{"message": m.message, "created_at": m.created_at} for m in messages]
+
+
+@app.get("/sync/history")
+async def sync_history(db: Session = Depends(get_db)):
+    await asyncio.sleep(0.005)
+    messages = db.query(ChatMessage).filter(
+        ChatMessage.session_id == SESSION_ID
+    ).order_by(ChatMessage.created_at.desc()).limit(50).all()
+    return serialize(messages)
+
+
+@app.get("/async/history")
+async def async_history(db: AsyncSession = Depends(get_async_db)):
+    await asyncio.sleep(0.005)
+    result = await db.execute(
+        select(ChatMessage).filter(
+            ChatMessage.session_id == SESSION_ID
+        ).order_by(ChatMessage.created_at.desc()).limit(50)
+    )
+    return serialize(result.scalars().all())
+
+
+def seed(rows=20000):
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        if db.query(ChatMessage).count() >= rows:
+            return
+        db.bulk_save_objects([
+            ChatMessage(
+                session_id=SESSION_ID if i % 10 == 0 else f"anon:{i % 500}",
+                message=f"message {i}",
+                response="response"
+            )
+            for i in range(rows)
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def drive(url, clients, requests_per_client):
+    import httpx
+
+    latencies = []
+    errors = 0
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        async def worker():
+            nonlocal errors
+            for _ in range(requests_per_client):
+                start = time.perf_counter()
+                try:
+                    response = await client.get(url)
+                    response.raise_for_status()
+                except httpx.HTTPError:
+                    # e.g. connection pool timeouts while the loop is blocked
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - start)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(clients)))
+        elapsed = time.perf_counter() - started
+
+    completed = len(latencies)
+    latencies = sorted(latencies) or [0.0]
+    return {
+        "rps": completed / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[max(int(len(latencies) * 0.99) - 1, 0)] * 1000,
+        "errors": errors,
+    }
+
+
+def start_server():
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "benchmarks.bench_db_concurrency:app",
+         "--port", str(port), "--log-level", "critical"],
+        env=dict(os.environ)
+    )
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            break
+        except OSError:
+            time.sleep(0.1)
+    return server, port
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--clients", type=int, nargs="+", default=[100, 200])
+    parser.add_argument("--requests", type=int, default=5, help="requests per client")
+    args = parser.parse_args()
+
+    seed()
+    for clients in args.clients:
+        for variant in ("sync", "async"):
+            # Fresh server per run so a stalled loop cannot leak into the next
+            server, port = start_server()
+            try:
+                stats = asyncio.run(drive(
+                    f"http://127.0.0.1:{port}/{variant}/history", clients, args.requests
+                ))
+            finally:
+                server.terminate()
+                server.wait()
+            print(
+                f"{variant:>5} session  {clients:>4} clients  "
+                f"{stats['rps']:>8.1f} req/s  p50 {stats['p50_ms']:>7.1f} ms  "
+                f"p99 {stats['p99_ms']:>7.1f} ms  errors {stats['errors']}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Benchmark: micro-batched vs. one-at-a-time chatbot inference
+
+Uses a NumPy classifier with random weights (hashed n-gram embeddings ->
+``--hidden`` wide tanh layer -> categories) so the forward pass costs about
+what a small trained model would. For each number of concurrent clients,
+every client sends messages back to back through a ``MicroBatcher``:
+
+* one-at-a-time - ``max_batch=1``: each message is its own forward pass
+* batched       - ``max_batch``/``max_wait_ms`` as given
+
+and the benchmark reports throughput and per-message latency. The raw
+forward pass cost per message at batch sizes 1 and ``max_batch`` comes first.
+
+Run from the backend directory:
+    python -m benchmarks.bench_inference --clients 1 16 64 256
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+import numpy as np
+
+from app.services.inference import MicroBatcher, NumpyClassifierBackend
+
+WORDS = (
+    "i feel so anxious about my exams and cannot sleep at night lately my friends "
+    "say i seem sad but i just feel tired and empty most days work is stressful"
+).split()
+
+
+def random_model(dim, hidden, seed=3):
+    rng = np.random.default_rng(seed)
+    labels = ["general", "crisis", "anxiety", "depression"]
+    return NumpyClassifierBackend(
+        rng.standard_normal((dim, hidden), dtype=np.float32),
+        rng.standard_normal((hidden, hidden), dtype=np.float32) / np.sqrt(hidden),
+        np.zeros(hidden, np.float32),
+        rng.standard_normal((hidden, len(labels)), dtype=np.float32),
+        np.zeros(len(labels), np.float32),
+        labels
+    )
+
+
+def messages(count, seed=11):
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(WORDS, k=rng.randint(6, 30))) for _ in range(count)]
+
+
+def forward_cost(model, texts, batch_size):
+    started = time.perf_counter()
+    for i in range(0, len(texts), batch_size):
+        model.predict_batch(texts[i:i + batch_size])
+    return (time.perf_counter() - started) / len(texts) * 1e6
+
+
+async def run_clients(model, texts, clients, max_batch, max_wait_ms):
+    batcher = MicroBatcher(max_batch=max_batch, max_wait_ms=max_wait_ms, max_queue=100000, timeout=60)
+    await batcher.start(model)
+    latencies = []
+    per_client = len(texts) // clients
+
+    async def client(offset):
+        for text in texts[offset:offset + per_client]:
+            started = time.perf_counter()
+            await batcher.predict(text)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(i * per_client) for i in range(clients)))
+    elapsed = time.perf_counter() - started
+    stats = batcher.stats()
+    await batcher.stop()
+    latencies.sort()
+    return {
+        "throughput": len(latencies) / elapsed,
+        "p50": statistics.median(latencies),
+        "p99": latencies[int(len(latencies) * 0.99) - 1],
+        "batch": stats["avg_batch_size"]
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 16, 64, 256])
+    parser.add_argument("--messages", type=int, default=4096)
+    parser.add_argument("--dim", type=int, default=2 ** 16)
+    parser.add_argument("--hidden", type=int, default=512)
+    parser.add_argument("--max-batch", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=2.0)
+    args = parser.parse_args()
+
+    model = random_model(args.dim, args.hidden)
+    texts = messages(args.messages)
+    print(f"Model: {args.dim:,} features x {args.hidden} hidden")
+    print(f"Forward pass: {forward_cost(model, texts[:512], 1):.0f} us/message at batch 1, "
+          f"{forward_cost(model, texts[:512], args.max_batch):.0f} us/message at batch {args.max_batch}")
+
+    print(f"\n{'clients':>7} {'mode':<14} {'msg/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'batch':>6}")
+    for clients in args.clients:
+        for mode, max_batch, max_wait in (
+            ("one-at-a-time", 1, 0.0),
+            ("batched", args.max_batch, args.max_wait_ms)
+        ):
+            result = await run_clients(model, texts, clients, max_batch, max_wait)
+            print(f"{clients:>7} {mode:<14} {result['throughput']:>9.0f} {result['p50']:>8.2f} "
+                  f"{result['p99']:>8.2f} {result['batch']:>6.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
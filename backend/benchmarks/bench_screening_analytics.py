@@ -0,0 +1,197 @@
+"""
+Benchmark: columnar screening analytics at 1M and 10M screenings
+
+Fills the NumPy store with synthetic screenings and times each
+``/screenings/insights/*`` query, then compares against:
+
+* a row-by-row Python pass over the same data (what an ORM loop would do)
+* SQLite answering the same questions in SQL, items read out of the
+  ``responses`` JSON column (``--sql``; seeding takes a while)
+
+Also reports memory per row and the cost of the incremental refresh path
+(``append_rows``) per 100k screenings.
+
+Run from the backend directory:
+    python -m benchmarks.bench_screening_analytics --rows 1000000 10000000 --sql
+"""
+import argparse
+import json
+import sqlite3
+import time
+from collections import Counter, namedtuple
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from app.services.screening_analytics import (
+    ITEM_COUNTS, MAX_ITEMS, RISK_CODES, RISK_LEVELS, SCREENING_TYPES, ScreeningAnalytics
+)
+from app.services.screening_service import ScreeningService
+
+START = int((datetime(2023, 1, 1) - datetime(1970, 1, 1)).total_seconds())
+YEAR_SECONDS = 365 * 86400
+Row = namedtuple("Row", "id screening_type score risk_level completed_at responses")
+
+
+def synthetic_columns(rows, seed=5):
+    rng = np.random.default_rng(seed)
+    scoring = ScreeningService()
+    type_code = rng.integers(0, len(SCREENING_TYPES), rows, dtype=np.int8)
+    items = rng.integers(0, 4, (rows, MAX_ITEMS), dtype=np.int8)
+    for code, name in enumerate(SCREENING_TYPES):
+        items[type_code == code, ITEM_COUNTS[name]:] = -1
+    score = np.where(items >= 0, items, 0).sum(axis=1).astype(np.int16)
+    risk_code = np.empty(rows, dtype=np.int8)
+    for code, name in enumerate(SCREENING_TYPES):
+        for (low, high), level in scoring.scoring_rules[name]["risk_levels"].items():
+            risk_code[(type_code == code) & (score >= low) & (score <= high)] = RISK_CODES[level]
+    timestamp = START + rng.integers(0, YEAR_SECONDS, rows)
+    return type_code, score, risk_code, timestamp, items
+
+
+def timed(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def python_baseline(columns, limit):
+    """Row-at-a-time versions of the same queries over ``limit`` rows"""
+    type_code, score, risk_code, timestamp, items = (column[:limit] for column in columns)
+    records = list(zip(type_code.tolist(), score.tolist(), risk_code.tolist(), timestamp.tolist(), items.tolist()))
+
+    def quantiles():
+        scores = sorted(s for t, s, _, _, _ in records if t == 0)
+        return [scores[int(q * (len(scores) - 1))] for q in (0.25, 0.5, 0.75, 0.9)]
+
+    def histogram():
+        return Counter(s for t, s, _, _, _ in records if t == 0)
+
+    def item_distributions():
+        counts = [Counter() for _ in range(ITEM_COUNTS["PHQ9"])]
+        for t, _, _, _, answers in records:
+            if t == 0:
+                for i, counter in enumerate(counts):
+                    counter[answers[i]] += 1
+        return counts
+
+    def trends():
+        weeks = Counter()
+        for t, _, r, ts, _ in records:
+            if t == 0:
+                weeks[((ts // 86400 + 3) // 7, r)] += 1
+        return weeks
+
+    return {"quantiles": quantiles, "histogram": histogram, "items": item_distributions, "trends": trends}
+
+
+def sql_baseline(columns, limit):
+    type_code, score, risk_code, timestamp, items = (column[:limit] for column in columns)
+    connection = sqlite3.connect(":memory:")
+    connection.execute(
+        "CREATE TABLE screenings (id INTEGER PRIMARY KEY, screening_type TEXT, responses JSON, "
+        "score INTEGER, risk_level TEXT, completed_at DATETIME)"
+    )
+    epoch = datetime(1970, 1, 1)
+    connection.executemany(
+        "INSERT INTO screenings (screening_type, responses, score, risk_level, completed_at) VALUES (?, ?, ?, ?, ?)",
+        (
+            (
+                SCREENING_TYPES[t],
+                json.dumps({f"q{i + 1}": a for i, a in enumerate(answers) if a >= 0}),
+                s,
+                RISK_LEVELS[r],
+                (epoch + timedelta(seconds=ts)).isoformat(sep=" ")
+            )
+            for t, s, r, ts, answers in zip(
+                type_code.tolist(), score.tolist(), risk_code.tolist(), timestamp.tolist(), items.tolist()
+            )
+        )
+    )
+    connection.execute("CREATE INDEX ix_type ON screenings (screening_type)")
+    connection.commit()
+
+    def run(sql):
+        return lambda: connection.execute(sql).fetchall()
+
+    item_columns = ", ".join(
+        f"json_extract(responses, '$.q{i}') AS q{i}" for i in range(1, ITEM_COUNTS["PHQ9"] + 1)
+    )
+    return connection, {
+        # SQLite has no percentile function: sort, then read positions
+        "quantiles": run("SELECT score FROM screenings WHERE screening_type = 'PHQ9' ORDER BY score"),
+        "histogram": run("SELECT score, count(*) FROM screenings WHERE screening_type = 'PHQ9' GROUP BY score"),
+        "items": run(
+            f"SELECT q1, count(*) FROM (SELECT {item_columns} FROM screenings WHERE screening_type = 'PHQ9') GROUP BY q1"
+        ),
+        "trends": run(
+            "SELECT strftime('%Y-%W', completed_at) AS week, risk_level, count(*) FROM screenings "
+            "WHERE screening_type = 'PHQ9' GROUP BY week, risk_level"
+        )
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000000, 10000000])
+    parser.add_argument("--baseline-rows", type=int, default=1000000,
+                        help="Rows used for the Python and SQL baselines")
+    parser.add_argument("--sql", action="store_true", help="Also time SQLite (slow to seed)")
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        columns = synthetic_columns(rows)
+        analytics = ScreeningAnalytics()
+        analytics.columns.extend(*columns)
+
+        queries = {
+            "quantiles": lambda: analytics.score_quantiles("PHQ9", [0.25, 0.5, 0.75, 0.9]),
+            "histogram": lambda: analytics.score_histogram("PHQ9"),
+            "items": lambda: analytics.item_distributions("PHQ9"),
+            "trends": lambda: analytics.risk_trends("PHQ9", "week")
+        }
+        print(f"\n{rows:,} screenings, {analytics.columns.nbytes() / rows:.1f} bytes/row "
+              f"({analytics.columns.nbytes() / 2 ** 20:.0f} MiB incl. spare capacity)")
+        print(f"  {'query':<10} {'numpy ms':>10}")
+        for name, query in queries.items():
+            print(f"  {name:<10} {timed(query):>10.1f}")
+
+    baseline_rows = args.baseline_rows
+    columns = synthetic_columns(baseline_rows)
+    analytics = ScreeningAnalytics()
+    analytics.columns.extend(*columns)
+    numpy_queries = {
+        "quantiles": lambda: analytics.score_quantiles("PHQ9", [0.25, 0.5, 0.75, 0.9]),
+        "histogram": lambda: analytics.score_histogram("PHQ9"),
+        "items": lambda: analytics.item_distributions("PHQ9"),
+        "trends": lambda: analytics.risk_trends("PHQ9", "week")
+    }
+    python_queries = python_baseline(columns, baseline_rows)
+    sql_queries = {}
+    if args.sql:
+        started = time.perf_counter()
+        connection, sql_queries = sql_baseline(columns, baseline_rows)
+        print(f"\nSeeded SQLite with {baseline_rows:,} rows in {time.perf_counter() - started:.1f}s")
+
+    print(f"\nBaselines at {baseline_rows:,} screenings (ms)")
+    print(f"  {'query':<10} {'numpy':>9} {'python':>9} {'sqlite':>9}")
+    for name in numpy_queries:
+        sql_ms = f"{timed(sql_queries[name], 1):>9.1f}" if name in sql_queries else f"{'-':>9}"
+        print(f"  {name:<10} {timed(numpy_queries[name]):>9.1f} {timed(python_queries[name], 1):>9.1f} {sql_ms}")
+    if sql_queries:
+        connection.close()
+
+    # Incremental refresh cost: Python row conversion into the columns
+    sample = [
+        Row(i, "PHQ9", 10, "moderate", datetime(2024, 1, 1) + timedelta(seconds=i), {f"q{j}": j % 4 for j in range(1, 10)})
+        for i in range(1, 100001)
+    ]
+    elapsed = timed(lambda: ScreeningAnalytics().append_rows(sample), 1)
+    print(f"\nappend_rows: {elapsed:.0f} ms per 100k screenings")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Benchmark: sentiment scoring and the chat_messages backfill
+
+* scorer      - per-message ``score`` vs. vectorized ``score_batch`` over
+  the same synthetic messages
+* backfill    - seeds a scratch SQLite file with ``--rows`` unscored chat
+  messages and runs ``SentimentBackfill`` (id ranges, one UPDATE per label
+  and a commit per range) for each ``--chunk-size``
+* row-by-row  - for comparison, scoring and updating ``--baseline-rows``
+  rows one ORM object at a time, committed every ``--chunk-size`` rows
+
+Run from the backend directory:
+    python -m benchmarks.bench_sentiment --rows 1000000 --chunk-size 1000 5000 20000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import create_engine, insert, select, update
+from sqlalchemy.orm import sessionmaker
+
+from app.db.base import Base
+from app.db.models.chat import ChatMessage
+from app.services.sentiment import LEXICON, NEGATORS, SentimentBackfill, sentiment_scorer
+
+FILLER = "i my the today at school work and about with friends exam class really just feel been".split()
+
+
+def messages(count, seed=13):
+    rng = random.Random(seed)
+    words = FILLER * 4 + list(LEXICON) + list(NEGATORS)
+    return [" ".join(rng.choices(words, k=rng.randint(4, 40))) for _ in range(count)]
+
+
+def bench_scorer(texts, batch_size):
+    started = time.perf_counter()
+    for text in texts:
+        sentiment_scorer.score(text)
+    single = time.perf_counter() - started
+    started = time.perf_counter()
+    for i in range(0, len(texts), batch_size):
+        sentiment_scorer.score_batch(texts[i:i + batch_size])
+    batched = time.perf_counter() - started
+    print(f"Scoring {len(texts):,} messages: {len(texts) / single:,.0f} msg/s one at a time, "
+          f"{len(texts) / batched:,.0f} msg/s in batches of {batch_size}")
+
+
+def seed(session_factory, rows, texts):
+    with session_factory() as db:
+        db.execute(update(ChatMessage).values(sentiment=None))
+        if db.scalar(select(ChatMessage.id).order_by(ChatMessage.id.desc()).limit(1)) == rows:
+            db.commit()
+            return
+        for start in range(0, rows, 50000):
+            db.execute(insert(ChatMessage), [
+                {"session_id": f"s{i % 5000}", "message": texts[i % len(texts)], "response": "ok"}
+                for i in range(start, min(start + 50000, rows))
+            ])
+        db.commit()
+
+
+def row_by_row(session_factory, rows, chunk_size):
+    started = time.perf_counter()
+    with session_factory() as db:
+        for count, record in enumerate(db.scalars(select(ChatMessage).where(ChatMessage.id <= rows)), 1):
+            record.sentiment = sentiment_scorer.label(record.message)
+            if count % chunk_size == 0:
+                db.commit()
+        db.commit()
+    return rows / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--chunk-size", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--baseline-rows", type=int, default=50000)
+    args = parser.parse_args()
+
+    texts = messages(100000)
+    bench_scorer(texts, 5000)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        engine = create_engine(f"sqlite:///{os.path.join(scratch, 'bench.db')}")
+        Base.metadata.create_all(engine)
+        session_factory = sessionmaker(engine)
+
+        print(f"\nBackfill of {args.rows:,} rows:")
+        print(f"{'chunk':>7} {'seconds':>9} {'rows/s':>10}")
+        for chunk_size in args.chunk_size:
+            seed(session_factory, args.rows, texts)
+            with session_factory() as db:
+                result = SentimentBackfill(chunk_size=chunk_size).run(db)
+            print(f"{chunk_size:>7} {result.elapsed:>9.1f} {result.rows_per_second:>10,.0f}")
+
+        seed(session_factory, args.rows, texts)
+        rate = row_by_row(session_factory, args.baseline_rows, args.chunk_size[0])
+        print(f"\nRow-by-row ORM update of {args.baseline_rows:,} rows: {rate:,.0f} rows/s")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Benchmark: rendering large list responses
+
+For 1k and 10k chat history rows, times each stage of building the
+response body:
+
+* load     - ORM entities vs. plain column rows from SQLite
+* render   - FastAPI's default (``jsonable_encoder`` + ``JSONResponse``)
+             vs. ``FastJSONResponse`` on the same list of dicts
+
+Run from the backend directory:
+    python -m benchmarks.bench_serialization --rows 1000 10000
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from app.core.serialization import FastJSONResponse, orjson
+from app.db.base import Base
+from app.db.models.chat import ChatMessage
+
+
+def seed(session, rows):
+    started = datetime(2024, 1, 1)
+    session.add_all(
+        ChatMessage(
+            session_id="bench-session",
+            message=f"How do I cope with exam stress? message {i}",
+            response="Anxiety can feel overwhelming, but you're taking a positive step by reaching out.",
+            risk_detected=i % 50 == 0,
+            escalated=False,
+            created_at=started + timedelta(seconds=i)
+        )
+        for i in range(rows)
+    )
+    session.commit()
+
+
+def to_items(rows):
+    return [
+        {
+            "message": msg.message,
+            "response": msg.response,
+            "created_at": msg.created_at,
+            "risk_detected": msg.risk_detected
+        }
+        for msg in rows
+    ]
+
+
+def best_of(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    return min(times) * 1000
+
+
+def run(rows, repeat):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    with Session() as session:
+        seed(session, rows)
+
+    entity_query = select(ChatMessage).order_by(ChatMessage.created_at.desc())
+    column_query = select(
+        ChatMessage.id, ChatMessage.message, ChatMessage.response,
+        ChatMessage.created_at, ChatMessage.risk_detected
+    ).order_by(ChatMessage.created_at.desc())
+
+    def load_entities():
+        with Session() as session:
+            return to_items(session.execute(entity_query).scalars().all())
+
+    def load_columns():
+        with Session() as session:
+            return to_items(session.execute(column_query).all())
+
+    items = load_columns()
+    assert FastJSONResponse(items).body == JSONResponse(jsonable_encoder(items)).body
+
+    results = {
+        "load ORM entities": best_of(load_entities, repeat),
+        "load column rows": best_of(load_columns, repeat),
+        "render default": best_of(lambda: JSONResponse(jsonable_encoder(items)), repeat),
+        "render fast": best_of(lambda: FastJSONResponse(items), repeat)
+    }
+    engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"fast renderer: {'orjson' if orjson is not None else 'stdlib json'}")
+    for rows in args.rows:
+        results = run(rows, args.repeat)
+        print(f"\n{rows} rows (best of {args.repeat}, ms)")
+        for name, ms in results.items():
+            print(f"  {name:<18} {ms:8.2f}")
+        print(f"  render speedup     {results['render default'] / results['render fast']:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
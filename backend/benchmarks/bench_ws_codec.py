@@ -0,0 +1,105 @@
+"""
+Benchmark: WebSocket bytes on the wire and codec CPU per message
+
+Encodes a realistic stream of /ws/chat and peer room frames as JSON and as
+MessagePack and reports, per message:
+
+* payload bytes, raw and after permessage-deflate (simulated with zlib the
+  way the ``websockets`` server compresses: raw deflate, sync flush, with
+  and without context takeover)
+* encode and decode CPU time
+
+Run from the backend directory:
+    python -m benchmarks.bench_ws_codec --messages 20000
+"""
+import argparse
+import random
+import time
+import zlib
+
+from app.services.chatbot import ChatbotService
+from app.services.risk_escalation import RiskEscalationService
+from app.services.ws_codec import decode_message, json_codec, msgpack_codec
+
+# Trailer removed from every compressed message (RFC 7692)
+DEFLATE_TRAILER = b"\x00\x00\xff\xff"
+
+
+def sample_frames(count):
+    rng = random.Random(11)
+    chatbot = ChatbotService()
+    resources = RiskEscalationService().get_escalation_actions("high")["resources"]
+    replies = [text for texts in chatbot.responses.values() for text in texts]
+    frames = []
+    turn = 0
+    while len(frames) < count:
+        turn += 1
+        frames.append({
+            "type": "start", "turn": turn, "risk_detected": False, "risk_level": "minimal",
+            "escalated": False, "resources": resources if rng.random() < 0.1 else [],
+            "timestamp": "2024-05-01T10:15:00.000Z"
+        })
+        words = rng.choice(replies).split(" ")
+        for i in range(0, len(words), 3):
+            frames.append({"type": "chunk", "turn": turn, "content": " ".join(words[i:i + 3]) + " "})
+        frames.append({
+            "type": "peer_message", "id": 100000 + turn, "room_id": "general",
+            "message": rng.choice(replies)[:80], "created_at": "2024-05-01T10:15:02.123456",
+            "session_id": "4f9c2a1b..."
+        })
+    return frames[:count]
+
+
+def deflated_size(encoded, context_takeover):
+    total = 0
+    compressor = zlib.compressobj(wbits=-15)
+    for message in encoded:
+        if not context_takeover:
+            compressor = zlib.compressobj(wbits=-15)
+        data = message.encode() if isinstance(message, str) else message
+        compressed = compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        total += len(compressed) - len(DEFLATE_TRAILER)
+    return total
+
+
+def measure(codec, frames):
+    started = time.perf_counter()
+    encoded = [codec.encode(frame) for frame in frames]
+    encode_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for message in encoded:
+        decode_message(message)
+    decode_seconds = time.perf_counter() - started
+
+    count = len(frames)
+    raw = sum(len(message.encode() if isinstance(message, str) else message) for message in encoded)
+    return {
+        "raw": raw / count,
+        "deflate": deflated_size(encoded, True) / count,
+        "deflate_no_ctx": deflated_size(encoded, False) / count,
+        "encode_us": encode_seconds / count * 1e6,
+        "decode_us": decode_seconds / count * 1e6
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=20000)
+    args = parser.parse_args()
+
+    frames = sample_frames(args.messages)
+    codecs = [json_codec] + ([msgpack_codec] if msgpack_codec is not None else [])
+    if msgpack_codec is None:
+        print("msgpack is not installed; measuring JSON only")
+
+    print(f"{args.messages} frames, bytes and CPU per message")
+    print(f"{'codec':<8} {'raw B':>8} {'deflate B':>10} {'no-ctx B':>9} {'encode us':>10} {'decode us':>10}")
+    for codec in codecs:
+        result = measure(codec, frames)
+        print(f"{codec.name:<8} {result['raw']:>8.1f} {result['deflate']:>10.1f} "
+              f"{result['deflate_no_ctx']:>9.1f} {result['encode_us']:>10.2f} {result['decode_us']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
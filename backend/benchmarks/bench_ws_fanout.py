@@ -0,0 +1,112 @@
+"""
+Load test: WebSocket broadcast latency with thousands of simulated sockets
+
+Connects N fake sockets (a fraction of them slow, like clients on a weak
+mobile network) and broadcasts a stream of messages, recording the delay
+between each broadcast call and each socket receiving it. Compares the
+previous sequential ``for connection in ...: await send_text`` loop with the
+queued, concurrent ``ConnectionManager``.
+
+Run from the backend directory:
+    python -m benchmarks.bench_ws_fanout --sockets 5000 --slow 0.02
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from app.services.connection_manager import ConnectionManager
+
+
+class SimulatedSocket:
+    def __init__(self, latency, samples):
+        self.latency = latency
+        self.samples = samples
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.samples.append(time.perf_counter() - float(message))
+
+    async def close(self, code=1000):
+        pass
+
+
+class SequentialManager:
+    """The previous list-based manager, kept here as the baseline"""
+    def __init__(self):
+        self.active_connections = []
+
+    async def connect(self, websocket):
+        await websocket.accept()
+        self.active_connections.append(websocket)
+
+    async def broadcast(self, message):
+        for connection in self.active_connections:
+            await connection.send_text(message)
+
+
+def percentile(samples, fraction):
+    return samples[min(int(len(samples) * fraction), len(samples) - 1)] * 1000
+
+
+async def run(manager, sockets, slow_fraction, slow_latency, messages, interval):
+    rng = random.Random(3)
+    fast_samples, slow_samples = [], []
+    for _ in range(sockets):
+        if rng.random() < slow_fraction:
+            await manager.connect(SimulatedSocket(slow_latency, slow_samples))
+        else:
+            await manager.connect(SimulatedSocket(0, fast_samples))
+
+    call_times = []
+    for _ in range(messages):
+        started = time.perf_counter()
+        await manager.broadcast(repr(started))
+        call_times.append(time.perf_counter() - started)
+        await asyncio.sleep(interval)
+
+    # Let queued writers drain
+    deadline = time.perf_counter() + 30
+    expected = sockets * messages
+    while len(fast_samples) + len(slow_samples) < expected and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+    return sorted(fast_samples), sorted(slow_samples), sorted(call_times)
+
+
+def report(label, fast, slow, calls):
+    print(f"{label}")
+    print(f"  broadcast() call   p50 {percentile(calls, 0.5):9.2f} ms  p99 {percentile(calls, 0.99):9.2f} ms")
+    if fast:
+        print(f"  fast clients       p50 {percentile(fast, 0.5):9.2f} ms  p99 {percentile(fast, 0.99):9.2f} ms  "
+              f"max {fast[-1] * 1000:9.2f} ms  ({len(fast)} deliveries)")
+    if slow:
+        print(f"  slow clients       p50 {percentile(slow, 0.5):9.2f} ms  p99 {percentile(slow, 0.99):9.2f} ms  "
+              f"({len(slow)} deliveries)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--sockets", type=int, default=5000)
+    parser.add_argument("--slow", type=float, default=0.02, help="fraction of slow sockets")
+    parser.add_argument("--slow-latency", type=float, default=0.05, help="seconds per send")
+    parser.add_argument("--messages", type=int, default=5)
+    parser.add_argument("--interval", type=float, default=0.2)
+    args = parser.parse_args()
+
+    params = (args.sockets, args.slow, args.slow_latency, args.messages, args.interval)
+    print(f"{args.sockets} sockets, {args.slow:.0%} slow at {args.slow_latency * 1000:.0f} ms/send, "
+          f"{args.messages} broadcasts")
+
+    report("sequential list (previous)", *asyncio.run(run(SequentialManager(), *params)))
+
+    async def queued():
+        return await run(ConnectionManager(queue_size=100), *params)
+    report("queued concurrent fan-out", *asyncio.run(queued()))
+
+
+if __name__ == "__main__":
+    main()